@@ -1,33 +1,129 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for
-from database import engine, SessionLocal, init_db, Instrument, TradeState
-from logic import process_signal
+import startup  # First, so the time spent importing everything below is measured
+from flask import Flask, Response, g, request, jsonify, render_template, redirect, url_for, stream_with_context
+from database import SessionLocal, session_scope, pool_stats, Instrument, BrokerTarget, BrokerCall, SignalAlias, MarketHoliday
+from logic import process_signal, process_signals_batch, REVERSAL_MODES
+import dispatcher
+import http_client
+import cache
+import dedupe
+import dashboard as dashboard_data
+import event_log
+import metrics
+import telegram_bot
+import signals
+import migrations
+import inbox
+import market_hours
+import live
+import csv
+import io
+import json
 import os
+import logging
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_SIGNALS = int(os.getenv("BATCH_MAX_SIGNALS", "500"))
+# Migrations normally run once per deploy (Procfile release / railway preDeployCommand:
+# python migrations.py). Set this to have every worker apply them on startup instead.
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "false").lower() == "true"
+startup.mark("imports")
+
+def replay_signal(payload):
+    """Inbox replay: process one journaled alert in its own session."""
+    with session_scope() as db:
+        process_signal(payload, db)
 
 app = Flask(__name__)
-init_db()
+if DB_AUTO_MIGRATE:
+    migrations.upgrade()
+else:
+    try:
+        if migrations.current_version() < migrations.latest_version():
+            logger.warning(f"Database schema is behind (version {migrations.current_version()} of {migrations.latest_version()}); run python migrations.py")
+    except inbox.UNAVAILABLE_ERRORS as e:
+        logger.error(f"Database unavailable at startup ({e}); alerts will be queued in the inbox")
+startup.mark("schema")
+dispatcher.start()
+cache.start()
+dedupe.start()
+event_log.start()
+inbox.start(replay_signal)
+market_hours.start(process_signals_batch)
+live.start()
+startup.mark("background_threads")
+cache.warm()
+startup.mark("cache_warm")
+metrics.register_collector(lambda: (
+    metrics.from_stats("dispatch", dispatcher.stats())
+    + metrics.from_stats("http", http_client.stats(), label="host")
+    + metrics.from_stats("cache", cache.stats())
+    + metrics.from_stats("dedupe", dedupe.stats())
+    + metrics.from_stats("event_log", event_log.stats())
+    + metrics.from_stats("telegram", telegram_bot.stats())
+    + metrics.from_stats("db_pool", pool_stats())
+    + metrics.from_stats("startup", startup.stats())
+    + metrics.from_stats("inbox", inbox.stats())
+    + metrics.from_stats("market", market_hours.stats())
+    + metrics.from_stats("live", live.stats())
+))
+startup.ready()
 
 def get_db_session():
-    return SessionLocal()
+    """The request's session, opened on first use and closed in close_db_session."""
+    if "db" not in g:
+        g.db = SessionLocal()
+    return g.db
+
+@app.teardown_appcontext
+def close_db_session(exception):
+    db = g.pop("db", None)
+    if db is not None:
+        if exception is not None:
+            db.rollback()
+        db.close()
 
 @app.route('/')
 def dashboard():
-    db = get_db_session()
-    instruments = db.query(Instrument).all()
-    # Get status for each
-    data = []
-    for inst in instruments:
-        state = db.query(TradeState).filter(TradeState.symbol == inst.symbol).first()
-        status = state.current_status if state else "NONE"
-        last_update = state.last_action_time if state else "N/A"
-        data.append({
-            "id": inst.id,
-            "symbol": inst.symbol,
-            "timeframe": inst.timeframe,
-            "status": status,
-            "last_update": last_update
-        })
-    db.close()
-    return render_template('index.html', instruments=data)
+    args = dashboard_data.parse_args(request.args)
+    key = tuple(sorted(args.items(), key=lambda item: item[0]))
+
+    def render():
+        data = dashboard_data.load(get_db_session(), **args)
+        return render_template('index.html', **data)
+
+    return dashboard_data.cached_page(key, render)
+
+# Streaming responses should not be buffered by a reverse proxy (nginx)
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+@app.route('/stream')
+def stream():
+    """
+    Server-Sent Events for the dashboard: a "state" event with the symbol, status,
+    last_update, last_candle_timestamp and last_signal_price of every trade state
+    change as it is committed, and a comment line every LIVE_HEARTBEAT seconds.
+    """
+    subscriber = live.subscribe()
+    if subscriber is None:
+        return jsonify({"status": "error", "message": "Too many live clients"}), 503
+
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                yield subscriber.next_chunk()
+        finally:
+            live.unsubscribe(subscriber)  # The client went away; noticed at the next write
+
+    return Response(generate(), mimetype="text/event-stream", headers=STREAM_HEADERS)
+
+@app.route('/api/instruments')
+def instruments_json():
+    """Same data as the dashboard (same paging and filters) for monitoring scripts."""
+    args = dashboard_data.parse_args(request.args)
+    return jsonify(dashboard_data.load(get_db_session(), **args))
 
 @app.route('/add_instrument', methods=['POST'])
 def add_instrument():
@@ -40,8 +136,8 @@ def add_instrument():
         if not exists:
             new_inst = Instrument(symbol=symbol, timeframe=timeframe)
             db.add(new_inst)
+            cache.invalidate(symbol, db)  # May be cached as "not tracked"
             db.commit()
-        db.close()
     return redirect(url_for('dashboard'))
 
 @app.route('/delete_instrument/<int:id>')
@@ -50,8 +146,8 @@ def delete_instrument(id):
     inst = db.query(Instrument).filter(Instrument.id == id).first()
     if inst:
         db.delete(inst)
+        cache.invalidate(inst.symbol, db)
         db.commit()
-    db.close()
     return redirect(url_for('dashboard'))
 
 @app.route('/edit_instrument/<int:id>', methods=['POST'])
@@ -62,46 +158,301 @@ def edit_instrument(id):
         inst.quantman_buy_url = request.form.get('quantman_buy_url')
         inst.quantman_sell_url = request.form.get('quantman_sell_url')
         inst.quantman_close_url = request.form.get('quantman_close_url')
+        if 'reversal_mode' in request.form:
+            inst.reversal_mode = request.form['reversal_mode'] if request.form['reversal_mode'] in REVERSAL_MODES else None
+        cache.invalidate(inst.symbol, db)
         db.commit()
-    db.close()
     return redirect(url_for('dashboard'))
 
+def target_json(target):
+    return {"id": target.id, "action": target.action, "name": target.name, "url": target.url,
+            "timeout": target.timeout, "active": target.active}
+
+@app.route('/api/instruments/<symbol>/targets', methods=['GET', 'POST'])
+def instrument_targets(symbol):
+    """
+    Extra order webhooks for an instrument. They fire alongside its Quantman URL.
+    POST {"action": "buy"|"sell"|"close", "url": ..., "name": ..., "timeout": seconds}
+    """
+    db = get_db_session()
+    inst = db.query(Instrument).filter(Instrument.symbol == symbol).first()
+    if not inst:
+        return jsonify({"status": "error", "message": f"Unknown instrument {symbol}"}), 404
+    if request.method == 'GET':
+        return jsonify([target_json(target) for target in inst.targets])
+
+    data = request.get_json(silent=True) or {}
+    if data.get("action") not in ("buy", "sell", "close") or not data.get("url"):
+        return jsonify({"status": "error", "message": "action (buy, sell or close) and url are required"}), 400
+    try:
+        timeout = float(data["timeout"]) if data.get("timeout") else None
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "message": "timeout must be a number of seconds"}), 400
+    target = BrokerTarget(action=data["action"], url=data["url"], name=data.get("name"), timeout=timeout)
+    inst.targets.append(target)
+    cache.invalidate(inst.symbol, db)
+    db.commit()
+    return jsonify(target_json(target)), 201
+
+@app.route('/api/targets/<int:id>', methods=['DELETE'])
+def delete_target(id):
+    db = get_db_session()
+    target = db.query(BrokerTarget).filter(BrokerTarget.id == id).first()
+    if not target:
+        return jsonify({"status": "error", "message": "Unknown target"}), 404
+    inst = db.query(Instrument).filter(Instrument.id == target.instrument_id).first()
+    db.delete(target)
+    if inst:
+        cache.invalidate(inst.symbol, db)
+    db.commit()
+    return jsonify({"status": "success"})
+
+def alias_json(alias):
+    return {"id": alias.id, "kind": alias.kind, "alias": alias.alias, "signal": alias.signal}
+
+@app.route('/api/instruments/<symbol>/aliases', methods=['GET', 'POST'])
+def instrument_aliases(symbol):
+    """
+    Instrument-specific spellings, on top of the built-in grammar in signals.py.
+    POST {"kind": "symbol", "alias": "NIFTY1!"}: alerts for that ticker trade this instrument.
+    POST {"kind": "signal", "alias": "GO_LONG", "signal": "ENTRY_LONG"}: that signal text, for this instrument only.
+    """
+    db = get_db_session()
+    inst = db.query(Instrument).filter(Instrument.symbol == symbol).first()
+    if not inst:
+        return jsonify({"status": "error", "message": f"Unknown instrument {symbol}"}), 404
+    if request.method == 'GET':
+        return jsonify([alias_json(alias) for alias in inst.aliases])
+
+    data = request.get_json(silent=True) or {}
+    kind = data.get("kind") or ("signal" if data.get("signal") else "symbol")
+    if kind not in ("symbol", "signal") or not isinstance(data.get("alias"), str) or not data["alias"].strip():
+        return jsonify({"status": "error", "message": "kind (symbol or signal) and alias are required"}), 400
+    if kind == "symbol":
+        alias = SignalAlias(kind=kind, alias=signals.canonical_symbol(data["alias"]))
+    else:
+        signal = signals.parse_canonical(data.get("signal"))
+        if signal is None:
+            names = ", ".join(s.value for s in signals.Signal)
+            return jsonify({"status": "error", "message": f"signal must be one of {names}"}), 400
+        alias = SignalAlias(kind=kind, alias=signals.normalize(data["alias"]), signal=signal.value)
+    inst.aliases.append(alias)
+    cache.invalidate(inst.symbol, db)
+    if kind == "symbol":
+        cache.invalidate(alias.alias, db)  # May be cached as "not tracked"
+    db.commit()
+    return jsonify(alias_json(alias)), 201
+
+@app.route('/api/aliases/<int:id>', methods=['DELETE'])
+def delete_alias(id):
+    db = get_db_session()
+    alias = db.query(SignalAlias).filter(SignalAlias.id == id).first()
+    if not alias:
+        return jsonify({"status": "error", "message": "Unknown alias"}), 404
+    inst = db.query(Instrument).filter(Instrument.id == alias.instrument_id).first()
+    db.delete(alias)
+    if inst:
+        cache.invalidate(inst.symbol, db)
+    if alias.kind == "symbol":
+        cache.invalidate(alias.alias, db)
+    db.commit()
+    return jsonify({"status": "success"})
+
+@app.route('/api/instruments/<symbol>/market', methods=['GET', 'PUT'])
+def instrument_market(symbol):
+    """
+    Trading session of an instrument; outside it alerts are processed, deferred to the open or dropped.
+    PUT {"session": "09:15-15:30", "calendar": "NSE", "off_session": "defer"}; a null session trades any time.
+    """
+    db = get_db_session()
+    inst = db.query(Instrument).filter(Instrument.symbol == symbol).first()
+    if not inst:
+        return jsonify({"status": "error", "message": f"Unknown instrument {symbol}"}), 404
+    if request.method == 'PUT':
+        data = request.get_json(silent=True) or {}
+        session = data.get("session", inst.market_session) or None
+        try:
+            if session:
+                market_hours.parse_session(session)
+        except (AttributeError, ValueError):
+            return jsonify({"status": "error", "message": "session must look like 09:15-15:30 (comma separate several)"}), 400
+        off_session = data.get("off_session", inst.off_session) or None
+        if off_session is not None and off_session not in market_hours.OFF_SESSION_MODES:
+            return jsonify({"status": "error", "message": f"off_session must be one of {', '.join(market_hours.OFF_SESSION_MODES)}"}), 400
+        inst.market_session = session
+        inst.market_calendar = data.get("calendar", inst.market_calendar) or None
+        inst.off_session = off_session
+        cache.invalidate(inst.symbol, db)
+        db.commit()
+    return jsonify({"session": inst.market_session, "calendar": inst.market_calendar or market_hours.MARKET_CALENDAR,
+                    "off_session": inst.off_session or market_hours.MARKET_OFF_SESSION})
+
+def holiday_json(holiday):
+    return {"id": holiday.id, "calendar": holiday.calendar, "day": holiday.day.isoformat(), "name": holiday.name}
+
+@app.route('/api/holidays', methods=['GET', 'POST'])
+def holidays():
+    """Days a calendar's sessions do not open. POST {"day": "2026-10-20", "calendar": "NSE", "name": "Diwali"}"""
+    db = get_db_session()
+    if request.method == 'GET':
+        rows = db.query(MarketHoliday).order_by(MarketHoliday.day).all()
+        return jsonify([holiday_json(holiday) for holiday in rows])
+
+    data = request.get_json(silent=True) or {}
+    try:
+        day = date.fromisoformat(data.get("day") or "")
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "message": "day (YYYY-MM-DD) is required"}), 400
+    holiday = MarketHoliday(calendar=data.get("calendar") or market_hours.MARKET_CALENDAR, day=day, name=data.get("name"))
+    db.add(holiday)
+    db.commit()
+    market_hours.reload()
+    return jsonify(holiday_json(holiday)), 201
+
+@app.route('/api/holidays/<int:id>', methods=['DELETE'])
+def delete_holiday(id):
+    db = get_db_session()
+    holiday = db.query(MarketHoliday).filter(MarketHoliday.id == id).first()
+    if not holiday:
+        return jsonify({"status": "error", "message": "Unknown holiday"}), 404
+    db.delete(holiday)
+    db.commit()
+    market_hours.reload()
+    return jsonify({"status": "success"})
+
+@app.route('/api/broker_calls')
+def broker_calls():
+    """Latest per-target order results, newest first. Filter with ?symbol=."""
+    try:
+        limit = min(max(int(request.args.get("limit", 100)), 1), 1000)
+    except ValueError:
+        return jsonify({"status": "error", "message": "limit must be an integer"}), 400
+    query = get_db_session().query(BrokerCall)
+    if request.args.get("symbol"):
+        query = query.filter(BrokerCall.symbol == request.args["symbol"])
+    calls = query.order_by(BrokerCall.id.desc()).limit(limit)
+    return jsonify([
+        {"id": c.id, "created_at": c.created_at.isoformat(), "symbol": c.symbol, "signal": c.signal,
+         "target_id": c.target_id, "target": c.target, "ok": c.ok, "status_code": c.status_code,
+         "latency_ms": c.latency_ms, "error": c.error}
+        for c in calls
+    ])
+
 @app.route('/webhook', methods=['POST'])
+@metrics.track_request("webhook")
 def webhook():
-    payload = request.json
+    with metrics.stage("decode"):
+        payload = request.json
     if not payload:
         return jsonify({"status": "error", "message": "No payload received"}), 400
-    
+    if isinstance(payload, dict) and request.headers.get("Idempotency-Key"):
+        payload.setdefault("client_id", request.headers["Idempotency-Key"])
+    result, status = run_signal(payload)
+    return jsonify(result), status
+
+QUEUED = {"status": "queued", "message": "Database unavailable - alert queued for replay"}
+
+def run_signal(payload):
+    """
+    process_signal behind the inbox: the alert is journaled first and answered 202
+    (and replayed later) if the database cannot be reached. Returns (result, status).
+    """
+    entry = inbox.append(payload)
+    if inbox.backlog() and inbox.defer(entry):
+        return QUEUED, 202  # Behind alerts still waiting for the database; keep their order
     db = get_db_session()
     try:
         result = process_signal(payload, db)
-        return jsonify(result)
+    except inbox.UNAVAILABLE_ERRORS as e:
+        db.rollback()
+        if inbox.defer(entry):
+            return QUEUED, 202
+        return {"status": "error", "message": str(e)}, 500
+    except Exception as e:
+        db.rollback()
+        inbox.done(entry)  # Replaying it would fail the same way
+        return {"status": "error", "message": str(e)}, 500
+    inbox.done(entry)
+    return result, 200
+
+@app.route('/webhook/batch', methods=['POST'])
+@metrics.track_request("webhook_batch")
+def webhook_batch():
+    """
+    Many alerts in one request, e.g. a whole watchlist at candle close.
+    Body: a JSON array of /webhook payloads, or {"signals": [...]}.
+    """
+    with metrics.stage("decode"):
+        payload = request.json
+    alerts = payload.get("signals") if isinstance(payload, dict) else payload
+    if not alerts or not isinstance(alerts, list):
+        return jsonify({"status": "error", "message": "Expected a list of signals"}), 400
+    if len(alerts) > BATCH_MAX_SIGNALS:
+        return jsonify({"status": "error", "message": f"At most {BATCH_MAX_SIGNALS} signals per batch"}), 413
+
+    # Journaled like single alerts (run_signal); a queued batch is replayed alert by alert, in order
+    entries = inbox.append_many(alerts)
+    if inbox.backlog() and inbox.defer(*entries):
+        return jsonify(QUEUED), 202
+    db = get_db_session()
+    try:
+        results = process_signals_batch(alerts, db)
+    except inbox.UNAVAILABLE_ERRORS as e:
+        db.rollback()
+        if inbox.defer(*entries):
+            return jsonify(QUEUED), 202
+        return jsonify({"status": "error", "message": str(e)}), 500
     except Exception as e:
+        db.rollback()
+        inbox.done(*entries)
         return jsonify({"status": "error", "message": str(e)}), 500
-    finally:
-        db.close()
+    inbox.done(*entries)
+    return jsonify({"status": "success", "results": results})
 
 @app.route('/webhook/<symbol>/<action>', methods=['POST', 'GET'])
+@metrics.track_request("webhook_simplified")
 def webhook_simplified(symbol, action):
     """
     Simplified endpoint for users who want to use direct URLs.
     Example: POST /webhook/NIFTY/long
     Query Params (Optional): ?price=19500&timestamp=2023...
     """
-    # Map action to signal
-    action = action.lower()
-    if action in ['long', 'buy', 'entry_long']:
-        signal = "ENTRY_LONG"
-    elif action in ['short', 'sell', 'entry_short']:
-        signal = "ENTRY_SHORT"
-    elif action in ['close', 'exit']:
-        signal = "EXIT_LONG" # Logic handles this as generic close usually
-    else:
-        return jsonify({"status": "error", "message": f"Invalid action: {action}"}), 400
+    error = invalid_action(symbol, action)
+    if error:
+        return jsonify(error), 400
+    payload = simplified_payload(symbol, action, request.args)
+    result, status = run_signal(payload)
+    # An alias removed between the check above and processing
+    return jsonify(result), 400 if status == 200 and result["status"] == "error" else status
+
+def invalid_action(symbol, action):
+    """
+    The 400 body for an action neither the grammar nor the instrument's signal aliases
+    know, or None. Checked before the alert is journaled; if the database cannot be
+    reached to look up the aliases the alert goes to the inbox and is resolved on replay.
+    """
+    if signals.resolve(action):
+        return None
+    try:
+        with session_scope() as db:
+            instrument = cache.get_instrument(db, signals.canonical_symbol(symbol.upper()))
+    except inbox.UNAVAILABLE_ERRORS:
+        return None
+    if instrument and signals.resolve(action, instrument.signal_aliases):
+        return None
+    return {"status": "error", "message": f"Invalid action: {action.lower()}"}
+
+def simplified_payload(symbol, action, args):
+    """
+    The /webhook payload for a /webhook/<symbol>/<action> call. An action outside the
+    grammar is passed on as is, for the instrument's own signal aliases to resolve.
+    """
+    signal = signals.resolve(action)
+    signal = signal.value if signal else signals.normalize(action)
 
     # Get optional params from Query String (for GET/POST)
-    price = request.args.get('price', '0')
-    timestamp = request.args.get('timestamp')
+    price = args.get('price', '0')
+    timestamp = args.get('timestamp')
     
     # If using TradingView placeholders {{timenow}}, they might come as literal strings if not replaced, 
     # but usually TV replaces them. If not provided, use server time? 
@@ -110,25 +461,123 @@ def webhook_simplified(symbol, action):
     if not timestamp:
          timestamp = datetime.utcnow().isoformat()
 
-    payload = {
+    return {
         "symbol": symbol.upper(),
         "signal": signal,
         "price": price,
         "timestamp": timestamp
     }
 
-    db = get_db_session()
+def event_filters():
+    return {
+        "symbol": request.args.get("symbol"),
+        "status": request.args.get("status"),
+        "since": request.args.get("since"),
+        "until": request.args.get("until"),
+    }
+
+@app.route('/events')
+def events():
+    """Signal event log, newest first. Page with ?before=<next_before from the previous page>."""
     try:
-        result = process_signal(payload, db)
-        return jsonify(result)
-    except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
-    finally:
-        db.close()
+        before = int(request.args["before"]) if request.args.get("before") else None
+        limit = min(max(int(request.args.get("limit", 100)), 1), 1000)
+    except ValueError:
+        return jsonify({"status": "error", "message": "before and limit must be integers"}), 400
+    return jsonify(event_log.page(get_db_session(), before=before, limit=limit, **event_filters()))
+
+@app.route('/events/export.<fmt>')
+def events_export(fmt):
+    """Stream the event log as CSV or JSON lines without loading it into memory."""
+    if fmt not in ("csv", "jsonl"):
+        return jsonify({"status": "error", "message": "Format must be csv or jsonl"}), 404
+    filters = event_filters()
+
+    def generate():
+        # stream_with_context keeps the request (and its session) open until the last row is sent
+        db = get_db_session()
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=event_log.EXPORT_COLUMNS)
+            writer.writeheader()
+            for event in event_log.stream(db, **filters):
+                writer.writerow(event)
+                if buffer.tell() > 64 * 1024:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+        else:
+            for event in event_log.stream(db, **filters):
+                yield json.dumps(event) + "\n"
+
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    headers = {"Content-Disposition": f"attachment; filename=signal_events.{fmt}"}
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers=headers)
 
 @app.route('/health')
 def health_check():
     return "OK", 200
 
+@app.route('/stats/dispatch')
+def dispatch_stats():
+    """Outbound queue depth and latency, to watch the backlog during market open."""
+    data = dispatcher.stats()
+    data["pending_in_db"] = dispatcher.pending_count(get_db_session())
+    return jsonify(data)
+
+@app.route('/stats/http')
+def http_stats():
+    """Per-host handshake and request timings of the shared outbound HTTP pool."""
+    return jsonify(http_client.stats())
+
+@app.route('/stats/cache')
+def cache_stats():
+    return jsonify(cache.stats())
+
+@app.route('/stats/dedupe')
+def dedupe_stats():
+    return jsonify(dedupe.stats())
+
+@app.route('/stats/telegram')
+def telegram_stats():
+    """Messages sent, 429s received and time spent waiting on the rate limits."""
+    return jsonify(telegram_bot.stats())
+
+@app.route('/stats/events')
+def event_log_stats():
+    return jsonify(event_log.stats())
+
+@app.route('/stats/db')
+def db_stats():
+    """Connection pool checkout wait times and saturation for this worker."""
+    return jsonify(pool_stats())
+
+@app.route('/stats/inbox')
+def inbox_stats():
+    """Alerts journaled, waiting for the database, replayed and dropped."""
+    return jsonify(inbox.stats())
+
+@app.route('/stats/market')
+def market_stats():
+    """Alerts deferred to the session open, dropped, released and expired."""
+    return jsonify(market_hours.stats())
+
+@app.route('/stats/live')
+def live_stats():
+    """Dashboards connected to /stream and the state changes pushed to them."""
+    return jsonify(live.stats())
+
+@app.route('/stats/startup')
+def startup_stats():
+    """Seconds from the worker starting to import the app to being ready and to its first webhook."""
+    return jsonify(startup.stats())
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text exposition: pipeline stage latencies, signal outcomes and the /stats counters."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 if __name__ == '__main__':
+    migrations.upgrade()
     app.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,105 @@
+"""
+Asyncio serving mode:
+
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT
+
+The webhook routes run as coroutines on one event loop with an AsyncSession, so a
+request waiting on the database no longer holds an OS thread and one process can
+keep thousands of alerts in flight. Outbound Telegram/Quantman calls were already
+off the request path (dispatcher.py) and keep running on the dispatch workers.
+/stream is served on the loop as well, so a connected dashboard costs a coroutine
+rather than a thread. Every other route (dashboard, instruments, events, stats,
+/metrics, /webhook/batch) is served by the Flask app, mounted as WSGI on a thread pool.
+"""
+import os
+import asyncio
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Mount, Route
+from starlette.concurrency import run_in_threadpool
+from a2wsgi import WSGIMiddleware
+from app import app as flask_app, simplified_payload, invalid_action, QUEUED, STREAM_HEADERS
+from database import async_session, DB_POOL_SIZE, DB_MAX_OVERFLOW
+from logic import process_signal_async
+import metrics
+import inbox
+import live
+
+# Signals processed at once. Beyond what the pool can serve, extra alerts wait here
+# on the loop (cheap) instead of timing out in the pool while holding a lock.
+ASGI_MAX_CONCURRENT_SIGNALS = int(os.getenv("ASGI_MAX_CONCURRENT_SIGNALS", str(DB_POOL_SIZE + DB_MAX_OVERFLOW)))
+
+_slots = None
+
+async def run_signal(payload, error_status=200):
+    """app.run_signal for the event loop: journaled in the inbox, 202 while the database is unreachable."""
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(ASGI_MAX_CONCURRENT_SIGNALS)
+    # Journal writes are file I/O (and may wait on the journal's lock): keep them off the loop
+    entry = await run_in_threadpool(inbox.append, payload)
+    if inbox.backlog() and await run_in_threadpool(inbox.defer, entry):
+        return JSONResponse(QUEUED, status_code=202)
+    async with _slots, async_session()() as db:
+        try:
+            result = await process_signal_async(payload, db)
+        except inbox.UNAVAILABLE_ERRORS as e:
+            await db.rollback()
+            if await run_in_threadpool(inbox.defer, entry):
+                return JSONResponse(QUEUED, status_code=202)
+            return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
+        except Exception as e:
+            await db.rollback()
+            await run_in_threadpool(inbox.done, entry)
+            return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
+    await run_in_threadpool(inbox.done, entry)
+    return JSONResponse(result, status_code=error_status if result["status"] == "error" else 200)
+
+@metrics.track_request("webhook")
+async def webhook(request):
+    with metrics.stage("decode"):
+        try:
+            payload = await request.json()
+        except ValueError:
+            payload = None
+    if not payload:
+        return JSONResponse({"status": "error", "message": "No payload received"}, status_code=400)
+    if isinstance(payload, dict) and request.headers.get("Idempotency-Key"):
+        payload.setdefault("client_id", request.headers["Idempotency-Key"])
+    return await run_signal(payload)
+
+@metrics.track_request("webhook_simplified")
+async def webhook_simplified(request):
+    symbol, action = request.path_params["symbol"], request.path_params["action"]
+    error = await run_in_threadpool(invalid_action, symbol, action)
+    if error:
+        return JSONResponse(error, status_code=400)
+    payload = simplified_payload(symbol, action, request.query_params)
+    return await run_signal(payload, error_status=400)
+
+async def stream(request):
+    """app.stream on the event loop."""
+    subscriber = live.subscribe(asyncio.get_running_loop())
+    if subscriber is None:
+        return JSONResponse({"status": "error", "message": "Too many live clients"}, status_code=503)
+
+    async def generate():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                yield await subscriber.next_chunk_async()
+        finally:
+            live.unsubscribe(subscriber)
+
+    return StreamingResponse(generate(), media_type="text/event-stream", headers=STREAM_HEADERS)
+
+async def health_check(request):
+    return PlainTextResponse("OK")
+
+app = Starlette(routes=[
+    Route("/webhook", webhook, methods=["POST"]),
+    Route("/webhook/{symbol}/{action}", webhook_simplified, methods=["POST", "GET"]),
+    Route("/stream", stream),
+    Route("/health", health_check),
+    Mount("/", WSGIMiddleware(flask_app)),
+])
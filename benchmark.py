@@ -0,0 +1,277 @@
+"""
+Webhook latency benchmark against local Telegram/Quantman stand-ins.
+
+Starts a stand-in HTTP server that answers Telegram sendMessage and Quantman
+order calls after a configurable delay, failing a configurable share of them.
+It then starts the app against each database and replays candle-close bursts:
+every symbol gets one alert per burst, and the symbols in a burst are sent
+concurrently. It reports throughput and latency percentiles for two things:
+- the webhook response;
+- the end-to-end order trigger, from sending the alert to the stand-in
+  receiving the Quantman call.
+
+    python benchmark.py                                            # SQLite, sync server
+    python benchmark.py --postgres-url postgresql://localhost/bench --server asgi
+    python benchmark.py --stub-delay-ms 150 --stub-failure-rate 0.05 --output bench.json
+    python benchmark.py --baseline bench.json                      # exit 1 if p95 regressed
+
+Prints one JSON object per database (a JSON list with --output).
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+import requests
+from collections import defaultdict, deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from load_test import SERVERS, free_port, wait_until_up, post, percentile
+
+class StandIn(ThreadingHTTPServer):
+    """Telegram + Quantman stand-in. Records when each call arrived."""
+    daemon_threads = True
+
+    def __init__(self, delay, failure_rate, chat_rate=0):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.delay = delay
+        self.failure_rate = failure_rate
+        self.chat_rate = chat_rate  # Telegram messages per second before answering 429; 0 = unlimited
+        self.lock = threading.Lock()
+        self.orders = defaultdict(list)  # symbol -> arrival times
+        self.recent_messages = deque()
+        self.messages = 0
+        self.rate_limited = 0
+        self.failed = 0
+
+class StandInHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        # Quantman: /quantman/<symbol>/<action>
+        parts = self.path.strip("/").split("/")
+        if len(parts) == 3 and parts[0] == "quantman":
+            with self.server.lock:
+                self.server.orders[parts[1]].append(time.perf_counter())
+        self._respond()
+
+    def do_POST(self):
+        # Telegram: /bot<token>/sendMessage
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        server = self.server
+        with server.lock:
+            now = time.monotonic()
+            while server.recent_messages and server.recent_messages[0] < now - 1:
+                server.recent_messages.popleft()
+            limited = server.chat_rate and len(server.recent_messages) >= server.chat_rate
+            if limited:
+                server.rate_limited += 1
+            else:
+                server.recent_messages.append(now)
+                server.messages += 1
+        if limited:
+            body = b'{"ok": false, "error_code": 429, "parameters": {"retry_after": 1}}'
+            self.send_response(429)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self._respond()
+
+    def _respond(self):
+        time.sleep(self.server.delay)
+        failed = random.random() < self.server.failure_rate
+        if failed:
+            with self.server.lock:
+                self.server.failed += 1
+        body = b'{"ok": false}' if failed else b'{"ok": true}'
+        self.send_response(500 if failed else 200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def seed(database_url, symbols, stub_url):
+    env = dict(os.environ, DATABASE_URL=database_url)
+    script = (
+        "from database import Base, engine, SessionLocal, Instrument\n"
+        "Base.metadata.drop_all(bind=engine)\n"
+        "Base.metadata.create_all(bind=engine)\n"
+        "db = SessionLocal()\n"
+        f"for i in range({symbols}):\n"
+        f"    url = '{stub_url}/quantman/BENCH' + str(i)\n"
+        "    db.add(Instrument(symbol=f'BENCH{i}', timeframe='1m', quantman_buy_url=url + '/buy',\n"
+        "                      quantman_sell_url=url + '/sell', quantman_close_url=url + '/close'))\n"
+        "db.commit()\n"
+    )
+    subprocess.check_call([sys.executable, "-c", script], env=env)
+
+async def replay(port, args):
+    """Send the bursts; returns webhook latencies, error count, elapsed time and per-symbol send times."""
+    sent = defaultdict(deque)  # symbol -> send times of alerts that should place an order
+    latencies, errors = [], 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(symbol, payload):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                status, seconds = await post(port, "/webhook", payload)
+            except OSError:
+                errors += 1
+                return
+            if status != 200:
+                errors += 1
+                return
+            latencies.append(seconds)
+            sent[symbol].append(start)
+
+    start = time.perf_counter()
+    for burst in range(args.bursts):
+        # Alternate entries and exits so every alert changes state and places an order
+        signal = "ENTRY_LONG" if burst % 2 == 0 else "EXIT_LONG"
+        candle = f"2024-01-01T09:{15 + burst // 60:02d}:{burst % 60:02d}Z"
+        symbols = [f"BENCH{i}" for i in range(args.symbols)]
+        random.shuffle(symbols)
+        await asyncio.gather(*(
+            one(symbol, {"symbol": symbol, "signal": signal, "price": "100", "timestamp": candle})
+            for symbol in symbols
+        ))
+        if args.burst_interval:
+            await asyncio.sleep(args.burst_interval)
+    return latencies, errors, time.perf_counter() - start, sent
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    return {
+        "count": len(latencies),
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "max_ms": percentile(latencies, 1.0),
+    }
+
+def run(database_url, args, stub):
+    stub_url = f"http://127.0.0.1:{stub.server_port}"
+    seed(database_url, args.symbols, stub_url)
+    with stub.lock:
+        stub.orders.clear()
+        stub.messages = stub.failed = stub.rate_limited = 0
+
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=database_url, DISPATCH_MODE="async", TELEGRAM_API_URL=stub_url,
+               TELEGRAM_BOT_TOKEN="bench", TELEGRAM_CHAT_ID="1", DISPATCH_BACKOFF_BASE="0.05")
+    server = subprocess.Popen(SERVERS[args.server](args, port), env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up(port)
+        latencies, errors, elapsed, sent = asyncio.run(replay(port, args))
+        # Orders and messages are delivered in the background; wait until every outbound job is done
+        expected = sum(len(times) for times in sent.values())
+        replay_start = time.perf_counter() - elapsed
+        deadline = time.monotonic() + args.drain_timeout
+        drained_s = None
+        while time.monotonic() < deadline:
+            if requests.get(f"http://127.0.0.1:{port}/stats/dispatch", timeout=5).json()["pending_in_db"] == 0:
+                drained_s = round(time.perf_counter() - replay_start, 3)
+                break
+            time.sleep(0.1)
+    finally:
+        server.terminate()
+        server.wait()
+
+    # Each symbol's orders arrive in the order its alerts were sent (the dispatcher keeps per-symbol order)
+    order_latencies = []
+    with stub.lock:
+        for symbol, send_times in sent.items():
+            for send_time, arrived in zip(send_times, stub.orders.get(symbol, [])):
+                order_latencies.append(arrived - send_time)
+        received, messages, failed = sum(len(t) for t in stub.orders.values()), stub.messages, stub.failed
+        rate_limited = stub.rate_limited
+    return {
+        "database": database_url.split(":", 1)[0].split("+")[0],
+        "server": args.server,
+        "symbols": args.symbols,
+        "bursts": args.bursts,
+        "concurrency": args.concurrency,
+        "stub_delay_ms": args.stub_delay_ms,
+        "stub_failure_rate": args.stub_failure_rate,
+        "elapsed_s": round(elapsed, 3),
+        "webhooks_per_s": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "webhook_errors": errors,
+        "webhook": summarize(latencies),
+        "order_trigger": dict(summarize(order_latencies), missing=max(expected - received, 0)),
+        "all_delivered_s": drained_s,
+        "telegram_calls": messages,
+        "telegram_429s": rate_limited,
+        "stub_failures": failed,
+    }
+
+def regressions(results, baseline_path, tolerance):
+    """Names of the p95 figures that got worse than the baseline by more than the tolerance."""
+    with open(baseline_path) as f:
+        baseline = {(r["database"], r["server"]): r for r in json.load(f)}
+    worse = []
+    for result in results:
+        base = baseline.get((result["database"], result["server"]))
+        if not base:
+            continue
+        for section in ("webhook", "order_trigger"):
+            old, new = base[section]["p95_ms"], result[section]["p95_ms"]
+            if old and new and new > old * (1 + tolerance):
+                worse.append(f"{result['database']}/{result['server']} {section} p95 {old}ms -> {new}ms")
+    return worse
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", choices=sorted(SERVERS), default="sync")
+    parser.add_argument("--sqlite-url", help="Defaults to a scratch SQLite file")
+    parser.add_argument("--postgres-url", default=os.getenv("BENCH_POSTGRES_URL"),
+                        help="Local Postgres to benchmark as well (or BENCH_POSTGRES_URL)")
+    parser.add_argument("--symbols", type=int, default=50)
+    parser.add_argument("--bursts", type=int, default=20, help="Candle-close bursts; each sends one alert per symbol")
+    parser.add_argument("--burst-interval", type=float, default=0.0, help="Seconds between bursts")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--stub-delay-ms", type=float, default=50)
+    parser.add_argument("--stub-failure-rate", type=float, default=0.0)
+    parser.add_argument("--telegram-chat-rate", type=float, default=0,
+                        help="Messages/second the Telegram stand-in accepts before answering 429 (0 = unlimited)")
+    parser.add_argument("--drain-timeout", type=float, default=60, help="Seconds to wait for background orders")
+    parser.add_argument("--gunicorn-workers", type=int, default=1)
+    parser.add_argument("--gunicorn-threads", type=int, default=8)
+    parser.add_argument("--output", help="Write the results to this file as a JSON list")
+    parser.add_argument("--baseline", help="Earlier --output file; exit 1 if a p95 regressed")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 slowdown against the baseline")
+    args = parser.parse_args()
+
+    databases = [args.sqlite_url or "sqlite:///" + os.path.join(tempfile.gettempdir(), "benchmark.db")]
+    if args.postgres_url:
+        databases.append(args.postgres_url)
+
+    stub = StandIn(args.stub_delay_ms / 1000, args.stub_failure_rate, args.telegram_chat_rate)
+    threading.Thread(target=stub.serve_forever, name="stand-in", daemon=True).start()
+    results = []
+    for database_url in databases:
+        result = run(database_url, args, stub)
+        results.append(result)
+        print(json.dumps(result), flush=True)
+    stub.shutdown()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        worse = regressions(results, args.baseline, args.tolerance)
+        for line in worse:
+            print(f"REGRESSION: {line}", file=sys.stderr)
+        sys.exit(1 if worse else 0)
+
+if __name__ == "__main__":
+    main()
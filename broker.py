@@ -0,0 +1,88 @@
+import os
+import time
+import logging
+import requests
+from dataclasses import asdict
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import insert
+from database import SessionLocal, BrokerCall
+import http_client
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Order fan-out: one signal can trigger several broker webhooks (the instrument's
+# Quantman URL plus any broker_targets). They are called at the same time, so an
+# order costs as long as the slowest target instead of the sum of all of them.
+QUANTMAN_TIMEOUT = float(os.getenv("QUANTMAN_TIMEOUT", "5"))
+BROKER_FANOUT_WORKERS = int(os.getenv("BROKER_FANOUT_WORKERS", "16"))
+BROKER_RECORD_CALLS = os.getenv("BROKER_RECORD_CALLS", "true").lower() == "true"
+
+CALL_SECONDS = metrics.Histogram("broker_call_seconds", "Latency of calls to order targets.", ["target"])
+CALLS = metrics.Counter("broker_calls_total", "Calls to order targets, by outcome.", ["target", "outcome"])
+
+_pool = ThreadPoolExecutor(max_workers=BROKER_FANOUT_WORKERS, thread_name_prefix="broker")
+
+def target_payload(targets):
+    """Job payload form of cache.TargetInfo objects."""
+    return [asdict(target) for target in targets]
+
+def call(target, signal_type, symbol):
+    """
+    Trigger one target. The result says whether it may be retried: only when the
+    request never reached the broker, since repeating anything else could place a
+    duplicate order.
+    """
+    result = {"target_id": target.get("id"), "target": target.get("name") or "quantman", "url": target["url"],
+              "ok": False, "retryable": False, "status_code": None, "error": None}
+    start = time.perf_counter()
+    try:
+        # Quantman expects a GET request to the webhook URL
+        response = http_client.get(target["url"], timeout=target.get("timeout") or QUANTMAN_TIMEOUT)
+        result["status_code"] = response.status_code
+        if response.status_code == 200:
+            logger.info(f"Quantman Webhook Triggered for {symbol} ({signal_type}) via {result['target']}")
+            result["ok"] = True
+        else:
+            logger.error(f"Quantman Webhook Failed ({result['target']}): {response.status_code} - {response.text}")
+            result["error"] = f"HTTP {response.status_code}"
+    except requests.exceptions.ReadTimeout as e:
+        logger.error(f"Quantman Webhook Timeout ({result['target']}): {e}")
+        result["error"] = f"Timeout: {e}"
+    except requests.exceptions.ConnectionError as e:
+        logger.warning(f"Quantman Webhook Connection Error ({result['target']}): {e}")
+        result["error"] = f"Connection error: {e}"
+        result["retryable"] = True
+    except Exception as e:
+        logger.error(f"Quantman Webhook Error ({result['target']}): {e}")
+        result["error"] = str(e)
+    result["latency_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    CALL_SECONDS.observe(result["latency_ms"] / 1000, target=result["target"])
+    CALLS.inc(target=result["target"], outcome="ok" if result["ok"] else "retryable" if result["retryable"] else "failed")
+    return result
+
+def fire(targets, signal_type, symbol):
+    """Call every target concurrently; one result per target, in the same order."""
+    if len(targets) == 1:
+        return [call(targets[0], signal_type, symbol)]  # No pool hop for the common case
+    futures = [_pool.submit(call, target, signal_type, symbol) for target in targets]
+    return [future.result() for future in futures]
+
+def record(symbol, signal_type, results):
+    """Store the per-target outcomes in one bulk insert."""
+    if not BROKER_RECORD_CALLS or not results:
+        return
+    rows = [
+        {"symbol": symbol, "signal": signal_type, "target_id": r["target_id"], "target": r["target"], "url": r["url"],
+         "ok": r["ok"], "status_code": r["status_code"], "latency_ms": r["latency_ms"], "error": r["error"]}
+        for r in results
+    ]
+    db = SessionLocal()
+    try:
+        db.execute(insert(BrokerCall), rows)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Recording broker calls failed: {e}")
+    finally:
+        db.close()
@@ -0,0 +1,492 @@
+import os
+import time
+import socket
+import logging
+import threading
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, insert, delete, func, and_, or_
+from sqlalchemy.orm import selectinload
+from database import SessionLocal, Instrument, TradeState, CacheInvalidation, SignalAlias
+import signals
+
+logger = logging.getLogger(__name__)
+
+# Process-level cache of active instruments and trade states, keyed by symbol.
+# Reads are served from memory; state writes go straight through to the database.
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+CACHE_TTL = float(os.getenv("CACHE_TTL", "300"))
+# Seconds between polls of the cache_invalidations table. 0 disables cross-worker
+# invalidation; set it when running more than one gunicorn worker.
+CACHE_SYNC_INTERVAL = float(os.getenv("CACHE_SYNC_INTERVAL", "0"))
+CACHE_SYNC_RETENTION = int(os.getenv("CACHE_SYNC_RETENTION", "600"))
+# Invalidation ids are handed out before commit, so a lower id can become visible after a
+# higher one. Ids skipped over are looked for again on every poll for this many seconds.
+CACHE_SYNC_GAP_TIMEOUT = float(os.getenv("CACHE_SYNC_GAP_TIMEOUT", "60"))
+# Symbols nobody tracks are cached too (the webhook is open to anyone); keep at most this many
+CACHE_MAX_UNKNOWN = int(os.getenv("CACHE_MAX_UNKNOWN", "10000"))
+# Load every active instrument and its state when a worker starts, so the first
+# alerts after a deploy do not each pay for their own cache misses
+CACHE_WARM = os.getenv("CACHE_WARM", "true").lower() == "true"
+
+ORIGIN = f"{socket.gethostname()}:{os.getpid()}"
+
+_lock = threading.Lock()
+_instruments = {}  # symbol or symbol alias -> (InstrumentInfo or None, loaded_at)
+_alias_keys = {}  # symbol -> aliases it is cached under, evicted with it
+_unknown = {}  # symbols cached as not tracked, oldest first
+_tracked = {}  # symbol or symbol alias -> instrument symbol, as last looked up (kept with caching off too)
+_states = {}  # symbol -> (StateInfo, loaded_at)
+_sync_thread = None
+_last_seen_id = None  # None until the first successful poll; changes made before it are not ours to apply
+_gaps = {}  # invalidation id not seen yet although a higher one was -> when it was first missed
+_generation = 0  # bumped on every change, so derived caches (rendered dashboard) know when to rebuild
+_listeners = []  # called with the symbols other workers changed, after each sync
+_counters = {"instrument_hits": 0, "instrument_misses": 0, "state_hits": 0, "state_misses": 0, "evictions": 0,
+             "state_rechecks": 0, "state_recheck_stale": 0}
+
+class StaleStateError(Exception):
+    """The row changed underneath the cached copy; reload and decide again."""
+
+@dataclass
+class TargetInfo:
+    id: int
+    action: str
+    name: str
+    url: str
+    timeout: float = None
+
+@dataclass
+class InstrumentInfo:
+    id: int
+    symbol: str
+    timeframe: str
+    active: bool
+    quantman_buy_url: str = None
+    quantman_sell_url: str = None
+    quantman_close_url: str = None
+    reversal_mode: str = None
+    market_session: str = None
+    market_calendar: str = None
+    off_session: str = None
+    targets: list = field(default_factory=list)  # active TargetInfo, all actions
+    signal_aliases: dict = field(default_factory=dict)  # normalized signal text -> signals.Signal
+
+    def targets_for(self, action):
+        """Order webhooks for buy / sell / close: the instrument's own Quantman URL first, then extra targets."""
+        legacy = getattr(self, f"quantman_{action}_url")
+        found = [TargetInfo(id=None, action=action, name="quantman", url=legacy)] if legacy else []
+        return found + [target for target in self.targets if target.action == action]
+
+@dataclass
+class StateInfo:
+    symbol: str
+    current_status: str = "NONE"
+    last_action_time: datetime = None
+    last_candle_timestamp: str = None
+    last_signal_price: str = None
+    persisted: bool = False
+    # Values as last read from / written to the database, used to detect concurrent writers
+    loaded_status: str = "NONE"
+    loaded_candle_timestamp: str = None
+
+def _fresh(loaded_at):
+    return CACHE_TTL <= 0 or time.monotonic() - loaded_at < CACHE_TTL
+
+def _instrument_info(row):
+    return InstrumentInfo(
+        id=row.id, symbol=row.symbol, timeframe=row.timeframe, active=row.active,
+        quantman_buy_url=row.quantman_buy_url, quantman_sell_url=row.quantman_sell_url,
+        quantman_close_url=row.quantman_close_url, reversal_mode=row.reversal_mode,
+        market_session=row.market_session, market_calendar=row.market_calendar, off_session=row.off_session,
+        targets=[
+            TargetInfo(id=t.id, action=t.action, name=t.name or f"target-{t.id}", url=t.url, timeout=t.timeout)
+            for t in row.targets if t.active and t.url
+        ],
+        signal_aliases={
+            signals.normalize(a.alias): signals.parse_canonical(a.signal)
+            for a in row.aliases if a.kind == "signal" and signals.parse_canonical(a.signal)
+        },
+    )
+
+def _state_info(row):
+    return StateInfo(
+        symbol=row.symbol, current_status=row.current_status, last_action_time=row.last_action_time,
+        last_candle_timestamp=row.last_candle_timestamp, last_signal_price=row.last_signal_price,
+        persisted=True, loaded_status=row.current_status, loaded_candle_timestamp=row.last_candle_timestamp,
+    )
+
+def get_instrument(db, symbol):
+    """
+    Active instrument for the symbol or one of its symbol aliases, or None. Unknown
+    symbols are cached too. The returned instrument's .symbol is the canonical one.
+    """
+    return get_instruments(db, [symbol])[symbol]
+
+def tracked_symbol(symbol):
+    """The instrument symbol behind a symbol (or alias) last looked up as active; None for any other."""
+    return _tracked.get(symbol)
+
+def canonical_symbol(symbol):
+    """The instrument symbol a cached symbol alias points at; the symbol itself otherwise."""
+    entry = _instruments.get(symbol)
+    return entry[0].symbol if entry is not None and entry[0] is not None else symbol
+
+def get_instruments(db, symbols):
+    """Active instruments for many symbols ({symbol: InstrumentInfo or None}), one query for all misses."""
+    found, misses = _cached_instruments(symbols)
+    if misses:
+        _store_instruments(found, misses, db.execute(_instruments_query(misses)).all())
+    return found
+
+async def get_instruments_async(db, symbols):
+    """get_instruments for an AsyncSession."""
+    found, misses = _cached_instruments(symbols)
+    if misses:
+        _store_instruments(found, misses, (await db.execute(_instruments_query(misses))).all())
+    return found
+
+def _instruments_query(symbols):
+    # One row per instrument matched by symbol, plus one per symbol alias matched
+    return (
+        select(Instrument, SignalAlias.alias)
+        .outerjoin(SignalAlias, and_(
+            SignalAlias.instrument_id == Instrument.id, SignalAlias.kind == "symbol", SignalAlias.alias.in_(symbols),
+        ))
+        .where(or_(Instrument.symbol.in_(symbols), SignalAlias.alias.is_not(None)), Instrument.active == True)
+        .options(selectinload(Instrument.targets), selectinload(Instrument.aliases))
+    )
+
+def _cached_instruments(symbols):
+    found, misses = {}, []
+    for symbol in symbols:
+        entry = _instruments.get(symbol) if CACHE_ENABLED else None
+        if entry is not None and _fresh(entry[1]):
+            found[symbol] = entry[0]
+        else:
+            misses.append(symbol)
+    with _lock:
+        _counters["instrument_hits"] += len(found)
+        _counters["instrument_misses"] += len(misses)
+    return found, misses
+
+def _store_instruments(found, misses, rows):
+    loaded, aliases = {}, []
+    for row, alias in rows:
+        info = loaded.get(row.symbol) or _instrument_info(row)
+        loaded[row.symbol] = info
+        if alias:
+            aliases.append((alias, info))
+    for alias, info in aliases:
+        loaded.setdefault(alias, info)  # A real symbol wins over another instrument's alias
+    now = time.monotonic()
+    for symbol in misses:
+        found[symbol] = loaded.get(symbol)
+        if found[symbol] is not None:
+            _tracked[symbol] = found[symbol].symbol
+        if CACHE_ENABLED:
+            with _lock:
+                _instruments[symbol] = (found[symbol], now)
+                _unknown.pop(symbol, None)
+                if found[symbol] is None:
+                    _unknown[symbol] = None
+                    if len(_unknown) > CACHE_MAX_UNKNOWN:
+                        oldest = next(iter(_unknown))
+                        del _unknown[oldest]
+                        _instruments.pop(oldest, None)
+                elif found[symbol].symbol != symbol:
+                    _alias_keys.setdefault(found[symbol].symbol, set()).add(symbol)
+
+def warm():
+    """Fill the cache with all active instruments (and their symbol aliases) and their states."""
+    if not CACHE_ENABLED or not CACHE_WARM:
+        return
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(Instrument).where(Instrument.active == True)
+            .options(selectinload(Instrument.targets), selectinload(Instrument.aliases))
+        ).scalars().all()
+        pairs = [(row, None) for row in rows]
+        pairs += [(row, alias.alias) for row in rows for alias in row.aliases if alias.kind == "symbol"]
+        _store_instruments({}, [row.symbol for row in rows] + [alias for _, alias in pairs if alias], pairs)
+        _store_states({}, load_states(db, [row.symbol for row in rows]))
+    except Exception as e:
+        logger.error(f"Cache warm-up failed: {e}")  # Not fatal: lookups fall back to the database
+    finally:
+        db.close()
+
+def get_state(db, symbol):
+    """A private copy of the symbol's trade state; callers may modify it freely."""
+    return get_states(db, [symbol])[symbol]
+
+def get_states(db, symbols):
+    """Private copies of many trade states ({symbol: StateInfo}), one query for all misses."""
+    found, misses = _cached_states(symbols)
+    if misses:
+        _store_states(found, load_states(db, misses))
+    return found
+
+async def get_states_async(db, symbols):
+    """get_states for an AsyncSession."""
+    found, misses = _cached_states(symbols)
+    if misses:
+        _store_states(found, await load_states_async(db, misses))
+    return found
+
+def _cached_states(symbols):
+    found, misses = {}, []
+    for symbol in symbols:
+        entry = _states.get(symbol) if CACHE_ENABLED else None
+        if entry is not None and _fresh(entry[1]):
+            found[symbol] = replace(entry[0])
+        else:
+            misses.append(symbol)
+    with _lock:
+        _counters["state_hits"] += len(found)
+        _counters["state_misses"] += len(misses)
+    return found, misses
+
+def _store_states(found, loaded):
+    now = time.monotonic()
+    for symbol, state in loaded.items():
+        found[symbol] = state
+        if CACHE_ENABLED:
+            with _lock:
+                _states[symbol] = (replace(state), now)
+
+def load_state(db, symbol, for_update=False):
+    """Read the state row directly, bypassing the cache (optionally locking it)."""
+    return load_states(db, [symbol], for_update)[symbol]
+
+def load_states(db, symbols, for_update=False):
+    """
+    Read state rows directly, bypassing the cache. Symbols without a row get a fresh
+    NONE state. With for_update the rows are locked in symbol order, so two batches
+    locking overlapping symbols cannot deadlock.
+    """
+    return _state_infos(symbols, db.execute(_states_query(symbols, for_update)).scalars())
+
+async def load_states_async(db, symbols, for_update=False):
+    """load_states for an AsyncSession."""
+    return _state_infos(symbols, (await db.execute(_states_query(symbols, for_update))).scalars())
+
+def recheck_states(db, states):
+    """
+    Compare states served from the cache with their rows, for decisions that write
+    nothing and so would never hit StaleStateError. Returns the symbols another worker
+    has moved on since they were cached; their cache entries now hold the rows.
+    """
+    if not CACHE_ENABLED or not states:
+        return []  # Already read from the database
+    return _store_rechecked(states, load_states(db, sorted(states)))
+
+async def recheck_states_async(db, states):
+    """recheck_states for an AsyncSession."""
+    if not CACHE_ENABLED or not states:
+        return []
+    return _store_rechecked(states, await load_states_async(db, sorted(states)))
+
+def _store_rechecked(states, loaded):
+    def version(state):
+        return state.persisted, state.loaded_status, state.loaded_candle_timestamp
+    stale = [symbol for symbol, state in loaded.items() if version(state) != version(states[symbol])]
+    _store_states({}, {symbol: loaded[symbol] for symbol in stale})
+    with _lock:
+        _counters["state_rechecks"] += len(states)
+        _counters["state_recheck_stale"] += len(stale)
+    return stale
+
+def _states_query(symbols, for_update):
+    query = select(TradeState).where(TradeState.symbol.in_(symbols)).order_by(TradeState.symbol)
+    return query.with_for_update() if for_update else query
+
+def _state_infos(symbols, rows):
+    states = {symbol: StateInfo(symbol=symbol) for symbol in symbols}
+    for row in rows:
+        states[row.symbol] = _state_info(row)
+    return states
+
+def save_state(db, state):
+    """
+    Write the state in the caller's transaction as a single UPDATE (or INSERT for a new
+    symbol). The UPDATE only matches if the row still holds the values we read, so a
+    write from another worker raises StaleStateError instead of being overwritten.
+    Call put_state() once the transaction has committed.
+    """
+    result = db.execute(_save_statement(state))
+    _check_saved(db, state, result)
+
+async def save_state_async(db, state):
+    """save_state for an AsyncSession."""
+    result = await db.execute(_save_statement(state))
+    _check_saved(db, state, result)
+
+def _save_statement(state):
+    values = {
+        "current_status": state.current_status,
+        "last_action_time": state.last_action_time,
+        "last_candle_timestamp": state.last_candle_timestamp,
+        "last_signal_price": state.last_signal_price,
+    }
+    if not state.persisted:
+        return insert(TradeState).values(symbol=state.symbol, **values)
+    return (
+        update(TradeState)
+        .where(
+            TradeState.symbol == state.symbol,
+            TradeState.current_status == state.loaded_status,
+            TradeState.last_candle_timestamp.is_(None) if state.loaded_candle_timestamp is None
+            else TradeState.last_candle_timestamp == state.loaded_candle_timestamp,
+        )
+        .values(**values)
+    )
+
+def _check_saved(db, state, result):
+    if state.persisted and result.rowcount != 1:
+        raise StaleStateError(state.symbol)
+    _record_invalidation(db, state.symbol)
+
+def put_state(state):
+    """Publish a committed state to the cache."""
+    global _generation
+    state.persisted = True
+    state.loaded_status = state.current_status
+    state.loaded_candle_timestamp = state.last_candle_timestamp
+    with _lock:
+        _generation += 1
+        if CACHE_ENABLED:
+            _states[state.symbol] = (replace(state), time.monotonic())
+
+def generation():
+    return _generation
+
+def invalidate(symbol=None, db=None):
+    """
+    Drop cached entries for a symbol (or everything). When a session is given and
+    cross-worker sync is on, the invalidation is also recorded for the other workers;
+    it is persisted by the caller's commit.
+    """
+    _evict(symbol)
+    if db is not None:
+        _record_invalidation(db, symbol)
+
+def clear():
+    _evict(None)
+
+def _evict(symbol):
+    global _generation
+    with _lock:
+        _generation += 1
+        _counters["evictions"] += 1
+        if symbol is None:
+            _instruments.clear()
+            _alias_keys.clear()
+            _unknown.clear()
+            _tracked.clear()
+            _states.clear()
+        else:
+            _instruments.pop(symbol, None)
+            _unknown.pop(symbol, None)
+            _tracked.pop(symbol, None)
+            for alias in _alias_keys.pop(symbol, ()):
+                _instruments.pop(alias, None)
+                _tracked.pop(alias, None)
+            _states.pop(symbol, None)
+
+def _record_invalidation(db, symbol):
+    if CACHE_SYNC_INTERVAL > 0:
+        db.add(CacheInvalidation(symbol=symbol, origin=ORIGIN))
+
+def add_listener(listener):
+    """Have listener(symbols) called with the symbols other workers changed, as sync sees them."""
+    _listeners.append(listener)
+
+def start():
+    """Start the cross-worker invalidation poller, if configured."""
+    global _sync_thread, _last_seen_id
+    if not CACHE_ENABLED or CACHE_SYNC_INTERVAL <= 0 or _sync_thread is not None:
+        return
+    try:
+        _last_seen_id = _max_invalidation_id()
+    except Exception as e:
+        # Database down at startup: the first sync that gets through sets the cursor
+        logger.error(f"Cache sync start deferred: {e}")
+    _sync_thread = threading.Thread(target=_sync_loop, name="cache-sync", daemon=True)
+    _sync_thread.start()
+
+def _max_invalidation_id():
+    db = SessionLocal()
+    try:
+        return db.query(func.max(CacheInvalidation.id)).scalar() or 0
+    finally:
+        db.close()
+
+def _sync_loop():
+    last_prune = 0
+    while True:
+        time.sleep(CACHE_SYNC_INTERVAL)
+        try:
+            sync()
+            if time.monotonic() - last_prune > CACHE_SYNC_RETENTION:
+                _prune()
+                last_prune = time.monotonic()
+        except Exception as e:
+            logger.error(f"Cache sync failed: {e}")
+
+def sync():
+    """Apply invalidations recorded by other workers since the last poll."""
+    global _last_seen_id
+    if _last_seen_id is None:
+        _last_seen_id = _max_invalidation_id()
+        clear()  # Whatever was cached before then may have changed behind our back
+        return
+    unseen = CacheInvalidation.id > _last_seen_id
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(CacheInvalidation.id, CacheInvalidation.symbol, CacheInvalidation.origin)
+            .filter(or_(unseen, CacheInvalidation.id.in_(list(_gaps))) if _gaps else unseen)
+            .order_by(CacheInvalidation.id)
+            .all()
+        )
+    finally:
+        db.close()
+    now = time.monotonic()
+    remote = set()
+    for row_id, symbol, origin in rows:
+        if row_id > _last_seen_id:
+            for missing in range(max(_last_seen_id + 1, row_id - 1000), row_id):
+                _gaps[missing] = now  # Maybe still uncommitted
+            _last_seen_id = row_id
+        else:
+            _gaps.pop(row_id, None)
+        if origin != ORIGIN:
+            _evict(symbol)
+            remote.add(symbol)
+    for row_id, missed_at in list(_gaps.items()):
+        if now - missed_at > CACHE_SYNC_GAP_TIMEOUT:
+            del _gaps[row_id]  # Rolled back, most likely
+    remote.discard(None)  # "Everything": not a state change
+    if remote:
+        for listener in _listeners:
+            listener(remote)
+
+def _prune():
+    db = SessionLocal()
+    try:
+        cutoff = datetime.utcnow() - timedelta(seconds=CACHE_SYNC_RETENTION)
+        db.execute(delete(CacheInvalidation).where(CacheInvalidation.created_at < cutoff))
+        db.commit()
+    finally:
+        db.close()
+
+def stats():
+    with _lock:
+        data = dict(_counters)
+        data["instruments"] = len(_instruments)
+        data["states"] = len(_states)
+        data["unknown"] = len(_unknown)
+    data["enabled"] = CACHE_ENABLED
+    data["sync_interval"] = CACHE_SYNC_INTERVAL
+    return data
@@ -0,0 +1,95 @@
+import os
+import time
+import threading
+from sqlalchemy import func, or_
+from database import Instrument, TradeState
+import cache
+
+# Dashboard data: one outer join of instruments and trade states per page, plus a
+# short-lived cache of rendered pages that is dropped whenever a state changes.
+DASHBOARD_PAGE_SIZE = int(os.getenv("DASHBOARD_PAGE_SIZE", "50"))
+DASHBOARD_MAX_PAGE_SIZE = 500
+DASHBOARD_CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL", "2"))
+DASHBOARD_CACHE_ENTRIES = 64
+STATUSES = ("LONG", "SHORT", "NONE")
+
+_lock = threading.Lock()
+_pages = {}  # key -> (html, generation, expires_at)
+
+def parse_args(args):
+    """Page, page size and filters from the query string, clamped to sane values."""
+    try:
+        page = max(int(args.get("page", 1)), 1)
+    except ValueError:
+        page = 1
+    try:
+        per_page = min(max(int(args.get("per_page", DASHBOARD_PAGE_SIZE)), 1), DASHBOARD_MAX_PAGE_SIZE)
+    except ValueError:
+        per_page = DASHBOARD_PAGE_SIZE
+    status = (args.get("status") or "").upper() or None
+    if status not in STATUSES:
+        status = None
+    timeframe = args.get("timeframe") or None
+    return {"page": page, "per_page": per_page, "status": status, "timeframe": timeframe}
+
+def load(db, page=1, per_page=DASHBOARD_PAGE_SIZE, status=None, timeframe=None):
+    """
+    One page of instruments with their trade state. The total row count comes back
+    in the same query as a window function, so a page is a single round trip.
+    """
+    current_status = func.coalesce(TradeState.current_status, "NONE")
+    query = (
+        db.query(Instrument, TradeState, func.count().over().label("total"))
+        .outerjoin(TradeState, TradeState.symbol == Instrument.symbol)
+    )
+    if status == "NONE":
+        query = query.filter(or_(TradeState.id.is_(None), current_status == "NONE"))
+    elif status:
+        query = query.filter(current_status == status)
+    if timeframe:
+        query = query.filter(Instrument.timeframe == timeframe)
+    rows = query.order_by(Instrument.symbol).offset((page - 1) * per_page).limit(per_page).all()
+
+    total = rows[0].total if rows else 0
+    if not rows and page > 1:
+        # Past the end: the window count is empty, so ask for it separately
+        total = query.with_entities(func.count(Instrument.id)).order_by(None).scalar()
+    instruments = []
+    for inst, state, _ in rows:
+        instruments.append({
+            "id": inst.id,
+            "symbol": inst.symbol,
+            "timeframe": inst.timeframe,
+            "active": inst.active,
+            "status": state.current_status if state else "NONE",
+            "last_update": state.last_action_time if state else "N/A",
+            "last_candle_timestamp": state.last_candle_timestamp if state else None,
+            "last_signal_price": state.last_signal_price if state else None,
+            "quantman_buy_url": inst.quantman_buy_url,
+            "quantman_sell_url": inst.quantman_sell_url,
+            "quantman_close_url": inst.quantman_close_url,
+            "reversal_mode": inst.reversal_mode,
+        })
+    return {
+        "page": page,
+        "per_page": per_page,
+        "total": total,
+        "pages": max((total + per_page - 1) // per_page, 1),
+        "status": status,
+        "timeframe": timeframe,
+        "instruments": instruments,
+    }
+
+def cached_page(key, render):
+    """Rendered HTML for the key, reused until it expires or any trade state changes."""
+    generation = cache.generation()
+    now = time.monotonic()
+    entry = _pages.get(key)
+    if entry is not None and entry[1] == generation and entry[2] > now:
+        return entry[0]
+    html = render()
+    with _lock:
+        if len(_pages) >= DASHBOARD_CACHE_ENTRIES:
+            _pages.clear()
+        _pages[key] = (html, generation, now + DASHBOARD_CACHE_TTL)
+    return html
@@ -1,18 +1,117 @@
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime
+from sqlalchemy import create_engine, event, Column, Integer, String, Boolean, Date, DateTime, Text, Float, ForeignKey, Index
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.pool import QueuePool
+from contextlib import contextmanager
 from datetime import datetime
 import os
+import time
+import threading
 
 # Use SQLite for simplicity, can be swapped for Postgres on Railway
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///tradingview_alerts.db")
+if DATABASE_URL.startswith("postgres://"):
+    # Railway/Heroku style URL; SQLAlchemy only accepts the postgresql:// scheme
+    DATABASE_URL = "postgresql://" + DATABASE_URL[len("postgres://"):]
+
+# Connection pool. Every gunicorn worker gets its own pool, so the server-side
+# connection count is roughly workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW).
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # replace connections older than this
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"  # drop connections the server closed
+
+# Local SQLite tuning: WAL lets the dashboard read while a webhook writes
+DB_SQLITE_JOURNAL_MODE = os.getenv("DB_SQLITE_JOURNAL_MODE", "WAL")
+DB_SQLITE_SYNCHRONOUS = os.getenv("DB_SQLITE_SYNCHRONOUS", "NORMAL")
+DB_SQLITE_BUSY_TIMEOUT = int(os.getenv("DB_SQLITE_BUSY_TIMEOUT", "5000"))  # ms to wait on a locked database
+
+_pool_stats_lock = threading.Lock()
+_pool_stats = {"checkouts": 0, "timeouts": 0, "wait_time": 0.0, "wait_max": 0.0}
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait to get a connection."""
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except PoolTimeoutError:
+            with _pool_stats_lock:
+                _pool_stats["timeouts"] += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with _pool_stats_lock:
+                _pool_stats["checkouts"] += 1
+                _pool_stats["wait_time"] += waited
+                _pool_stats["wait_max"] = max(_pool_stats["wait_max"], waited)
+
+def _tune_sqlite(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={DB_SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={DB_SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={DB_SQLITE_BUSY_TIMEOUT}")
+    cursor.close()
+
+def _create_engine(url):
+    if url.startswith("sqlite"):
+        if ":memory:" in url or url in ("sqlite://", "sqlite:///"):
+            return create_engine(url, connect_args={"check_same_thread": False})
+        sqlite_engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False, "timeout": DB_SQLITE_BUSY_TIMEOUT / 1000},
+            poolclass=TimedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+
+        event.listen(sqlite_engine, "connect", _tune_sqlite)
+        return sqlite_engine
+    return create_engine(
+        url,
+        poolclass=TimedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
 
 Base = declarative_base()
-engine = create_engine(DATABASE_URL)
-if DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+engine = _create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine for the ASGI server (asgi.py), created on first use so the sync
+# app never needs the async drivers (aiosqlite / asyncpg) installed.
+_async_session_factory = None
+
+def async_database_url(url=DATABASE_URL):
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    if url.startswith("postgresql:"):
+        return "postgresql+asyncpg:" + url[len("postgresql:"):]
+    return url
+
+def async_session():
+    """AsyncSession factory sharing the pool settings of the sync engine."""
+    global _async_session_factory
+    if _async_session_factory is None:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+        url = async_database_url()
+        if url.startswith("sqlite"):
+            async_engine = create_async_engine(url, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                                               pool_timeout=DB_POOL_TIMEOUT)
+            event.listen(async_engine.sync_engine, "connect", _tune_sqlite)
+        else:
+            async_engine = create_async_engine(url, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                                               pool_timeout=DB_POOL_TIMEOUT, pool_recycle=DB_POOL_RECYCLE,
+                                               pool_pre_ping=DB_POOL_PRE_PING)
+        _async_session_factory = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    return _async_session_factory
+
 class Instrument(Base):
     __tablename__ = "instruments"
     id = Column(Integer, primary_key=True, index=True)
@@ -22,7 +121,14 @@ class Instrument(Base):
     quantman_buy_url = Column(String, nullable=True)
     quantman_sell_url = Column(String, nullable=True)
     quantman_close_url = Column(String, nullable=True)
+    reversal_mode = Column(String, nullable=True)  # reverse, ignore, overwrite; NULL means REVERSAL_MODE
+    # Trading hours (see market_hours.py); no session means always open
+    market_session = Column(String, nullable=True)  # e.g. 09:15-15:30, or 09:00-11:30,12:30-15:00
+    market_calendar = Column(String, nullable=True)  # holiday calendar; NULL means MARKET_CALENDAR
+    off_session = Column(String, nullable=True)  # process, defer, drop; NULL means MARKET_OFF_SESSION
     created_at = Column(DateTime, default=datetime.utcnow)
+    targets = relationship("BrokerTarget", cascade="all, delete-orphan", order_by="BrokerTarget.id")
+    aliases = relationship("SignalAlias", cascade="all, delete-orphan", order_by="SignalAlias.id")
 
 class TradeState(Base):
     __tablename__ = "trade_states"
@@ -33,8 +139,109 @@ class TradeState(Base):
     last_candle_timestamp = Column(String, nullable=True) # ISO Format or Timestamp from TV
     last_signal_price = Column(String, nullable=True)
 
+class OutboundJob(Base):
+    """Pending Telegram message or Quantman trigger, drained by dispatcher.py."""
+    __tablename__ = "outbound_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    symbol = Column(String, index=True)
+    kind = Column(String)  # telegram, quantman
+    payload = Column(Text)  # JSON encoded handler arguments
+    status = Column(String, default="PENDING", index=True)  # PENDING, RUNNING, DONE, FAILED
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+
+class CacheInvalidation(Base):
+    """Symbols whose cached instrument/state other workers should drop (see cache.py)."""
+    __tablename__ = "cache_invalidations"
+    id = Column(Integer, primary_key=True, index=True)
+    symbol = Column(String, nullable=True)  # NULL means everything
+    origin = Column(String)  # host:pid of the writer, which already has the fresh copy
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class ProcessedAlert(Base):
+    """Keys of alerts already handled, so retried deliveries are rejected (see dedupe.py)."""
+    __tablename__ = "processed_alerts"
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String(40), unique=True, index=True)  # sha1 of symbol|signal|timestamp|client_id
+    symbol = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class SignalEvent(Base):
+    """Append-only record of every received signal and what was decided (see event_log.py)."""
+    __tablename__ = "signal_events"
+    id = Column(Integer, primary_key=True, index=True)
+    received_at = Column(DateTime, default=datetime.utcnow)
+    symbol = Column(String)
+    signal = Column(String)
+    price = Column(String, nullable=True)
+    candle_timestamp = Column(String, nullable=True)
+    status = Column(String)  # success, ignored, error
+    message = Column(Text, nullable=True)
+    payload = Column(Text)  # Raw payload as JSON
+    __table_args__ = (Index("ix_signal_events_symbol_candle", "symbol", "candle_timestamp"),)
+
+class BrokerTarget(Base):
+    """Extra order webhook for an instrument action; all targets of an action fire together (see broker.py)."""
+    __tablename__ = "broker_targets"
+    id = Column(Integer, primary_key=True, index=True)
+    instrument_id = Column(Integer, ForeignKey("instruments.id", ondelete="CASCADE"), index=True)
+    action = Column(String)  # buy, sell, close
+    name = Column(String)
+    url = Column(String)
+    timeout = Column(Float, nullable=True)  # seconds; QUANTMAN_TIMEOUT when empty
+    active = Column(Boolean, default=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class SignalAlias(Base):
+    """Instrument-specific spelling of a ticker or a signal, on top of the built-in grammar (see signals.py)."""
+    __tablename__ = "signal_aliases"
+    id = Column(Integer, primary_key=True, index=True)
+    instrument_id = Column(Integer, ForeignKey("instruments.id", ondelete="CASCADE"), index=True)
+    kind = Column(String)  # symbol, signal
+    alias = Column(String, index=True)  # Ticker as sent (without exchange prefix), or signal text upper-cased
+    signal = Column(String, nullable=True)  # Canonical signal for kind=signal, e.g. ENTRY_LONG
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class MarketHoliday(Base):
+    """A day a holiday calendar's market is closed (see market_hours.py)."""
+    __tablename__ = "market_holidays"
+    id = Column(Integer, primary_key=True, index=True)
+    calendar = Column(String, index=True)
+    day = Column(Date)
+    name = Column(String, nullable=True)
+
+class DeferredSignal(Base):
+    """Alert received outside its trading session, held for release at the next open."""
+    __tablename__ = "deferred_signals"
+    id = Column(Integer, primary_key=True, index=True)
+    symbol = Column(String)
+    payload = Column(Text)  # Raw alert as JSON
+    release_at = Column(Float, index=True)  # epoch seconds of the session open
+    expires_at = Column(Float)  # epoch seconds after which it is dropped instead
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class BrokerCall(Base):
+    """Outcome and latency of one call to an order target."""
+    __tablename__ = "broker_calls"
+    id = Column(Integer, primary_key=True, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    symbol = Column(String, index=True)
+    signal = Column(String)
+    target_id = Column(Integer, nullable=True)  # None for the instrument's own quantman_*_url
+    target = Column(String)
+    url = Column(String)
+    ok = Column(Boolean)
+    status_code = Column(Integer, nullable=True)
+    latency_ms = Column(Float)
+    error = Column(Text, nullable=True)
+
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    """Bring the schema up to date (see migrations.py)."""
+    import migrations
+    migrations.upgrade()
 
 def get_db():
     db = SessionLocal()
@@ -42,3 +249,33 @@ def get_db():
         yield db
     finally:
         db.close()
+
+@contextmanager
+def session_scope():
+    """A session that is rolled back on error and always closed, for code outside a request."""
+    db = SessionLocal()
+    try:
+        yield db
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def pool_stats():
+    """Checkout wait times and how close the pool is to its limit."""
+    with _pool_stats_lock:
+        data = dict(_pool_stats)
+    pool = engine.pool
+    data["wait_avg_ms"] = round(data.pop("wait_time") / data["checkouts"] * 1000, 3) if data["checkouts"] else 0
+    data["wait_max_ms"] = round(data.pop("wait_max") * 1000, 3)
+    if isinstance(pool, QueuePool):
+        capacity = pool.size() + max(DB_MAX_OVERFLOW, 0)
+        data["size"] = pool.size()
+        data["max_overflow"] = DB_MAX_OVERFLOW
+        data["checked_out"] = pool.checkedout()
+        data["overflow"] = max(pool.overflow(), 0)
+        data["saturation"] = round(pool.checkedout() / capacity, 3) if capacity else 0
+    data["pool"] = type(pool).__name__
+    return data
+
@@ -0,0 +1,151 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from database import SessionLocal, ProcessedAlert
+
+logger = logging.getLogger(__name__)
+
+# Duplicate-alert suppression. A bounded LRU of recently processed alert keys answers
+# most repeats in O(1) before any database work; the unique processed_alerts table
+# catches the rest (other workers, restarts).
+DEDUPE_ENABLED = os.getenv("DEDUPE_ENABLED", "true").lower() == "true"
+DEDUPE_MAX_ENTRIES = int(os.getenv("DEDUPE_MAX_ENTRIES", "10000"))
+DEDUPE_TTL = int(os.getenv("DEDUPE_TTL", "86400"))  # seconds a key is remembered, in memory and in the table
+DEDUPE_PRUNE_INTERVAL = int(os.getenv("DEDUPE_PRUNE_INTERVAL", "3600"))
+
+_lock = threading.Lock()
+_recent = OrderedDict()  # key -> expiry (monotonic)
+_prune_thread = None
+_counters = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+
+def key_for(payload, symbol, signal):
+    """
+    Identity of an alert: the instrument symbol and resolved signal it came down to
+    (so NSE:NIFTY / NIFTY and entry_long / ENTRY_LONG are one alert), its candle
+    timestamp and the optional client id.
+    """
+    if not isinstance(payload, dict):
+        return None
+    parts = [symbol, signal, payload.get("timestamp"), payload.get("client_id")]
+    raw = "|".join("" if part is None else str(part) for part in parts)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+def seen(key):
+    """True if the key was processed recently by this process."""
+    if not DEDUPE_ENABLED or key is None:
+        return False
+    with _lock:
+        expiry = _recent.get(key)
+        if expiry is not None:
+            if expiry > time.monotonic():
+                _recent.move_to_end(key)
+                _counters["memory_hits"] += 1
+                return True
+            del _recent[key]
+    return False
+
+def remember(key):
+    if not DEDUPE_ENABLED or key is None:
+        return
+    with _lock:
+        _recent[key] = time.monotonic() + DEDUPE_TTL
+        _recent.move_to_end(key)
+        while len(_recent) > DEDUPE_MAX_ENTRIES:
+            _recent.popitem(last=False)
+
+def claim(db, key, symbol):
+    """
+    Record the key in the caller's transaction. Returns False if another request
+    already recorded it; the transaction is rolled back in that case. The row is
+    flushed right away so the unique index decides before any work is done.
+    """
+    if not DEDUPE_ENABLED or key is None:
+        return True
+    db.add(ProcessedAlert(key=key, symbol=symbol))
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        return _claimed(key, False)
+    return _claimed(key, True)
+
+async def claim_async(db, key, symbol):
+    """claim for an AsyncSession."""
+    if not DEDUPE_ENABLED or key is None:
+        return True
+    db.add(ProcessedAlert(key=key, symbol=symbol))
+    try:
+        await db.flush()
+    except IntegrityError:
+        await db.rollback()
+        return _claimed(key, False)
+    return _claimed(key, True)
+
+def _claimed(key, new):
+    if not new:
+        remember(key)
+    with _lock:
+        _counters["misses" if new else "db_hits"] += 1
+    return new
+
+def claim_many(db, keys):
+    """
+    Batch variant of claim for {key: symbol}: one SELECT for the keys already
+    recorded, the rest are added to the session. Returns the set of duplicate keys.
+    A concurrent insert of the same key surfaces as IntegrityError on commit.
+    """
+    if not DEDUPE_ENABLED or not keys:
+        return set()
+    existing = {row.key for row in db.query(ProcessedAlert.key).filter(ProcessedAlert.key.in_(list(keys)))}
+    for key, symbol in keys.items():
+        if key not in existing:
+            db.add(ProcessedAlert(key=key, symbol=symbol))
+    for key in existing:
+        remember(key)
+    with _lock:
+        _counters["db_hits"] += len(existing)
+        _counters["misses"] += len(keys) - len(existing)
+    return existing
+
+def clear():
+    with _lock:
+        _recent.clear()
+
+def start():
+    """Start the background pruning of expired processed_alerts rows."""
+    global _prune_thread
+    if not DEDUPE_ENABLED or _prune_thread is not None:
+        return
+    _prune_thread = threading.Thread(target=_prune_loop, name="dedupe-prune", daemon=True)
+    _prune_thread.start()
+
+def _prune_loop():
+    while True:
+        try:
+            prune()
+        except Exception as e:
+            logger.error(f"Dedupe prune failed: {e}")
+        time.sleep(DEDUPE_PRUNE_INTERVAL)
+
+def prune():
+    db = SessionLocal()
+    try:
+        cutoff = datetime.utcnow() - timedelta(seconds=DEDUPE_TTL)
+        db.execute(delete(ProcessedAlert).where(ProcessedAlert.created_at < cutoff))
+        db.commit()
+    finally:
+        db.close()
+
+def stats():
+    with _lock:
+        data = dict(_counters)
+        data["entries"] = len(_recent)
+    data["enabled"] = DEDUPE_ENABLED
+    data["capacity"] = DEDUPE_MAX_ENTRIES
+    return data
@@ -0,0 +1,285 @@
+import os
+import json
+import asyncio
+import time
+import zlib
+import queue
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from database import SessionLocal, OutboundJob
+
+logger = logging.getLogger(__name__)
+
+# "async" drains jobs in background workers, "sync" runs them inline (old behaviour, handy for tests)
+DISPATCH_MODE = os.getenv("DISPATCH_MODE", "async").lower()
+DISPATCH_WORKERS = int(os.getenv("DISPATCH_WORKERS", "4"))
+DISPATCH_MAX_ATTEMPTS = int(os.getenv("DISPATCH_MAX_ATTEMPTS", "5"))
+DISPATCH_BACKOFF_BASE = float(os.getenv("DISPATCH_BACKOFF_BASE", "0.5"))
+DISPATCH_BACKOFF_MAX = float(os.getenv("DISPATCH_BACKOFF_MAX", "30"))
+# RUNNING jobs older than this are assumed orphaned by a dead worker and picked up again
+DISPATCH_STALE_SECONDS = int(os.getenv("DISPATCH_STALE_SECONDS", "300"))
+
+_handlers = {}
+_batch_windows = {}  # kind -> seconds a lane waits for more jobs before delivering
+_lanes = {}  # kind -> queue drained by that kind's single lane worker
+_shards = []
+_start_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_in_flight = 0
+_counters = {"enqueued": 0, "done": 0, "retried": 0, "failed": 0}
+_latencies = deque(maxlen=1000)  # seconds from enqueue to completion
+
+class RetryableError(Exception):
+    """Raised by a handler when the call may safely be repeated."""
+
+def handler(kind):
+    """Register the function that delivers jobs of the given kind."""
+    def register(fn):
+        _handlers[kind] = fn
+        return fn
+    return register
+
+def batch_handler(kind, window=0.0, max_jobs=50):
+    """
+    Register fn(payloads) for jobs that are better delivered together. Jobs of this
+    kind skip the symbol shards and go to one lane worker, which collects whatever
+    arrives within window seconds of the first job (up to max_jobs) and hands the
+    payloads over in one call. Payloads the handler removes from the list count as
+    delivered, so a retry after a partial failure only repeats the rest.
+    """
+    def register(fn):
+        _handlers[kind] = fn
+        _batch_windows[kind] = (window, max_jobs)
+        return fn
+    return register
+
+def enqueue(db, symbol, kind, payload):
+    """
+    Add an outbound job to the session. It is persisted by the caller's commit,
+    so the job and the state change it belongs to are written atomically.
+    """
+    job = OutboundJob(symbol=symbol, kind=kind, payload=json.dumps(payload))
+    db.add(job)
+    return job
+
+def commit(db, jobs):
+    """Commit the session, then hand the freshly persisted jobs to the workers."""
+    db.flush()  # assigns ids without the refresh a post-commit attribute access would cost
+    items = [(job.id, job.symbol, job.kind, json.loads(job.payload)) for job in jobs]
+    db.commit()
+    submit(items)
+
+async def commit_async(db, jobs):
+    """commit for an AsyncSession. Delivery stays on the worker threads, off the event loop."""
+    await db.flush()
+    items = [(job.id, job.symbol, job.kind, json.loads(job.payload)) for job in jobs]
+    await db.commit()
+    if DISPATCH_MODE != "async":
+        await asyncio.to_thread(submit, items)  # Sync mode sends inline; keep that off the loop
+    else:
+        submit(items)
+
+def submit(items):
+    now = time.monotonic()
+    with _stats_lock:
+        _counters["enqueued"] += len(items)
+    if DISPATCH_MODE != "async":
+        lanes = {}
+        for item in items:
+            if item[2] in _batch_windows:
+                lanes.setdefault(item[2], []).append(item + (now,))
+            else:
+                _execute(item + (now,))
+        for kind, lane_items in lanes.items():
+            _execute_batch(kind, lane_items)
+        return
+    start()
+    for item in items:
+        lane = _lanes.get(item[2])
+        (lane if lane is not None else _shard_for(item[1])).put(item + (now,))
+
+def _shard_for(symbol):
+    # One queue per worker; hashing the symbol keeps that symbol's jobs in order
+    return _shards[zlib.crc32((symbol or "").encode()) % len(_shards)]
+
+def start():
+    """Start the worker pool (once per process) and pick up jobs left over from earlier runs."""
+    if DISPATCH_MODE != "async":
+        return
+    with _start_lock:
+        if _shards:
+            return
+        for i in range(max(DISPATCH_WORKERS, 1)):
+            shard = queue.Queue()
+            _shards.append(shard)
+            threading.Thread(target=_worker, args=(shard,), name=f"dispatch-{i}", daemon=True).start()
+        for kind in _batch_windows:
+            lane = _lanes[kind] = queue.Queue()
+            threading.Thread(target=_lane_worker, args=(kind, lane), name=f"dispatch-{kind}", daemon=True).start()
+    try:
+        recover()
+    except Exception as e:
+        logger.error(f"Dispatch recovery failed: {e}")
+
+def recover():
+    """Re-queue PENDING jobs and RUNNING jobs whose worker has gone away."""
+    db = SessionLocal()
+    try:
+        stale_before = datetime.utcnow() - timedelta(seconds=DISPATCH_STALE_SECONDS)
+        db.execute(
+            update(OutboundJob)
+            .where(OutboundJob.status == "RUNNING", OutboundJob.started_at < stale_before)
+            .values(status="PENDING")
+        )
+        db.commit()
+        jobs = db.query(OutboundJob).filter(OutboundJob.status == "PENDING").order_by(OutboundJob.id).all()
+        items = [(job.id, job.symbol, job.kind, json.loads(job.payload)) for job in jobs]
+    finally:
+        db.close()
+    if items:
+        logger.info(f"Recovered {len(items)} pending outbound jobs")
+        submit(items)
+
+def _worker(shard):
+    while True:
+        item = shard.get()
+        try:
+            _execute(item)
+        except Exception as e:
+            logger.error(f"Dispatch worker error: {e}")
+        finally:
+            shard.task_done()
+
+def _lane_worker(kind, lane):
+    window, max_jobs = _batch_windows[kind]
+    while True:
+        items = [lane.get()]
+        deadline = time.monotonic() + window
+        while len(items) < max_jobs:
+            try:
+                # Jobs queued while the last batch was being delivered are taken without waiting
+                items.append(lane.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        try:
+            _execute_batch(kind, items)
+        except Exception as e:
+            logger.error(f"Dispatch lane {kind} error: {e}")
+        finally:
+            for _ in items:
+                lane.task_done()
+
+def _execute(item):
+    job_id, symbol, kind, payload, enqueued_at = item
+    if kind in _batch_windows:
+        return _execute_batch(kind, [item])  # Registered after the lanes were started
+    if not _claim(job_id):
+        return  # Another process got there first
+    status, error, attempts = _run_counted(kind, payload, 1)
+    _finish([job_id], status, error, attempts)
+    _record([item], status)
+
+def _execute_batch(kind, items):
+    items = [item for item in items if _claim(item[0])]
+    if not items:
+        return
+    payloads = [item[3] for item in items]
+    status, error, attempts = _run_counted(kind, payloads, len(items))
+    if status == "DONE":
+        delivered, undelivered = items, []
+    else:
+        # The handler drops payloads from the list as it delivers them
+        remaining = {id(payload) for payload in payloads}
+        delivered = [item for item in items if id(item[3]) not in remaining]
+        undelivered = [item for item in items if id(item[3]) in remaining]
+    for group, group_status in ((delivered, "DONE"), (undelivered, status)):
+        if group:
+            _finish([item[0] for item in group], group_status, None if group_status == "DONE" else error, attempts)
+            _record(group, group_status)
+
+def _run_counted(kind, arg, count):
+    global _in_flight
+    with _stats_lock:
+        _in_flight += count
+    try:
+        return _run(kind, arg)
+    finally:
+        with _stats_lock:
+            _in_flight -= count
+
+def _record(items, status):
+    now = time.monotonic()
+    with _stats_lock:
+        _counters["done" if status == "DONE" else "failed"] += len(items)
+        _latencies.extend(now - item[4] for item in items)
+
+def _run(kind, payload):
+    """Call the handler, retrying in place so later jobs for the symbol keep waiting their turn."""
+    fn = _handlers.get(kind)
+    if fn is None:
+        return "FAILED", f"No handler for job kind {kind}", 0
+
+    attempts = 0
+    while True:
+        attempts += 1
+        try:
+            if fn(payload) is False:
+                return "FAILED", "Handler reported failure", attempts
+            return "DONE", None, attempts
+        except RetryableError as e:
+            if attempts >= DISPATCH_MAX_ATTEMPTS:
+                return "FAILED", str(e), attempts
+            with _stats_lock:
+                _counters["retried"] += 1
+            time.sleep(min(DISPATCH_BACKOFF_BASE * 2 ** (attempts - 1), DISPATCH_BACKOFF_MAX))
+        except Exception as e:
+            return "FAILED", str(e), attempts
+
+def _claim(job_id):
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            update(OutboundJob)
+            .where(OutboundJob.id == job_id, OutboundJob.status == "PENDING")
+            .values(status="RUNNING", started_at=datetime.utcnow())
+        )
+        db.commit()
+        return result.rowcount == 1
+    finally:
+        db.close()
+
+def _finish(job_ids, status, error, attempts):
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(OutboundJob)
+            .where(OutboundJob.id.in_(job_ids))
+            .values(status=status, last_error=error, attempts=attempts, completed_at=datetime.utcnow())
+        )
+        db.commit()
+    finally:
+        db.close()
+    if status != "DONE":
+        logger.error(f"Outbound job(s) {', '.join(map(str, job_ids))} failed after {attempts} attempt(s): {error}")
+
+def stats():
+    """Queue depth and enqueue-to-completion latency for this process."""
+    with _stats_lock:
+        latencies = sorted(_latencies)
+        data = dict(_counters)
+        data["in_flight"] = _in_flight
+    data["mode"] = DISPATCH_MODE
+    data["workers"] = len(_shards)
+    data["queue_depth"] = sum(shard.qsize() for shard in _shards) + sum(lane.qsize() for lane in _lanes.values())
+    if latencies:
+        data["latency_avg_ms"] = round(sum(latencies) / len(latencies) * 1000, 2)
+        data["latency_p95_ms"] = round(latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] * 1000, 2)
+        data["latency_max_ms"] = round(latencies[-1] * 1000, 2)
+    return data
+
+def pending_count(db):
+    """Jobs not yet delivered across all processes, from the database."""
+    return db.query(OutboundJob).filter(OutboundJob.status.in_(["PENDING", "RUNNING"])).count()
@@ -0,0 +1,143 @@
+import os
+import json
+import atexit
+import logging
+import threading
+from datetime import datetime
+from sqlalchemy import insert
+from database import SessionLocal, SignalEvent
+
+logger = logging.getLogger(__name__)
+
+# Append-only log of every received signal and the decision taken. Events are
+# buffered in memory and written by a background thread in bulk INSERTs, so the
+# webhook path only pays for appending to a list.
+EVENT_LOG_ENABLED = os.getenv("EVENT_LOG_ENABLED", "true").lower() == "true"
+EVENT_LOG_BATCH_SIZE = int(os.getenv("EVENT_LOG_BATCH_SIZE", "500"))
+EVENT_LOG_FLUSH_INTERVAL = float(os.getenv("EVENT_LOG_FLUSH_INTERVAL", "1"))
+EVENT_LOG_MAX_BUFFER = int(os.getenv("EVENT_LOG_MAX_BUFFER", "50000"))
+
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_wakeup = threading.Event()
+_buffer = []
+_flusher = None
+_counters = {"recorded": 0, "written": 0, "dropped": 0, "flushes": 0, "flush_errors": 0}
+
+def record(payload, result):
+    """Queue one event: the raw payload and the result process_signal returned for it."""
+    if not EVENT_LOG_ENABLED:
+        return
+    payload = payload if isinstance(payload, dict) else {"raw": payload}
+    row = {
+        "received_at": datetime.utcnow(),
+        "symbol": _text(payload.get("symbol")),
+        "signal": _text(payload.get("signal")),
+        "price": _text(payload.get("price")),
+        "candle_timestamp": _text(payload.get("timestamp")),
+        "status": result.get("status"),
+        "message": result.get("message"),
+        "payload": json.dumps(payload, default=str),
+    }
+    with _lock:
+        if len(_buffer) >= EVENT_LOG_MAX_BUFFER:
+            _counters["dropped"] += 1
+            return
+        _buffer.append(row)
+        _counters["recorded"] += 1
+        full = len(_buffer) >= EVENT_LOG_BATCH_SIZE
+    if full:
+        _wakeup.set()
+
+def _text(value):
+    return None if value is None else str(value)
+
+def flush():
+    """Write everything buffered so far. Returns the number of events written."""
+    with _flush_lock:
+        with _lock:
+            rows = _buffer[:]
+            del _buffer[:]
+        if not rows:
+            return 0
+        db = SessionLocal()
+        try:
+            for start in range(0, len(rows), EVENT_LOG_BATCH_SIZE):
+                db.execute(insert(SignalEvent), rows[start:start + EVENT_LOG_BATCH_SIZE])
+            db.commit()
+        except Exception:
+            db.rollback()
+            with _lock:
+                # Put them back in front for the next attempt, within the buffer bound
+                keep = rows[:max(EVENT_LOG_MAX_BUFFER - len(_buffer), 0)]
+                _buffer[:0] = keep
+                _counters["dropped"] += len(rows) - len(keep)
+                _counters["flush_errors"] += 1
+            raise
+        finally:
+            db.close()
+        with _lock:
+            _counters["written"] += len(rows)
+            _counters["flushes"] += 1
+        return len(rows)
+
+def start():
+    """Start the background flusher (once per process)."""
+    global _flusher
+    if not EVENT_LOG_ENABLED or _flusher is not None:
+        return
+    _flusher = threading.Thread(target=_flush_loop, name="event-log", daemon=True)
+    _flusher.start()
+    atexit.register(_flush_quietly)
+
+def _flush_loop():
+    while True:
+        _wakeup.wait(EVENT_LOG_FLUSH_INTERVAL)
+        _wakeup.clear()
+        _flush_quietly()
+
+def _flush_quietly():
+    try:
+        flush()
+    except Exception as e:
+        logger.error(f"Event log flush failed: {e}")
+
+def query(db, symbol=None, status=None, since=None, until=None, newest_first=True):
+    """Events, optionally filtered by symbol, status and candle time range."""
+    q = db.query(SignalEvent)
+    if symbol:
+        q = q.filter(SignalEvent.symbol == symbol)
+    if status:
+        q = q.filter(SignalEvent.status == status)
+    if since:
+        q = q.filter(SignalEvent.candle_timestamp >= since)
+    if until:
+        q = q.filter(SignalEvent.candle_timestamp <= until)
+    return q.order_by(SignalEvent.id.desc() if newest_first else SignalEvent.id)
+
+def page(db, before=None, limit=100, **filters):
+    """Keyset pagination: events with id < before, so deep pages cost the same as the first."""
+    q = query(db, **filters)
+    if before:
+        q = q.filter(SignalEvent.id < before)
+    events = [to_dict(event) for event in q.limit(limit)]
+    return {"events": events, "next_before": events[-1]["id"] if len(events) == limit else None}
+
+EXPORT_COLUMNS = ["id", "received_at", "symbol", "signal", "price", "candle_timestamp", "status", "message", "payload"]
+
+def to_dict(event):
+    data = {column: getattr(event, column) for column in EXPORT_COLUMNS}
+    data["received_at"] = event.received_at.isoformat() if event.received_at else None
+    return data
+
+def stream(db, **filters):
+    """Yield events oldest first, fetched in batches instead of loading the whole table."""
+    for event in query(db, newest_first=False, **filters).yield_per(1000):
+        yield to_dict(event)
+
+def stats():
+    with _lock:
+        data = dict(_counters)
+        data["buffered"] = len(_buffer)
+    data["enabled"] = EVENT_LOG_ENABLED
+    return data
@@ -0,0 +1,119 @@
+import os
+import time
+import threading
+import requests
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# Shared outbound HTTP layer for Telegram and Quantman. One Session per process keeps
+# a keep-alive connection pool per host, so only the first call to a host pays for TCP+TLS.
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))  # hosts to keep pools for
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "10"))  # idle sockets kept per host
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+
+_session = None
+_session_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {}
+
+def _host_stats(host):
+    entry = _stats.get(host)
+    if entry is None:
+        entry = _stats[host] = {
+            "requests": 0, "errors": 0, "request_time": 0.0, "request_max": 0.0,
+            "handshakes": 0, "handshake_time": 0.0, "handshake_max": 0.0,
+        }
+    return entry
+
+def _record(host, kind, elapsed, error=False):
+    with _stats_lock:
+        entry = _host_stats(host)
+        entry[kind + "s"] += 1
+        entry[kind + "_time"] += elapsed
+        entry[kind + "_max"] = max(entry[kind + "_max"], elapsed)
+        if error:
+            entry["errors"] += 1
+
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        _record(self.host, "handshake", time.perf_counter() - start)
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        # Covers TCP connect plus the TLS handshake
+        start = time.perf_counter()
+        super().connect()
+        _record(self.host, "handshake", time.perf_counter() - start)
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections report how long each new connection took to set up."""
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+def get_session():
+    """The process-wide Session, created on first use so each gunicorn worker gets its own."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = PooledAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers["Connection"] = "keep-alive"
+                _session = session
+    return _session
+
+def request(method, url, timeout=None, **kwargs):
+    """
+    Send a request over the shared pool. `timeout` is the read timeout in seconds;
+    the connect timeout always comes from HTTP_CONNECT_TIMEOUT.
+    """
+    host = urlsplit(url).hostname or ""
+    read_timeout = timeout if timeout is not None else HTTP_READ_TIMEOUT
+    start = time.perf_counter()
+    try:
+        response = get_session().request(method, url, timeout=(HTTP_CONNECT_TIMEOUT, read_timeout), **kwargs)
+    except requests.exceptions.RequestException:
+        _record(host, "request", time.perf_counter() - start, error=True)
+        raise
+    _record(host, "request", time.perf_counter() - start, error=response.status_code >= 400)
+    return response
+
+def get(url, timeout=None, **kwargs):
+    return request("GET", url, timeout=timeout, **kwargs)
+
+def post(url, timeout=None, **kwargs):
+    return request("POST", url, timeout=timeout, **kwargs)
+
+def stats():
+    """Per-host request and handshake timings. Few handshakes per request means keep-alive is working."""
+    with _stats_lock:
+        snapshot = {host: dict(entry) for host, entry in _stats.items()}
+    data = {}
+    for host, entry in snapshot.items():
+        data[host] = {
+            "requests": entry["requests"],
+            "errors": entry["errors"],
+            "request_avg_ms": round(entry["request_time"] / entry["requests"] * 1000, 2) if entry["requests"] else 0,
+            "request_max_ms": round(entry["request_max"] * 1000, 2),
+            "handshakes": entry["handshakes"],
+            "handshake_avg_ms": round(entry["handshake_time"] / entry["handshakes"] * 1000, 2) if entry["handshakes"] else 0,
+            "handshake_max_ms": round(entry["handshake_max"] * 1000, 2),
+        }
+    return data
@@ -0,0 +1,292 @@
+import os
+import glob
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from sqlalchemy.exc import OperationalError, InterfaceError, DisconnectionError, TimeoutError as PoolTimeoutError
+
+try:
+    import fcntl
+except ImportError:  # Not on Windows; replay is then not coordinated between processes
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Local write-ahead inbox. Every webhook alert is appended to a SQLite journal (WAL,
+# no fsync per commit) before it is processed and deleted once process_signal has
+# committed. If the database is unreachable, the entry is left queued and the
+# request answers 202; a background thread replays queued entries in arrival order
+# once the database is back, and on startup. Replays that already committed before
+# a crash are turned away by dedupe. Put INBOX_PATH on a volume to survive redeploys.
+INBOX_ENABLED = os.getenv("INBOX_ENABLED", "true").lower() == "true"
+INBOX_PATH = os.getenv("INBOX_PATH", "inbox.db")
+INBOX_SYNCHRONOUS = os.getenv("INBOX_SYNCHRONOUS", "NORMAL")  # FULL to fsync every append
+INBOX_MAX_ENTRIES = int(os.getenv("INBOX_MAX_ENTRIES", "100000"))  # beyond this, alerts are processed unjournaled
+INBOX_RETRY_INTERVAL = float(os.getenv("INBOX_RETRY_INTERVAL", "2"))  # seconds between replay attempts
+# An entry stays in flight while the process that journaled it is alive: each process holds
+# a lock on its own owner file, and the replayer only takes over entries whose owner's lock
+# is gone. Entries from journals written before owners were recorded, or on platforms
+# without fcntl, are taken over once they are this old instead.
+INBOX_INFLIGHT_TIMEOUT = float(os.getenv("INBOX_INFLIGHT_TIMEOUT", "600"))
+INBOX_COMPACT_INTERVAL = float(os.getenv("INBOX_COMPACT_INTERVAL", "300"))
+
+# Errors that mean "the database is not there right now", as opposed to a bad alert
+UNAVAILABLE_ERRORS = (OperationalError, InterfaceError, DisconnectionError, PoolTimeoutError)
+
+_lock = threading.Lock()
+_wakeup = threading.Event()
+_conn = None
+_thread = None
+_owner = None  # This process's owner id, stored with the entries it journals
+_owner_file = None  # Held (shared lock) for as long as the process lives
+_entries = 0  # Estimate of journaled entries, refreshed from the file by the replay thread
+_queued = 0  # Entries waiting for replay, as of the last look
+_counters = {"appended": 0, "done": 0, "queued": 0, "replayed": 0, "dropped": 0, "overflow": 0, "replay_errors": 0,
+             "journal_errors": 0}
+
+def _connect():
+    global _conn, _entries
+    if _conn is None:
+        _conn = sqlite3.connect(INBOX_PATH, check_same_thread=False, isolation_level=None)
+        _conn.execute("PRAGMA auto_vacuum=INCREMENTAL")  # Only takes effect on a new file
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute(f"PRAGMA synchronous={INBOX_SYNCHRONOUS}")
+        _conn.execute("PRAGMA busy_timeout=5000")
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS inbox (id INTEGER PRIMARY KEY AUTOINCREMENT, received_at REAL,"
+            " state TEXT, payload TEXT, owner TEXT)"  # state: inflight (a request has it) or queued (for replay)
+        )
+        if "owner" not in [row[1] for row in _conn.execute("PRAGMA table_info(inbox)")]:
+            _conn.execute("ALTER TABLE inbox ADD COLUMN owner TEXT")
+        _entries = _conn.execute("SELECT count(*) FROM inbox").fetchone()[0]
+        _claim_owner()
+    return _conn
+
+def _owner_path(owner):
+    return f"{INBOX_PATH}.owner-{owner}"
+
+def _claim_owner():
+    global _owner, _owner_file
+    if _owner is not None:
+        return
+    _owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"  # The pid alone may be reused after a restart
+    if fcntl:
+        _owner_file = open(_owner_path(_owner), "a")
+        fcntl.flock(_owner_file, fcntl.LOCK_SH)
+
+def _journal_error(action, e):
+    # A locked, full or broken journal must not fail the alert itself
+    logger.error(f"Inbox {action} failed: {e}")
+    with _lock:
+        _counters["journal_errors"] += 1
+
+def append(payload):
+    """Journal an alert before processing it. Returns the entry id, or None if it was not journaled."""
+    return append_many([payload])[0]
+
+def append_many(payloads):
+    """append() for a batch, in one journal transaction. One entry id (or None) per payload."""
+    global _entries
+    if not INBOX_ENABLED:
+        return [None] * len(payloads)
+    if _entries + len(payloads) > INBOX_MAX_ENTRIES:
+        with _lock:
+            _counters["overflow"] += len(payloads)
+        return [None] * len(payloads)
+    now = time.time()
+    try:
+        with _lock:
+            conn = _connect()
+            conn.execute("BEGIN")
+            try:
+                ids = [conn.execute("INSERT INTO inbox (received_at, state, payload, owner) VALUES (?, 'inflight', ?, ?)",
+                                    (now, json.dumps(payload), _owner)).lastrowid for payload in payloads]
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            _entries += len(ids)
+            _counters["appended"] += len(ids)
+        return ids
+    except sqlite3.Error as e:
+        _journal_error("append", e)
+        return [None] * len(payloads)
+
+def done(*entry_ids):
+    """The alerts' outcome is committed (or they can never succeed); forget them."""
+    global _entries
+    entry_ids = [(entry_id,) for entry_id in entry_ids if entry_id is not None]
+    if not entry_ids:
+        return
+    try:
+        with _lock:
+            _connect().executemany("DELETE FROM inbox WHERE id = ?", entry_ids)
+            _entries -= len(entry_ids)
+            _counters["done"] += len(entry_ids)
+    except sqlite3.Error as e:
+        _journal_error("done", e)  # Replayed later and turned away by dedupe
+
+def defer(*entry_ids):
+    """Leave the alerts for the replay thread. Returns False if any was not journaled (so it is lost)."""
+    global _queued
+    if not entry_ids or None in entry_ids:
+        return False
+    try:
+        with _lock:
+            _connect().executemany("UPDATE inbox SET state = 'queued' WHERE id = ?", [(entry_id,) for entry_id in entry_ids])
+            _queued += len(entry_ids)
+            _counters["queued"] += len(entry_ids)
+            first = _queued == len(entry_ids)
+    except sqlite3.Error as e:
+        _journal_error("defer", e)
+        return False
+    if first:
+        _wakeup.set()  # Later ones wait for the retry interval rather than hammering a database that is down
+    return True
+
+def backlog():
+    """True while queued alerts wait for replay; new alerts then queue behind them to keep their order."""
+    return _queued > 0
+
+def replay(process, limit=None):
+    """
+    Run queued alerts through process(payload) in arrival order. Stops at the first
+    alert that fails because the database is unavailable. Returns how many were handled.
+    """
+    handled = 0
+    conn = _connect()
+    _reclaim(conn)
+    while limit is None or handled < limit:
+        with _lock:
+            rows = conn.execute("SELECT id, payload FROM inbox WHERE state = 'queued' ORDER BY id LIMIT 100").fetchall()
+        if not rows:
+            break
+        for entry_id, payload in rows:
+            try:
+                process(json.loads(payload))
+            except UNAVAILABLE_ERRORS as e:
+                with _lock:
+                    _counters["replay_errors"] += 1
+                logger.warning(f"Inbox replay paused, database unavailable: {e}")
+                _refresh()
+                return handled
+            except Exception as e:
+                logger.error(f"Inbox entry {entry_id} dropped: {e}")
+                with _lock:
+                    _counters["dropped"] += 1
+            else:
+                with _lock:
+                    _counters["replayed"] += 1
+            done(entry_id)
+            handled += 1
+    _refresh()
+    return handled
+
+def _reclaim(conn):
+    """Queue the in-flight entries of processes that died before finishing them."""
+    scanned_at = time.time()  # Owners that start after the scan only journal entries newer than this
+    live, gone = {_owner}, []
+    for path in glob.glob(glob.escape(_owner_path("")) + "*") if fcntl else []:
+        owner = path[len(_owner_path("")):]
+        if owner == _owner:
+            continue
+        if _owner_gone(path):
+            gone.append(owner)
+        else:
+            live.add(owner)
+    with _lock:
+        if fcntl:
+            placeholders = ", ".join("?" * len(live))
+            conn.execute(f"UPDATE inbox SET state = 'queued' WHERE state = 'inflight' AND owner NOT IN ({placeholders})"
+                         " AND received_at < ?", (*live, scanned_at))
+        # Owner unknown: journaled by an older version, or no fcntl to tell
+        conn.execute("UPDATE inbox SET state = 'queued' WHERE state = 'inflight' AND (owner IS NULL OR ?) AND received_at < ?",
+                     (fcntl is None, scanned_at - INBOX_INFLIGHT_TIMEOUT))
+    for owner in gone:
+        try:
+            os.remove(_owner_path(owner))
+        except OSError:
+            pass
+
+def _owner_gone(path):
+    """True if nobody holds the owner file's lock any more: its process has exited."""
+    try:
+        with open(path, "a") as owner_file:
+            fcntl.flock(owner_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+    except OSError:
+        return False
+
+def _refresh():
+    global _entries, _queued
+    with _lock:
+        conn = _connect()
+        _entries = conn.execute("SELECT count(*) FROM inbox").fetchone()[0]
+        _queued = conn.execute("SELECT count(*) FROM inbox WHERE state = 'queued'").fetchone()[0]
+
+def compact():
+    """Give the space of finished entries back and truncate the WAL."""
+    with _lock:
+        conn = _connect()
+        conn.execute("PRAGMA incremental_vacuum")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+def start(process):
+    """Replay what a previous run left behind, then keep replaying queued alerts in the background."""
+    global _thread
+    if not INBOX_ENABLED or _thread is not None:
+        return
+    _connect()
+    _thread = threading.Thread(target=_replay_loop, args=(process,), name="inbox-replay", daemon=True)
+    _thread.start()
+
+def _replay_loop(process):
+    last_compact = time.monotonic()
+    lock_file = open(INBOX_PATH + ".lock", "a") if fcntl else None
+    while True:
+        try:
+            # One process replays at a time, so the journal is drained in order
+            if lock_file is None or _try_lock(lock_file):
+                try:
+                    replay(process)
+                    if _entries == 0 and time.monotonic() - last_compact > INBOX_COMPACT_INTERVAL:
+                        compact()
+                        last_compact = time.monotonic()
+                finally:
+                    if lock_file is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                _refresh()
+        except Exception as e:
+            logger.error(f"Inbox replay failed: {e}")
+        _wakeup.wait(INBOX_RETRY_INTERVAL)
+        _wakeup.clear()
+
+def _try_lock(lock_file):
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+def close():
+    global _conn, _owner, _owner_file
+    with _lock:
+        if _conn is not None:
+            _conn.close()
+            _conn = None
+        if _owner_file is not None:
+            _owner_file.close()
+            os.remove(_owner_path(_owner))
+        _owner = _owner_file = None
+
+def stats():
+    with _lock:
+        data = dict(_counters)
+    data["entries"] = _entries
+    data["backlog"] = _queued
+    data["enabled"] = INBOX_ENABLED
+    return data
@@ -0,0 +1,124 @@
+import os
+import json
+import asyncio
+import logging
+import threading
+import cache
+from database import session_scope
+
+logger = logging.getLogger(__name__)
+
+# Live dashboard updates over Server-Sent Events (/stream). Outbox.commit publishes
+# every trade state it committed, and one broadcaster fans it out to the connected
+# dashboards. Each client holds only the latest unsent event per symbol, so a slow
+# client costs at most one event per instrument and never holds up the publisher.
+# With several workers, changes made by the others arrive through cache sync
+# (CACHE_SYNC_INTERVAL) and are read back from the database before being sent.
+# Under gunicorn every open stream holds one of the worker's threads (--threads in the
+# Procfile), so keep LIVE_MAX_CLIENTS well below it to leave threads for the webhooks.
+# Dashboards turned away fall back to reloading the page. Under uvicorn a stream is a coroutine.
+LIVE_MAX_CLIENTS = int(os.getenv("LIVE_MAX_CLIENTS", "16"))
+LIVE_HEARTBEAT = float(os.getenv("LIVE_HEARTBEAT", "15"))  # seconds; keeps proxies from closing idle streams
+
+HEARTBEAT = ": ping\n\n"
+
+_lock = threading.Lock()
+_subscribers = set()
+_counters = {"connects": 0, "disconnects": 0, "rejected": 0, "published": 0, "remote_published": 0}
+
+class Subscriber:
+    """One connected dashboard: the events it has not been sent yet, one per symbol, in change order."""
+    def __init__(self, loop=None):
+        self.pending = {}  # symbol -> encoded event
+        self.ready = threading.Event()
+        self.loop = loop  # Set for a client served on an event loop (asgi.py)
+        self.async_ready = asyncio.Event() if loop else None
+
+    def _wake(self):
+        if self.loop is None:
+            self.ready.set()
+        else:
+            self.loop.call_soon_threadsafe(self.async_ready.set)
+
+    def take(self):
+        with _lock:
+            events, self.pending = list(self.pending.values()), {}
+        return "".join(events)
+
+    def next_chunk(self, timeout=LIVE_HEARTBEAT):
+        """Block until there are events (or it is time for a heartbeat); the text to send."""
+        self.ready.wait(timeout)
+        self.ready.clear()
+        return self.take() or HEARTBEAT
+
+    async def next_chunk_async(self, timeout=LIVE_HEARTBEAT):
+        try:
+            await asyncio.wait_for(self.async_ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.async_ready.clear()
+        return self.take() or HEARTBEAT
+
+def subscribe(loop=None):
+    """A new Subscriber, or None when LIVE_MAX_CLIENTS are already connected."""
+    subscriber = Subscriber(loop)
+    with _lock:
+        if len(_subscribers) >= LIVE_MAX_CLIENTS:
+            _counters["rejected"] += 1
+            return None
+        _subscribers.add(subscriber)
+        _counters["connects"] += 1
+    return subscriber
+
+def unsubscribe(subscriber):
+    with _lock:
+        if subscriber in _subscribers:
+            _subscribers.discard(subscriber)
+            _counters["disconnects"] += 1
+
+def encode(state):
+    data = {
+        "symbol": state.symbol,
+        "status": state.current_status,
+        "last_update": state.last_action_time.isoformat() if state.last_action_time else None,
+        "last_candle_timestamp": state.last_candle_timestamp,
+        "last_signal_price": state.last_signal_price,
+    }
+    return f"event: state\ndata: {json.dumps(data)}\n\n"
+
+def publish(states, counter="published"):
+    """Send committed trade states to every connected client. Cheap when nobody is watching."""
+    if not _subscribers:
+        return
+    events = [(state.symbol, encode(state)) for state in states]
+    if not events:
+        return
+    with _lock:
+        subscribers = list(_subscribers)
+        for subscriber in subscribers:
+            for symbol, event in events:
+                subscriber.pending.pop(symbol, None)  # Re-append, so the order is that of the changes
+                subscriber.pending[symbol] = event
+        _counters[counter] += len(events)
+    for subscriber in subscribers:
+        subscriber._wake()
+
+def _remote_changes(symbols):
+    """Cache sync listener: states other workers committed, read back and published."""
+    if not _subscribers:
+        return
+    try:
+        with session_scope() as db:
+            states = cache.get_states(db, sorted(symbols))
+        publish(states.values(), counter="remote_published")
+    except Exception as e:
+        logger.error(f"Publishing remote state changes failed: {e}")
+
+def start():
+    cache.add_listener(_remote_changes)
+
+def stats():
+    with _lock:
+        data = dict(_counters)
+        data["clients"] = len(_subscribers)
+    return data
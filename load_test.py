@@ -0,0 +1,150 @@
+"""
+Load test comparing the sync (gunicorn + Flask) and async (uvicorn + asgi.py) servers.
+
+Each mode is started as a real server on a scratch database. Alerts for many symbols
+are then fired at /webhook with a fixed number of requests in flight, and throughput
+and latency percentiles are reported. Outbound jobs have no Telegram/Quantman
+configured, so this measures the webhook path itself.
+
+    python load_test.py                                   # both modes on scratch SQLite
+    python load_test.py --mode asgi --concurrency 1000
+    python load_test.py --database-url postgresql://... --gunicorn-workers 4
+
+Prints one JSON object per mode.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+SERVERS = {
+    "sync": lambda args, port: ["gunicorn", "app:app", "--bind", f"127.0.0.1:{port}",
+                                "--workers", str(args.gunicorn_workers), "--threads", str(args.gunicorn_threads)],
+    "asgi": lambda args, port: ["uvicorn", "asgi:app", "--host", "127.0.0.1", "--port", str(port),
+                                "--log-level", "warning"],
+}
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def seed(database_url, symbols):
+    env = dict(os.environ, DATABASE_URL=database_url)
+    script = (
+        "from database import Base, engine, SessionLocal, Instrument\n"
+        "Base.metadata.drop_all(bind=engine)\n"
+        "Base.metadata.create_all(bind=engine)\n"
+        "db = SessionLocal()\n"
+        f"db.add_all([Instrument(symbol=f'LOAD{{i}}', timeframe='1m') for i in range({symbols})])\n"
+        "db.commit()\n"
+    )
+    subprocess.check_call([sys.executable, "-c", script], env=env)
+
+def wait_until_up(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server on port {port} did not come up")
+
+async def post(port, path, body):
+    """Minimal HTTP/1.1 POST over a fresh connection; returns (status, seconds)."""
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    data = json.dumps(body).encode()
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode() + data
+    )
+    await writer.drain()
+    status_line = await reader.readline()
+    await reader.read()
+    writer.close()
+    return int(status_line.split()[1]), time.perf_counter() - start
+
+async def fire(port, payloads, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(payload):
+        nonlocal errors
+        async with semaphore:
+            try:
+                status, seconds = await post(port, "/webhook", payload)
+            except OSError:
+                errors += 1
+                return
+            if status != 200:
+                errors += 1
+            latencies.append(seconds)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(payload) for payload in payloads))
+    return latencies, errors, time.perf_counter() - start
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return round(sorted_values[min(int(len(sorted_values) * p), len(sorted_values) - 1)] * 1000, 2)
+
+def run(mode, args):
+    seed(args.database_url, args.symbols)
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=args.database_url, DISPATCH_MODE="async", TELEGRAM_BOT_TOKEN="",
+               TELEGRAM_CHAT_ID="", EVENT_LOG_FLUSH_INTERVAL="1")
+    server = subprocess.Popen(SERVERS[mode](args, port), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up(port)
+        # Alternate ENTRY/EXIT per symbol on distinct candles so every alert does real work
+        payloads = []
+        for n in range(args.requests):
+            symbol, cycle = n % args.symbols, n // args.symbols
+            payloads.append({"symbol": f"LOAD{symbol}", "signal": "ENTRY_LONG" if cycle % 2 == 0 else "EXIT_LONG",
+                             "price": "100", "timestamp": f"C{cycle}"})
+        latencies, errors, elapsed = asyncio.run(fire(port, payloads, args.concurrency))
+    finally:
+        server.terminate()
+        server.wait()
+    latencies.sort()
+    return {
+        "mode": mode,
+        "database": args.database_url.split(":", 1)[0],
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "symbols": args.symbols,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(len(payloads) / elapsed, 1),
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "max_ms": percentile(latencies, 1.0),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=sorted(SERVERS), help="Server to test; default runs both")
+    parser.add_argument("--database-url", help="Defaults to a scratch SQLite file")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200, help="Requests in flight at once")
+    parser.add_argument("--symbols", type=int, default=50)
+    parser.add_argument("--gunicorn-workers", type=int, default=1)
+    parser.add_argument("--gunicorn-threads", type=int, default=8)
+    args = parser.parse_args()
+
+    if not args.database_url:
+        args.database_url = "sqlite:///" + os.path.join(tempfile.gettempdir(), "load_test.db")
+    for mode in [args.mode] if args.mode else ["sync", "asgi"]:
+        print(json.dumps(run(mode, args)), flush=True)
+
+if __name__ == "__main__":
+    main()
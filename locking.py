@@ -0,0 +1,119 @@
+import os
+import zlib
+import asyncio
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from sqlalchemy.dialects import postgresql, sqlite
+from database import DATABASE_URL, TradeState
+import cache
+import metrics
+
+# How signals for the same symbol are serialized:
+#   row   - SELECT ... FOR UPDATE on the trade_states row (Postgres; works across workers)
+#   local - striped in-process lock table (SQLite, single worker or single host)
+#   none  - no lock; the conditional state UPDATE in cache.save_state still rejects lost updates
+#   auto  - row on Postgres, local otherwise
+SIGNAL_LOCK_MODE = os.getenv("SIGNAL_LOCK_MODE", "auto").lower()
+SIGNAL_LOCK_STRIPES = int(os.getenv("SIGNAL_LOCK_STRIPES", "64"))
+
+if SIGNAL_LOCK_MODE == "auto":
+    SIGNAL_LOCK_MODE = "row" if DATABASE_URL.startswith("postgres") else "local"
+
+# A fixed number of locks shared by hash, so memory stays constant however many
+# symbols are tracked while unrelated symbols almost never wait on each other.
+_stripes = [threading.Lock() for _ in range(max(SIGNAL_LOCK_STRIPES, 1))]
+
+def _stripe_index(symbol):
+    return zlib.crc32(symbol.encode()) % len(_stripes)
+
+@contextmanager
+def symbol_lock(db, symbol):
+    """
+    Hold the symbol's lock for the duration of the block. In row mode this yields the
+    state read under the row lock (always fresh); otherwise it yields None and the
+    caller reads through the cache.
+    """
+    with symbols_lock(db, [symbol]) as states:
+        yield states[symbol] if states is not None else None
+
+@contextmanager
+def symbols_lock(db, symbols):
+    """
+    Lock several symbols at once, always in the same order so overlapping batches
+    cannot deadlock. Yields {symbol: state} read under the row locks in row mode,
+    otherwise None. Any transaction left open on exit is rolled back so a row lock
+    never outlives the block.
+    """
+    if SIGNAL_LOCK_MODE == "row":
+        try:
+            with metrics.stage("lock"):
+                states = _lock_rows(db, sorted(set(symbols))) if symbols else {}
+            yield states
+        finally:
+            if db.in_transaction():
+                db.rollback()
+    elif SIGNAL_LOCK_MODE == "local":
+        stripes = [_stripes[i] for i in sorted({_stripe_index(symbol) for symbol in symbols})]
+        with metrics.stage("lock"):
+            for lock in stripes:
+                lock.acquire()
+        try:
+            yield None
+        finally:
+            for lock in reversed(stripes):
+                lock.release()
+    else:
+        yield None
+
+@asynccontextmanager
+async def symbol_lock_async(db, symbol):
+    """
+    symbol_lock for an AsyncSession (the ASGI server). Local mode takes the same stripe
+    as the sync path, waiting in a thread only when the stripe is already held, so the
+    event loop never blocks and Flask routes in the same process are still excluded.
+    """
+    if SIGNAL_LOCK_MODE == "row":
+        try:
+            with metrics.stage("lock"):
+                states = await cache.load_states_async(db, [symbol], for_update=True)
+                if not states[symbol].persisted:
+                    await db.execute(_insert_missing(db, [symbol]))
+                    states = await cache.load_states_async(db, [symbol], for_update=True)
+            yield states[symbol]
+        finally:
+            if db.in_transaction():
+                await db.rollback()
+    elif SIGNAL_LOCK_MODE == "local":
+        lock = _stripes[_stripe_index(symbol)]
+        with metrics.stage("lock"):
+            if not lock.acquire(blocking=False):
+                waiter = asyncio.ensure_future(asyncio.to_thread(lock.acquire))
+                try:
+                    await asyncio.shield(waiter)
+                except asyncio.CancelledError:
+                    # The thread still gets the lock eventually; hand it straight back
+                    waiter.add_done_callback(lambda _: lock.release())
+                    raise
+        try:
+            yield None
+        finally:
+            lock.release()
+    else:
+        yield None
+
+def _insert_missing(db, symbols):
+    dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+    return (
+        dialect.insert(TradeState)
+        .values([{"symbol": symbol, "current_status": "NONE"} for symbol in symbols])
+        .on_conflict_do_nothing()
+    )
+
+def _lock_rows(db, symbols):
+    states = cache.load_states(db, symbols, for_update=True)
+    missing = [symbol for symbol, state in states.items() if not state.persisted]
+    if missing:
+        # Nothing to lock yet: create the rows (losing a race here is fine) and lock those
+        db.execute(_insert_missing(db, missing))
+        states.update(cache.load_states(db, missing, for_update=True))
+    return states
@@ -1,66 +1,484 @@
-import requests
-from datetime import datetime
-from database import TradeState, Instrument
-from telegram_bot import send_telegram_message
-
-def trigger_quantman(url, signal_type, symbol):
-    if not url:
-        return
-    try:
-        # Quantman expects a GET request to the webhook URL
-        response = requests.get(url, timeout=5)
-        if response.status_code == 200:
-            print(f"Quantman Webhook Triggered for {symbol} ({signal_type})")
+import os
+import html
+import time
+import logging
+from datetime import datetime, timezone
+from sqlalchemy.exc import IntegrityError
+from telegram_bot import send_telegram_message, TelegramUnavailable, TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, TELEGRAM_MAX_LENGTH
+import dispatcher
+import cache
+import locking
+import dedupe
+import event_log
+import metrics
+import broker
+import signals
+import market_hours
+import live
+
+logger = logging.getLogger(__name__)
+
+STALE_STATE_RETRIES = 3
+MESSAGE_SEPARATOR = "\n\n──────────\n\n"
+# Telegram messages queued within this many seconds of each other go out as one digest
+TELEGRAM_DIGEST_WINDOW = float(os.getenv("TELEGRAM_DIGEST_WINDOW", "1"))
+# What an entry for the opposite side of an open trade does, unless the instrument says otherwise:
+# reverse (close, then enter), ignore (keep the open trade) or overwrite (enter without a close order)
+REVERSAL_MODES = ("reverse", "ignore", "overwrite")
+REVERSAL_MODE = os.getenv("REVERSAL_MODE", "reverse")
+
+@dispatcher.batch_handler("telegram", window=TELEGRAM_DIGEST_WINDOW)
+def deliver_telegram(payloads):
+    """
+    Send queued messages as digests of as many messages as fit in one Telegram
+    message. Each digest sent is dropped from payloads, so a retry resumes after it.
+    A digest Telegram turns down for good is sent again one message at a time, so
+    only the message it objects to is left in payloads and fails.
+    """
+    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
+        return True  # Nothing to deliver to; not worth retrying
+    while True:
+        pending = [payload for payload in payloads if not payload.get("rejected")]
+        if not pending:
+            return not payloads
+        text, count = pending[0]["message"], 1
+        while (count < len(pending) and not pending[0].get("alone") and not pending[count].get("alone")
+               and len(text) + len(MESSAGE_SEPARATOR) + len(pending[count]["message"]) <= TELEGRAM_MAX_LENGTH):
+            text += MESSAGE_SEPARATOR + pending[count]["message"]
+            count += 1
+        try:
+            with metrics.stage("telegram_send"):
+                sent = send_telegram_message(text)
+        except TelegramUnavailable as e:
+            raise dispatcher.RetryableError(f"Telegram send failed: {e}")
+        digest = pending[:count]
+        if sent:
+            payloads[:] = [payload for payload in payloads if not any(payload is p for p in digest)]
+        elif count > 1:
+            for payload in digest:
+                payload["alone"] = True
         else:
-            print(f"Quantman Webhook Failed: {response.status_code} - {response.text}")
-    except Exception as e:
-        print(f"Quantman Webhook Error: {e}")
+            logger.error(f"Telegram rejected a message, dropping it: {text[:50]}...")
+            digest[0]["rejected"] = True
+
+@dispatcher.handler("quantman")
+def deliver_quantman(payload):
+    """
+    Fire all of the order's targets at once. Targets that succeeded or failed for good
+    are dropped from the payload, so a retry only repeats the ones that were unreachable.
+    A reversal carries its entry under "then": it goes out right after the close, on the
+    same worker and connections, and only if every close target went through.
+    """
+    if "targets" not in payload:
+        # Job queued before broker targets existed
+        payload["targets"] = [{"id": None, "name": "quantman", "url": payload["url"]}] if payload.get("url") else []
+    while True:
+        targets = payload["targets"]
+        with metrics.stage("quantman_trigger"):
+            results = broker.fire(targets, payload["signal"], payload["symbol"])
+        broker.record(payload["symbol"], payload["signal"], results)
+        payload.setdefault("failed", []).extend(r["target"] for r in results if not r["ok"] and not r["retryable"])
+        payload["targets"] = [target for target, r in zip(targets, results) if r["retryable"]]
+        if payload["targets"]:
+            raise dispatcher.RetryableError(f"{len(payload['targets'])} target(s) unreachable")
+        then = payload.pop("then", None)
+        if not then:
+            return not payload["failed"]
+        if payload["failed"]:
+            # The old position may still be open at the broker; entering now would stack the new one on it
+            logger.warning(f"Skipping {then['signal']} for {payload['symbol']}: close failed on {', '.join(payload['failed'])}")
+            return False
+        payload["signal"], payload["targets"] = then["signal"], then["targets"]
+
+class Outbox:
+    """
+    Everything a decision wants written: changed trade states plus the Telegram
+    messages and Quantman orders that go with them. commit() persists it all in
+    one transaction and hands the jobs to the dispatcher.
+    """
+    def __init__(self):
+        self.states = {}
+        self.messages = []  # (symbol, text)
+        self.orders = []  # (symbol, targets, signal_type, then): then is (targets, signal_type) to send next, or None
+
+    def changed(self, state):
+        self.states[state.symbol] = state
+
+    def notify(self, symbol, message):
+        self.messages.append((symbol, message))
+
+    def order(self, symbol, targets, signal_type):
+        if targets:
+            self.orders.append((symbol, targets, signal_type, None))
+
+    def reverse(self, symbol, close_targets, entry_targets, signal_type):
+        """Close, then entry, as one order job, so the entry can never reach the broker first."""
+        if not close_targets or not entry_targets:
+            self.order(symbol, close_targets, "EXIT")
+            self.order(symbol, entry_targets, signal_type)
+        else:
+            self.orders.append((symbol, close_targets, "EXIT", (entry_targets, signal_type)))
+
+    def commit(self, db, coalesce_messages=False):
+        for state in self.states.values():
+            cache.save_state(db, state)
+        # State and outbound jobs land in one commit; delivery happens in the background
+        dispatcher.commit(db, self._enqueue(db, coalesce_messages))
+        for state in self.states.values():
+            cache.put_state(state)
+        live.publish(self.states.values())
+
+    async def commit_async(self, db, coalesce_messages=False):
+        """commit for an AsyncSession (the ASGI server)."""
+        for state in self.states.values():
+            await cache.save_state_async(db, state)
+        await dispatcher.commit_async(db, self._enqueue(db, coalesce_messages))
+        for state in self.states.values():
+            cache.put_state(state)
+        live.publish(self.states.values())
+
+    def _enqueue(self, db, coalesce_messages):
+        # Orders go to the symbol's shard worker, so one symbol's orders reach the broker in
+        # commit order. Telegram messages take their own lane and are not ordered against them.
+        jobs = []
+        for symbol, targets, signal_type, then in self.orders:
+            payload = {"symbol": symbol, "signal": signal_type, "targets": broker.target_payload(targets)}
+            if then:
+                payload["then"] = {"signal": then[1], "targets": broker.target_payload(then[0])}
+            jobs.append(dispatcher.enqueue(db, symbol, "quantman", payload))
+        messages = coalesce(self.messages) if coalesce_messages else self.messages
+        jobs.extend(dispatcher.enqueue(db, symbol, "telegram", {"message": text}) for symbol, text in messages)
+        return jobs
+
+def _h(value):
+    """Alert-supplied text made safe for a Telegram message sent with parse_mode HTML."""
+    return html.escape(str(value))
+
+def coalesce(messages, limit=TELEGRAM_MAX_LENGTH):
+    """Merge (symbol, text) messages into as few Telegram-sized messages as possible, keeping their order."""
+    merged = []
+    for symbol, text in messages:
+        if merged and len(merged[-1][1]) + len(MESSAGE_SEPARATOR) + len(text) <= limit:
+            merged[-1] = (merged[-1][0], merged[-1][1] + MESSAGE_SEPARATOR + text)
+        else:
+            merged.append((symbol, text))
+    return merged
 
 def process_signal(payload, db):
     """
     Process incoming webhook signal from TradingView.
     Payload expected format:
     {
-        "symbol": "NIFTY",
-        "signal": "ENTRY_LONG" | "ENTRY_SHORT" | "EXIT_LONG" | "EXIT_SHORT",
+        "symbol": "NIFTY" (or "NSE:NIFTY", or one of the instrument's symbol aliases),
+        "signal": "ENTRY_LONG" | "ENTRY_SHORT" | "EXIT_LONG" | "EXIT_SHORT" (or any spelling in signals.py),
         "price": "19500",
         "timestamp": "2023-10-27T10:15:00Z" (Candle Time)
     }
     """
-    symbol = payload.get("symbol")
+    start = time.perf_counter()
+    try:
+        result = _with_stale_retry(db, [_ticker(payload)], lambda: _process_signal(payload, db))
+    except Exception as e:
+        result = {"status": "error", "message": str(e)}
+        event_log.record(payload, result)
+        metrics.record_signal(_metric_symbol(payload), result, time.perf_counter() - start)
+        raise
+    event_log.record(payload, result)
+    metrics.record_signal(_metric_symbol(payload), result, time.perf_counter() - start)
+    return result
+
+async def process_signal_async(payload, db):
+    """process_signal for an AsyncSession: same decisions, the database calls are awaited."""
+    start = time.perf_counter()
+    try:
+        result = await _with_stale_retry_async(db, [_ticker(payload)], lambda: _process_signal_async(payload, db))
+    except Exception as e:
+        result = {"status": "error", "message": str(e)}
+        event_log.record(payload, result)
+        metrics.record_signal(_metric_symbol(payload), result, time.perf_counter() - start)
+        raise
+    event_log.record(payload, result)
+    metrics.record_signal(_metric_symbol(payload), result, time.perf_counter() - start)
+    return result
+
+def process_signals_batch(payloads, db, check_session=True):
+    """
+    Process a burst of alerts (same format as process_signal) in one transaction.
+    Instruments and states for all symbols are loaded with one query each, each
+    symbol's signals are applied in candle-time order, and the Telegram messages
+    are merged into as few sends as possible. Returns one result per payload, in
+    input order. check_session=False skips the market hours gate, for deferred
+    alerts being released at the session open.
+    """
+    symbols = [_ticker(payload) for payload in payloads if isinstance(payload, dict)]
+    start = time.perf_counter()
+    try:
+        results = _with_stale_retry(db, symbols, lambda: _process_batch(payloads, db, check_session))
+    except Exception as e:
+        results = [{"status": "error", "message": str(e)} for _ in payloads]
+        _record_batch(payloads, results, start)
+        raise
+    _record_batch(payloads, results, start)
+    return results
+
+def _record_batch(payloads, results, start):
+    # Every signal in a batch shares the batch's latency
+    elapsed = time.perf_counter() - start
+    for payload, result in zip(payloads, results):
+        event_log.record(payload, result)
+        metrics.record_signal(_metric_symbol(payload), result, elapsed)
+
+def _metric_symbol(payload):
+    # Anyone can post any ticker: only tracked instruments get a series of their own
+    symbol = _ticker(payload) if isinstance(payload, dict) else None
+    return cache.tracked_symbol(symbol) or "untracked"
+
+def _with_stale_retry(db, symbols, fn):
+    for attempt in range(STALE_STATE_RETRIES):
+        try:
+            return fn()
+        except (cache.StaleStateError, IntegrityError) as e:
+            # Another worker wrote a state after we read it. Reload and decide again.
+            db.rollback()
+            for symbol in symbols:
+                cache.invalidate(cache.canonical_symbol(symbol))
+            logger.info(f"Stale cached state for {', '.join(map(str, symbols))} ({type(e).__name__}), retrying")
+    return fn()
+
+async def _with_stale_retry_async(db, symbols, fn):
+    for attempt in range(STALE_STATE_RETRIES):
+        try:
+            return await fn()
+        except (cache.StaleStateError, IntegrityError) as e:
+            await db.rollback()
+            for symbol in symbols:
+                cache.invalidate(cache.canonical_symbol(symbol))
+            logger.info(f"Stale cached state for {', '.join(map(str, symbols))} ({type(e).__name__}), retrying")
+    return await fn()
+
+def _ticker(payload):
+    return signals.canonical_symbol(payload.get("symbol"))
+
+def _parse(payload):
+    # The signal stays raw here: it is resolved against the instrument's own aliases once that is known
+    symbol = _ticker(payload)
     signal_type = payload.get("signal")
     price = payload.get("price")
     candle_timestamp = payload.get("timestamp") # This is crucial for FLIP detection
-    
     if not all([symbol, signal_type, candle_timestamp]):
-        return {"status": "error", "message": "Missing required fields"}
+        return None
+    return symbol, signal_type, price, candle_timestamp
+
+def _duplicate():
+    return {"status": "ignored", "message": "Duplicate alert - Ignored"}
+
+def _untracked(symbol):
+    return {"status": "ignored", "message": f"Instrument {symbol} is not tracked or inactive."}
 
-    # specific normalization for symbol if needed (e.g. remove exchange prefix)
+def _unknown_signal():
+    return {"status": "error", "message": "Unknown Signal Type"}
+
+def _process_signal(payload, db):
+    with metrics.stage("parse"):
+        parsed = _parse(payload)
+    if not parsed:
+        return {"status": "error", "message": "Missing required fields"}
+    symbol, signal_type, price, candle_timestamp = parsed
     
-    # 1. Check if Instrument is Active
-    instrument = db.query(Instrument).filter(Instrument.symbol == symbol, Instrument.active == True).first()
+    # 1. Check if Instrument is Active (served from the process cache when warm)
+    with metrics.stage("instrument_lookup"):
+        instrument = cache.get_instrument(db, symbol)
+    if not instrument:
+        return _untracked(symbol)
+    symbol = instrument.symbol  # The ticker may have been one of its aliases
+    signal = signals.resolve(signal_type, instrument.signal_aliases)
+    if signal is None:
+        return _unknown_signal()
+    # Retried deliveries of an alert we just handled are turned away before any DB work
+    # (the instrument normally comes from the cache); the key is that of the resolved alert
+    key = dedupe.key_for(payload, symbol, signal.value)
+    if dedupe.seen(key):
+        return _duplicate()
+    action, release_at = market_hours.gate(instrument)
+    if action == "drop":
+        return market_hours.dropped()
+    if action == "defer":
+        db.add(market_hours.deferral(symbol, payload, release_at))
+        db.commit()
+        return market_hours.deferred(release_at)
+
+    # 2. Get Current State, holding the symbol's lock so concurrent signals for it
+    # are decided one at a time. A symbol without a row starts as NONE and is only
+    # inserted when a trade is actually taken.
+    with locking.symbol_lock(db, symbol) as locked_state:
+        if not dedupe.claim(db, key, symbol):
+            return _duplicate()
+        with metrics.stage("state_lookup"):
+            state = locked_state or cache.get_state(db, symbol)
+        outbox = Outbox()
+        result = _apply_signal(instrument, state, signal, price, candle_timestamp, outbox)
+        if locked_state is None and not outbox.states and cache.recheck_states(db, {symbol: state}):
+            # Decided without a write on a cached state another worker has since changed
+            outbox = Outbox()
+            result = _apply_signal(instrument, cache.get_state(db, symbol), signal, price, candle_timestamp, outbox)
+        with metrics.stage("commit"):
+            outbox.commit(db)
+        dedupe.remember(key)
+        return result
+
+async def _process_signal_async(payload, db):
+    with metrics.stage("parse"):
+        parsed = _parse(payload)
+    if not parsed:
+        return {"status": "error", "message": "Missing required fields"}
+    symbol, signal_type, price, candle_timestamp = parsed
+
+    with metrics.stage("instrument_lookup"):
+        instrument = (await cache.get_instruments_async(db, [symbol]))[symbol]
     if not instrument:
-        return {"status": "ignored", "message": f"Instrument {symbol} is not tracked or inactive."}
+        return _untracked(symbol)
+    symbol = instrument.symbol
+    signal = signals.resolve(signal_type, instrument.signal_aliases)
+    if signal is None:
+        return _unknown_signal()
+    key = dedupe.key_for(payload, symbol, signal.value)
+    if dedupe.seen(key):
+        return _duplicate()
+    action, release_at = market_hours.gate(instrument)
+    if action == "drop":
+        return market_hours.dropped()
+    if action == "defer":
+        db.add(market_hours.deferral(symbol, payload, release_at))
+        await db.commit()
+        return market_hours.deferred(release_at)
+
+    async with locking.symbol_lock_async(db, symbol) as locked_state:
+        if not await dedupe.claim_async(db, key, symbol):
+            return _duplicate()
+        with metrics.stage("state_lookup"):
+            state = locked_state or (await cache.get_states_async(db, [symbol]))[symbol]
+        outbox = Outbox()
+        result = _apply_signal(instrument, state, signal, price, candle_timestamp, outbox)
+        if locked_state is None and not outbox.states and await cache.recheck_states_async(db, {symbol: state}):
+            outbox = Outbox()
+            state = (await cache.get_states_async(db, [symbol]))[symbol]
+            result = _apply_signal(instrument, state, signal, price, candle_timestamp, outbox)
+        with metrics.stage("commit"):
+            await outbox.commit_async(db)
+        dedupe.remember(key)
+        return result
+
+def _process_batch(payloads, db, check_session=True):
+    results = [None] * len(payloads)
+    parsed_signals = []
+    keys = {}  # key -> index of the first signal carrying it
+    for index, payload in enumerate(payloads):
+        parsed = _parse(payload) if isinstance(payload, dict) else None
+        if not parsed:
+            results[index] = {"status": "error", "message": "Missing required fields"}
+        else:
+            parsed_signals.append((index,) + parsed)
+
+    with metrics.stage("instrument_lookup"):
+        instruments = cache.get_instruments(db, sorted({signal[1] for signal in parsed_signals}))
+    pending = []  # (key, index, instrument, signal, price, candle_timestamp)
+    for index, symbol, signal_type, price, candle_timestamp in parsed_signals:
+        instrument = instruments.get(symbol)
+        signal = instrument and signals.resolve(signal_type, instrument.signal_aliases)
+        key = signal and dedupe.key_for(payloads[index], instrument.symbol, signal.value)
+        duplicate = signal is not None and (dedupe.seen(key) or key in keys)
+        action, release_at = market_hours.gate(instrument) if signal and not duplicate and check_session else (None, None)
+        if not instrument:
+            results[index] = _untracked(symbol)
+        elif signal is None:
+            results[index] = _unknown_signal()
+        elif duplicate:
+            results[index] = _duplicate()
+        elif action == "drop":
+            results[index] = market_hours.dropped()
+        elif action == "defer":
+            # Stored in the batch's transaction, committed with everything else
+            db.add(market_hours.deferral(instrument.symbol, payloads[index], release_at))
+            results[index] = market_hours.deferred(release_at)
+        else:
+            keys[key] = index
+            pending.append((key, index, instrument, signal, price, candle_timestamp))
+    tracked = sorted({signal[2].symbol for signal in pending})
+
+    with locking.symbols_lock(db, tracked) as locked_states:
+        claimed = {key: instrument.symbol for key, _, instrument, *_ in pending}
+        for key in dedupe.claim_many(db, claimed):
+            results[keys[key]] = _duplicate()
+        with metrics.stage("state_lookup"):
+            states = locked_states or cache.get_states(db, tracked)
+        decisions, outbox = _decide_batch(pending, states, results)
+        unwritten = {symbol: state for symbol, state in states.items() if symbol not in outbox.states}
+        if locked_states is None and cache.recheck_states(db, unwritten):
+            # Symbols the batch wrote nothing for were decided on cached states another worker has since changed
+            decisions, outbox = _decide_batch(pending, cache.get_states(db, tracked), results)
+        for index, result in decisions.items():
+            results[index] = result
+        with metrics.stage("commit"):
+            outbox.commit(db, coalesce_messages=True)
+        for key in claimed:
+            dedupe.remember(key)
 
-    # 2. Get Current State
-    state = db.query(TradeState).filter(TradeState.symbol == symbol).first()
-    if not state:
-        state = TradeState(symbol=symbol)
-        db.add(state)
-        db.commit() # Ensure we have an ID
-        db.refresh(state)
+    for index, payload in enumerate(payloads):
+        results[index]["symbol"] = payload.get("symbol") if isinstance(payload, dict) else None
+    return results
 
-    timestamp_str = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+def _decide_batch(pending, states, results):
+    """Apply a batch's pending signals, skipping duplicates; their results by index and the Outbox to commit."""
+    decisions, outbox = {}, Outbox()
+    for _, index, instrument, signal, price, candle_timestamp in _in_candle_order(pending):
+        if results[index] is None:  # Not a duplicate
+            decisions[index] = _apply_signal(instrument, states[instrument.symbol], signal, price, candle_timestamp, outbox)
+    return decisions, outbox
+
+def _candle_time(candle_timestamp):
+    """Epoch seconds of a TradingView {{time}}: epoch seconds or milliseconds, or ISO 8601. None if neither."""
+    try:
+        value = float(candle_timestamp)
+        return value / 1000 if value > 1e11 else value
+    except (TypeError, ValueError):
+        pass
+    try:
+        parsed = datetime.fromisoformat(str(candle_timestamp).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return (parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)).timestamp()
+
+def _in_candle_order(pending):
+    """
+    Pending batch signals grouped by symbol. Within a symbol they are in candle time
+    order if every timestamp parses, in arrival order otherwise; same-candle alerts
+    keep their arrival order either way.
+    """
+    by_symbol = {}
+    for item in pending:
+        by_symbol.setdefault(item[2].symbol, []).append(item)
+    ordered = []
+    for symbol in sorted(by_symbol):
+        items = by_symbol[symbol]
+        times = [_candle_time(item[5]) for item in items]
+        if None not in times:
+            items = [item for _, item in sorted(zip(times, items), key=lambda pair: pair[0])]
+        ordered.extend(items)
+    return ordered
+
+def _apply_signal(instrument, state, signal, price, candle_timestamp, outbox):
+    """
+    Decide what the signals.Signal means for this state. Mutates the state and queues
+    side effects on the outbox.
+    """
+    symbol = instrument.symbol
     
     # --- FLIP ENTRY LOGIC ---
     # Detailed Requirement:
     # "if close at 10.15 ... after that again 10.15 candle show sell entry means we just closed that candle gives sell means called flip"
     # Action: DO NOT ENTER (Ignore Entry)
     
-    is_entry = "ENTRY" in signal_type.upper()
-    is_exit = "EXIT" in signal_type.upper()
-
-    if is_exit:
+    if signal.is_exit:
         if state.current_status != "NONE":
             # Just Close
             old_status = state.current_status
@@ -75,31 +493,29 @@ def process_signal(payload, db):
             state.last_candle_timestamp = candle_timestamp 
             state.last_signal_price = price
             
-            db.commit()
+            outbox.changed(state)
             
             # Send Notification with Entry Details
-            msg = f"🔴 <b>TRADE CLOSED</b>\nSymbol: {symbol}\nAction: Closed {old_status}\nPrice: {price}\nCandle Time: {candle_timestamp}\n\n🔍 <b>Entry Details:</b>\nEntry Time: {entry_time_str}\nEntry Price: {entry_price}"
-            msg = f"🔴 <b>TRADE CLOSED</b>\nSymbol: {symbol}\nAction: Closed {old_status}\nPrice: {price}\nCandle Time: {candle_timestamp}\n\n🔍 <b>Entry Details:</b>\nEntry Time: {entry_time_str}\nEntry Price: {entry_price}"
-            send_telegram_message(msg)
+            msg = f"🔴 <b>TRADE CLOSED</b>\nSymbol: {_h(symbol)}\nAction: Closed {old_status}\nPrice: {_h(price)}\nCandle Time: {_h(candle_timestamp)}\n\n🔍 <b>Entry Details:</b>\nEntry Time: {entry_time_str}\nEntry Price: {_h(entry_price)}"
+            outbox.notify(symbol, msg)
             
             # TRIGGER QUANTMAN CLOSE
-            if instrument.quantman_close_url:
-                trigger_quantman(instrument.quantman_close_url, "EXIT", symbol)
+            outbox.order(symbol, instrument.targets_for("close"), "EXIT")
 
             return {"status": "success", "message": "Trade Closed"}
         else:
              return {"status": "ignored", "message": "No open trade to close."}
 
-    elif is_entry:
+    elif signal.is_entry:
         # Check for FLIP (Entry on same candle as Close)
         if state.last_candle_timestamp == candle_timestamp:
             # This is a FLIP ENTRY - IGNORE IT
-            warning_msg = f"⚠️ <b>FLIP ENTRY DETECTED - NO TRADE</b>\nSymbol: {symbol}\nReason: Signal on same candle as Exit ({candle_timestamp}).\nAction: IGNORED."
-            send_telegram_message(warning_msg)
+            warning_msg = f"⚠️ <b>FLIP ENTRY DETECTED - NO TRADE</b>\nSymbol: {_h(symbol)}\nReason: Signal on same candle as Exit ({_h(candle_timestamp)}).\nAction: IGNORED."
+            outbox.notify(symbol, warning_msg)
             return {"status": "ignored", "message": "Flip Entry Detected - Ignored"}
             
         # Normal Entry Logic
-        new_status = "LONG" if "LONG" in signal_type.upper() else "SHORT"
+        new_status = signal.side
         
         # If already in same trade, ignore or update? Assuming ignore for now unless "Add" logic needed.
         if state.current_status == new_status:
@@ -110,29 +526,57 @@ def process_signal(payload, db):
         # So we assume explicit close comes first. If we receive ENTRY while OPEN opposite, we might need to Auto-Close first.
         # For safety strictly following "Close then Entry" pattern from user description.
         if state.current_status != "NONE" and state.current_status != new_status:
-             # Implicit Flip (Reversal) - If user sends just "ENTRY SHORT" while "LONG".
-             # But user emphasized specific "Flip" logic relating to same candle.
-             # I will treat this as a Reversal (Close + Open), unless timestamps match.
-             pass 
+            # Implicit Flip (Reversal) - If user sends just "ENTRY SHORT" while "LONG".
+            # Same-candle flips were already turned away above.
+            mode = instrument.reversal_mode or REVERSAL_MODE
+            if mode == "reverse":
+                return _reverse(instrument, state, new_status, price, candle_timestamp, outbox)
+            if mode == "ignore":
+                return {"status": "ignored", "message": f"Already {state.current_status} - Reversal Ignored"}
+            # overwrite: plain entry below, no close order
 
         state.current_status = new_status
         state.last_action_time = datetime.utcnow()
         state.last_candle_timestamp = candle_timestamp
         state.last_signal_price = price
+        outbox.changed(state)
         
-        db.commit()
-        
+        timestamp_str = state.last_action_time.strftime('%Y-%m-%d %H:%M:%S')
         color_emoji = "🟢" if new_status == "LONG" else "🔴"
-        msg = f"{color_emoji} <b>NEW TRADE ENTRY</b>\nSymbol: {symbol}\nDirection: {new_status}\nPrice: {price}\nCandle Time: {candle_timestamp}\nTime: {timestamp_str}"
-        msg = f"{color_emoji} <b>NEW TRADE ENTRY</b>\nSymbol: {symbol}\nDirection: {new_status}\nPrice: {price}\nCandle Time: {candle_timestamp}\nTime: {timestamp_str}"
-        send_telegram_message(msg)
+        msg = f"{color_emoji} <b>NEW TRADE ENTRY</b>\nSymbol: {_h(symbol)}\nDirection: {new_status}\nPrice: {_h(price)}\nCandle Time: {_h(candle_timestamp)}\nTime: {timestamp_str}"
+        outbox.notify(symbol, msg)
         
         # TRIGGER QUANTMAN ENTRY
-        if new_status == "LONG" and instrument.quantman_buy_url:
-            trigger_quantman(instrument.quantman_buy_url, "ENTRY_LONG", symbol)
-        elif new_status == "SHORT" and instrument.quantman_sell_url:
-            trigger_quantman(instrument.quantman_sell_url, "ENTRY_SHORT", symbol)
+        if new_status == "LONG":
+            outbox.order(symbol, instrument.targets_for("buy"), "ENTRY_LONG")
+        elif new_status == "SHORT":
+            outbox.order(symbol, instrument.targets_for("sell"), "ENTRY_SHORT")
         
         return {"status": "success", "message": f"Entered {new_status}"}
 
-    return {"status": "error", "message": "Unknown Signal Type"}
+    return _unknown_signal()
+
+def _reverse(instrument, state, new_status, price, candle_timestamp, outbox):
+    """
+    Close the open trade and enter the other side as one decision: a single state
+    write (so both land in the same transaction), one order job that sends the close
+    before the entry, and one Telegram message.
+    """
+    symbol = instrument.symbol
+    old_status = state.current_status
+    entry_time_str = state.last_action_time.strftime('%Y-%m-%d %H:%M:%S') if state.last_action_time else "N/A"
+    entry_price = state.last_signal_price if state.last_signal_price else "N/A"
+
+    state.current_status = new_status
+    state.last_action_time = datetime.utcnow()
+    state.last_candle_timestamp = candle_timestamp
+    state.last_signal_price = price
+    outbox.changed(state)
+
+    color_emoji = "🟢" if new_status == "LONG" else "🔴"
+    msg = f"🔁 <b>TRADE REVERSED</b>\nSymbol: {_h(symbol)}\nAction: Closed {old_status}, {color_emoji} Entered {new_status}\nPrice: {_h(price)}\nCandle Time: {_h(candle_timestamp)}\n\n🔍 <b>Closed Trade:</b>\nEntry Time: {entry_time_str}\nEntry Price: {_h(entry_price)}"
+    outbox.notify(symbol, msg)
+
+    entry_targets = instrument.targets_for("buy" if new_status == "LONG" else "sell")
+    outbox.reverse(symbol, instrument.targets_for("close"), entry_targets, f"ENTRY_{new_status}")
+    return {"status": "success", "message": f"Reversed {old_status} to {new_status}"}
@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from datetime import datetime, timedelta, time as clock
+from zoneinfo import ZoneInfo
+from sqlalchemy import select, delete, func
+from database import session_scope, MarketHoliday, DeferredSignal
+
+logger = logging.getLogger(__name__)
+
+# Trading sessions. An instrument with a market_session only trades inside it, on
+# MARKET_DAYS that are not holidays in its calendar. Outside, its alerts are processed
+# anyway, deferred to the next open or dropped (off_session). Open/close times are
+# precomputed per (session, calendar) into sorted lists of epoch seconds, so "is it
+# open" and "when does it open next" are one bisect each. Deferred alerts are stored
+# in deferred_signals and released by a single timer thread, in batches, at the open.
+MARKET_TIMEZONE = os.getenv("MARKET_TIMEZONE", "Asia/Kolkata")
+MARKET_DAYS = {int(day) for day in os.getenv("MARKET_DAYS", "0,1,2,3,4").split(",")}  # Monday = 0
+MARKET_CALENDAR = os.getenv("MARKET_CALENDAR", "NSE")
+MARKET_OFF_SESSION = os.getenv("MARKET_OFF_SESSION", "process")  # process, defer, drop
+MARKET_DEFER_TTL = float(os.getenv("MARKET_DEFER_TTL", "259200"))  # seconds; alerts the next open is further than this away are dropped
+MARKET_SCHEDULE_DAYS = int(os.getenv("MARKET_SCHEDULE_DAYS", "14"))  # days of sessions precomputed ahead
+MARKET_RELOAD_INTERVAL = float(os.getenv("MARKET_RELOAD_INTERVAL", "3600"))  # seconds between holiday reloads
+MARKET_RELEASE_BATCH = int(os.getenv("MARKET_RELEASE_BATCH", "200"))
+MARKET_POLL_INTERVAL = float(os.getenv("MARKET_POLL_INTERVAL", "30"))  # picks up alerts other workers deferred
+
+OFF_SESSION_MODES = ("process", "defer", "drop")
+
+_tz = ZoneInfo(MARKET_TIMEZONE)
+_lock = threading.Lock()
+_wakeup = threading.Event()
+_schedules = {}  # (session, calendar) -> Schedule
+_holidays = None  # calendar -> set of dates
+_holidays_loaded_at = 0
+_thread = None
+_counters = {"deferred": 0, "dropped": 0, "released": 0, "expired": 0, "release_batches": 0, "release_errors": 0}
+
+class Schedule:
+    """Open intervals of one session + calendar, as parallel sorted lists of epoch seconds."""
+    def __init__(self, opens, closes, valid_until):
+        self.opens = opens
+        self.closes = closes
+        self.valid_until = valid_until
+
+    def is_open(self, ts):
+        i = bisect.bisect_right(self.opens, ts) - 1
+        return i >= 0 and ts < self.closes[i]
+
+    def next_open(self, ts):
+        """Epoch seconds of the first open after ts, or None beyond the precomputed days."""
+        i = bisect.bisect_right(self.opens, ts)
+        return self.opens[i] if i < len(self.opens) else None
+
+def parse_session(session):
+    """'09:15-15:30' or '09:00-11:30,12:30-15:00' -> [(open, close)]; ValueError if malformed."""
+    windows = []
+    for part in session.split(","):
+        start, _, end = part.strip().partition("-")
+        windows.append((clock.fromisoformat(start.strip()), clock.fromisoformat(end.strip())))
+    return windows
+
+def _build(session, calendar, now):
+    windows = parse_session(session)
+    closed_days = (_holidays or {}).get(calendar, set())
+    today = datetime.fromtimestamp(now, _tz).date()
+    opens, closes = [], []
+    for offset in range(-1, MARKET_SCHEDULE_DAYS + 1):
+        day = today + timedelta(days=offset)
+        if day.weekday() not in MARKET_DAYS or day in closed_days:
+            continue
+        for start, end in windows:
+            open_at = datetime.combine(day, start, _tz)
+            close_at = datetime.combine(day + timedelta(days=1) if end <= start else day, end, _tz)  # Overnight session
+            opens.append(open_at.timestamp())
+            closes.append(close_at.timestamp())
+    order = sorted(range(len(opens)), key=opens.__getitem__)
+    valid_until = datetime.combine(today + timedelta(days=MARKET_SCHEDULE_DAYS - 1), clock(), _tz).timestamp()
+    return Schedule([opens[i] for i in order], [closes[i] for i in order], valid_until)
+
+def _schedule(session, calendar, now):
+    # No database work here: it runs on the event loop under asgi.py. Holidays are
+    # loaded by start() and refreshed by the release thread.
+    key = (session, calendar)
+    schedule = _schedules.get(key)
+    if schedule is None or now >= schedule.valid_until:
+        schedule = _build(session, calendar, now)
+        with _lock:
+            _schedules[key] = schedule
+    return schedule
+
+def reload():
+    """Reload holidays from the database and drop the precomputed schedules."""
+    global _holidays, _holidays_loaded_at
+    holidays = {}
+    try:
+        with session_scope() as db:
+            for calendar, day in db.execute(select(MarketHoliday.calendar, MarketHoliday.day)):
+                holidays.setdefault(calendar, set()).add(day)
+    except Exception as e:
+        logger.error(f"Loading market holidays failed: {e}")
+        return  # Keep the ones we have; the release thread tries again
+    with _lock:
+        _holidays = holidays
+        _holidays_loaded_at = time.monotonic()
+        _schedules.clear()
+
+def gate(instrument, now=None):
+    """
+    What to do with an alert for the instrument right now: ("open", None), ("defer",
+    release_at) or ("drop", None). Instruments without a session are always open.
+    """
+    if not instrument.market_session:
+        return "open", None
+    mode = instrument.off_session or MARKET_OFF_SESSION
+    if mode == "process":
+        return "open", None
+    now = time.time() if now is None else now
+    schedule = _schedule(instrument.market_session, instrument.market_calendar or MARKET_CALENDAR, now)
+    if schedule.is_open(now):
+        return "open", None
+    release_at = schedule.next_open(now)
+    if mode == "defer" and release_at is not None and release_at - now <= MARKET_DEFER_TTL:
+        return "defer", release_at
+    with _lock:
+        _counters["dropped"] += 1
+    return "drop", None
+
+def deferral(symbol, payload, release_at, now=None):
+    """The row that holds an alert until release_at; add it to the caller's transaction."""
+    now = time.time() if now is None else now
+    with _lock:
+        _counters["deferred"] += 1
+    return DeferredSignal(symbol=symbol, payload=json.dumps(payload), release_at=release_at,
+                          expires_at=now + MARKET_DEFER_TTL)
+
+def deferred(release_at):
+    """Result for an alert that was deferred; also tells the timer about the new release time."""
+    _wakeup.set()
+    opens = datetime.fromtimestamp(release_at, _tz).strftime('%Y-%m-%d %H:%M')
+    return {"status": "deferred", "message": f"Market closed - deferred to {opens}"}
+
+def dropped():
+    return {"status": "ignored", "message": "Market closed - signal dropped"}
+
+def release_due(process_batch, now=None):
+    """
+    Claim up to MARKET_RELEASE_BATCH deferred alerts that are due and run them through
+    process_batch(payloads, db, check_session=False) in the same transaction, so a
+    failure leaves them queued.
+    Returns how many were claimed.
+    """
+    now = time.time() if now is None else now
+    with session_scope() as db:
+        due = select(DeferredSignal.id).where(DeferredSignal.release_at <= now).order_by(DeferredSignal.id).limit(MARKET_RELEASE_BATCH)
+        rows = db.execute(
+            delete(DeferredSignal).where(DeferredSignal.id.in_(due))
+            .returning(DeferredSignal.id, DeferredSignal.payload, DeferredSignal.expires_at)
+        ).all()
+        rows.sort()
+        payloads = [json.loads(payload) for _, payload, expires_at in rows if expires_at > now]
+        if payloads:
+            process_batch(payloads, db, check_session=False)  # Commits the claim together with the decisions
+            # A stale-state retry inside process_batch rolls the claim back with everything else
+            db.execute(delete(DeferredSignal).where(DeferredSignal.id.in_([row[0] for row in rows])))
+        db.commit()
+    with _lock:
+        _counters["released"] += len(payloads)
+        _counters["expired"] += len(rows) - len(payloads)
+        _counters["release_batches"] += 1 if rows else 0
+    return len(rows)
+
+def _next_release():
+    with session_scope() as db:
+        return db.execute(select(func.min(DeferredSignal.release_at))).scalar()
+
+def start(process_batch):
+    """Start the timer thread that releases deferred alerts at the session open."""
+    global _thread
+    if _thread is not None:
+        return
+    reload()
+    _thread = threading.Thread(target=_release_loop, args=(process_batch,), name="market-release", daemon=True)
+    _thread.start()
+
+def _release_loop(process_batch):
+    while True:
+        wait = MARKET_POLL_INTERVAL
+        try:
+            if _holidays is None or time.monotonic() - _holidays_loaded_at > MARKET_RELOAD_INTERVAL:
+                reload()
+            while release_due(process_batch) == MARKET_RELEASE_BATCH:
+                pass  # A full batch: there may be more
+            next_release = _next_release()
+            if next_release is not None:
+                wait = min(max(next_release - time.time(), 0), MARKET_POLL_INTERVAL)
+        except Exception as e:
+            with _lock:
+                _counters["release_errors"] += 1
+            logger.error(f"Releasing deferred signals failed: {e}")
+        _wakeup.wait(wait)
+        _wakeup.clear()
+
+def stats():
+    with _lock:
+        data = dict(_counters)
+        data["schedules"] = len(_schedules)
+    return data
@@ -0,0 +1,200 @@
+import os
+import time
+import bisect
+import logging
+import inspect
+import threading
+from functools import wraps
+from contextvars import ContextVar
+from contextlib import contextmanager
+import startup
+
+logger = logging.getLogger(__name__)
+
+# In-process Prometheus-style metrics for the signal pipeline. Observing is a dict
+# lookup and a few integer increments; /metrics renders the text exposition format.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))  # 0 disables slow-request logging
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_registry = []
+_collectors = []
+_trace = ContextVar("metrics_trace", default=None)  # stage timings of the current request (thread or task)
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+def _format_labels(labelnames, key, extra=None):
+    pairs = [(name, value) for name, value in zip(labelnames, key)]
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # key -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = _label_key(self.labelnames, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[index] += 1
+            entry[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(key, list(entry)) for key, entry in self._values.items()]
+        for key, entry in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), entry[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', str(bound)))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {entry[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+STAGE_SECONDS = Histogram("signal_stage_seconds", "Time spent in each stage of the signal pipeline.", ["stage"])
+REQUEST_SECONDS = Histogram("webhook_request_seconds", "Webhook request latency.", ["endpoint"])
+SIGNAL_SECONDS = Histogram("signal_processing_seconds", "Time to decide and commit one signal, by outcome.", ["outcome"])
+SIGNALS = Counter("signals_total", "Signals processed, by symbol and outcome.", ["symbol", "outcome"])
+SLOW_REQUESTS = Counter("webhook_slow_requests_total", "Webhook requests slower than SLOW_REQUEST_MS.", ["endpoint"])
+
+def register_collector(fn):
+    """fn() returns [(name, type, help, [(labels dict, value), ...]), ...] computed at scrape time."""
+    _collectors.append(fn)
+
+@contextmanager
+def stage(name):
+    """Time a pipeline stage, and note it on the current request's trace for slow-request logs."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        stages = _trace.get()
+        if stages is not None:
+            stages.append((name, elapsed))
+
+def outcome(result):
+    """Collapse a process_signal result into success / ignored / flip / duplicate / error."""
+    status = result.get("status", "error")
+    if status == "ignored":
+        message = result.get("message") or ""
+        if message.startswith("Flip"):
+            return "flip"
+        if message.startswith("Duplicate"):
+            return "duplicate"
+    return status
+
+def record_signal(symbol, result, elapsed):
+    kind = outcome(result)
+    SIGNALS.inc(symbol=symbol or "", outcome=kind)
+    SIGNAL_SECONDS.observe(elapsed, outcome=kind)
+
+def track_request(endpoint):
+    """Decorator for webhook routes (sync or async): latency histogram plus optional slow-request logging."""
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                token, start = _trace.set([]), time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    _finish_request(endpoint, token, start)
+            return async_wrapper
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            token, start = _trace.set([]), time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _finish_request(endpoint, token, start)
+        return wrapper
+    return decorator
+
+def _finish_request(endpoint, token, start):
+    elapsed = time.perf_counter() - start
+    startup.first_webhook()
+    stages = _trace.get()
+    _trace.reset(token)
+    REQUEST_SECONDS.observe(elapsed, endpoint=endpoint)
+    if SLOW_REQUEST_MS and elapsed * 1000 > SLOW_REQUEST_MS:
+        SLOW_REQUESTS.inc(endpoint=endpoint)
+        breakdown = ", ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in stages)
+        logger.warning(f"Slow {endpoint} request: {elapsed * 1000:.1f}ms ({breakdown})")
+
+def from_stats(prefix, data, label=None):
+    """
+    Turn one of the module stats() dicts into gauge samples for a collector. Numeric
+    values become <prefix>_<key>; a dict of dicts (e.g. per host) is labelled by its key.
+    """
+    samples = {}
+    rows = data.items() if label else [(None, data)]
+    for label_value, values in rows:
+        for key, value in values.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            labels = {label: label_value} if label else {}
+            samples.setdefault(key, []).append((labels, value))
+    return [(f"{prefix}_{key}", "gauge", f"{prefix} {key} from /stats.", values) for key, values in samples.items()]
+
+def render():
+    """All metrics in the Prometheus text format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        try:
+            samples = collector()
+        except Exception as e:
+            logger.error(f"Metrics collector failed: {e}")
+            continue
+        for name, kind, documentation, values in samples:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in values:
+                names = tuple(labels)
+                lines.append(f"{name}{_format_labels(names, tuple(str(labels[n]) for n in names))} {value}")
+    return "\n".join(lines) + "\n"
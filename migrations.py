@@ -0,0 +1,101 @@
+"""
+Versioned schema migrations for SQLite and Postgres.
+
+    python migrations.py            # apply pending migrations (the release / pre-deploy step)
+    python migrations.py --status   # list applied and pending migrations
+
+Applied versions are recorded in schema_migrations. Each migration runs in its own
+transaction together with its version row, so a failed deploy can simply be retried.
+Migration 1 creates every table of the current models on a new database (and any that
+are missing on an old one), so later migrations must be written to be no-ops when
+their change is already there: use _add_column and friends, which check first.
+"""
+import sys
+import time
+import logging
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, MetaData, Table, inspect, select, insert, text
+from database import Base, engine
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_LOCK_ID = 7261504  # pg_advisory_xact_lock key, so two deploys never migrate at once
+
+schema_migrations = Table(
+    "schema_migrations", MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String),
+    Column("applied_at", DateTime, default=datetime.utcnow),
+)
+
+def _add_column(conn, table, column, ddl_type):
+    if column not in {c["name"] for c in inspect(conn).get_columns(table)}:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+
+def _create_tables(conn):
+    Base.metadata.create_all(bind=conn)
+
+def _instrument_columns(conn):
+    # Columns update_db.py used to add by hand, on SQLite only
+    for column in ("quantman_buy_url", "quantman_sell_url", "quantman_close_url", "reversal_mode"):
+        _add_column(conn, "instruments", column, "VARCHAR")
+
+def _market_hours(conn):
+    for column in ("market_session", "market_calendar", "off_session"):
+        _add_column(conn, "instruments", column, "VARCHAR")
+    _create_tables(conn)  # market_holidays, deferred_signals
+
+MIGRATIONS = [
+    (1, "create tables", _create_tables),
+    (2, "instrument quantman urls and reversal mode", _instrument_columns),
+    (3, "market hours and deferred signals", _market_hours),
+]
+
+def latest_version():
+    return MIGRATIONS[-1][0]
+
+def current_version(conn=None):
+    """Highest applied version; 0 for a database that was never migrated."""
+    if conn is None:
+        with engine.connect() as conn:
+            return current_version(conn)
+    if not inspect(conn).has_table("schema_migrations"):
+        return 0
+    return conn.execute(select(schema_migrations.c.version).order_by(schema_migrations.c.version.desc())).scalar() or 0
+
+def applied_versions():
+    with engine.connect() as conn:
+        if not inspect(conn).has_table("schema_migrations"):
+            return {}
+        return {row.version: row.applied_at for row in conn.execute(select(schema_migrations))}
+
+def upgrade():
+    """Apply every pending migration in order; returns the versions applied."""
+    applied = []
+    schema_migrations.create(bind=engine, checkfirst=True)
+    for version, name, migrate in MIGRATIONS:
+        with engine.begin() as conn:
+            if engine.dialect.name == "postgresql":
+                conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+            if conn.execute(select(schema_migrations.c.version).where(schema_migrations.c.version == version)).first():
+                continue
+            start = time.perf_counter()
+            migrate(conn)
+            conn.execute(insert(schema_migrations).values(version=version, name=name, applied_at=datetime.utcnow()))
+        logger.info(f"Applied migration {version} ({name}) in {(time.perf_counter() - start) * 1000:.0f}ms")
+        applied.append(version)
+    return applied
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if "--status" in sys.argv[1:]:
+        done = applied_versions()
+        for version, name, _ in MIGRATIONS:
+            print(f"{version:>4}  {'applied ' + done[version].isoformat() if version in done else 'pending':<35} {name}")
+        return
+    start = time.perf_counter()
+    applied = upgrade()
+    print(f"Schema at version {latest_version()} ({len(applied)} applied) in {time.perf_counter() - start:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Offline replay of recorded alerts through the live decision logic.
+
+Alerts are read from JSONL (one /webhook payload per line) or CSV (columns
+symbol, signal, price, timestamp; an /events/export.csv file works too) and fed
+to the same _apply_signal that process_signal uses. Trade states live in a
+dict, and the outbox only records which orders would have gone out: there is
+no database, Telegram or Quantman. Alerts are applied in file order, like they
+would have arrived.
+
+    python replay.py alerts.jsonl                          # per-symbol stats as JSON
+    python replay.py events.csv --reversal-mode ignore     # compare reversal handling
+    python replay.py alerts.jsonl --workers 8 --output trades.json
+
+With --workers a JSONL file is split into line-aligned byte ranges that are
+parsed in parallel, and the alerts, grouped by symbol, are then replayed with
+the symbols spread over the same processes. --output writes every trade as
+well as the stats.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import multiprocessing
+from collections import defaultdict
+from cache import InstrumentInfo, StateInfo
+from logic import REVERSAL_MODE, REVERSAL_MODES, _parse, _apply_signal
+import signals
+
+class RecordingOutbox:
+    """Stands in for logic.Outbox: keeps the order signals of the current alert and drops the rest."""
+    def __init__(self):
+        self.orders = []
+
+    def changed(self, state):
+        pass
+
+    def notify(self, symbol, message):
+        pass
+
+    def order(self, symbol, targets, signal_type):
+        self.orders.append(signal_type)
+
+    def reverse(self, symbol, close_targets, entry_targets, signal_type):
+        self.orders += ["EXIT", signal_type]
+
+class Book:
+    """One symbol's replay: its state, its trades and what happened to its alerts."""
+    def __init__(self, symbol, reversal_mode):
+        self.instrument = InstrumentInfo(id=None, symbol=symbol, timeframe=None, active=True, reversal_mode=reversal_mode)
+        self.state = StateInfo(symbol=symbol)
+        self.outbox = RecordingOutbox()
+        self.trades = []
+        self.open = None  # Trade not closed yet
+        self.counts = {"alerts": 0, "success": 0, "ignored": 0, "flips": 0, "errors": 0}
+
+    def apply(self, signal_type, price, candle_timestamp):
+        self.counts["alerts"] += 1
+        signal = signals.resolve(signal_type, self.instrument.signal_aliases)
+        if signal is None:
+            self.counts["errors"] += 1
+            return
+        result = _apply_signal(self.instrument, self.state, signal, price, candle_timestamp, self.outbox)
+        if result["status"] == "ignored" and result["message"].startswith("Flip"):
+            self.counts["flips"] += 1
+        self.counts["errors" if result["status"] == "error" else result["status"]] += 1
+        for order in self.outbox.orders:
+            if order == "EXIT":
+                self._close(price, candle_timestamp, "exit")
+            else:
+                self._close(price, candle_timestamp, "overwrite")  # Only set when an entry replaced an open trade
+                self.open = {"side": order[len("ENTRY_"):], "entry_time": candle_timestamp, "entry_price": price}
+        self.outbox.orders.clear()
+
+    def _close(self, price, candle_timestamp, closed_by):
+        trade, self.open = self.open, None
+        if trade is None:
+            return
+        trade.update(exit_time=candle_timestamp, exit_price=price, closed_by=closed_by, pnl=None)
+        entry, exit_ = _number(trade["entry_price"]), _number(price)
+        if entry is not None and exit_ is not None:
+            trade["pnl"] = exit_ - entry if trade["side"] == "LONG" else entry - exit_
+        self.trades.append(trade)
+
+    def result(self):
+        pnls = [trade["pnl"] for trade in self.trades if trade["pnl"] is not None]
+        wins = sum(1 for pnl in pnls if pnl > 0)
+        equity = peak = drawdown = 0.0
+        for pnl in pnls:
+            equity += pnl
+            peak = max(peak, equity)
+            drawdown = max(drawdown, peak - equity)
+        stats = dict(self.counts, trades=len(self.trades), open=self.open is not None, wins=wins,
+                     losses=sum(1 for pnl in pnls if pnl < 0), win_rate=round(wins / len(pnls), 4) if pnls else None,
+                     pnl=round(equity, 6), avg_pnl=round(equity / len(pnls), 6) if pnls else None,
+                     max_drawdown=round(drawdown, 6))
+        return {"stats": stats, "trades": self.trades, "open_trade": self.open}
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def read_alerts(path):
+    """Yield alert payloads from a JSONL or CSV file; '-' reads JSONL from stdin."""
+    if path.lower().endswith(".csv"):
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                yield row
+        return
+    f = sys.stdin if path == "-" else open(path)
+    try:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def parse(payload):
+    """(symbol, signal, price, candle_timestamp) for one alert, or None to skip it."""
+    if payload.get("message") == "Duplicate alert - Ignored":
+        return None  # An exported event the live app had already turned away
+    if not payload.get("timestamp") and payload.get("candle_timestamp"):
+        payload = dict(payload, timestamp=payload["candle_timestamp"])
+    return _parse(payload)
+
+def replay(alerts, reversal_mode=REVERSAL_MODE):
+    """Replay parsed alerts; {symbol: result} with each symbol's stats and trades."""
+    books = {}
+    for symbol, signal_type, price, candle_timestamp in alerts:
+        book = books.get(symbol)
+        if book is None:
+            book = books[symbol] = Book(symbol, reversal_mode)
+        book.apply(signal_type, price, candle_timestamp)
+    return {symbol: book.result() for symbol, book in books.items()}
+
+def wanted_alerts(payloads, wanted=None):
+    """Parsed alerts, optionally only those for the wanted symbols."""
+    return (alert for alert in map(parse, payloads) if alert is not None and (wanted is None or alert[0] in wanted))
+
+def _byte_ranges(path, count):
+    """Split a file into up to count line-aligned (start, end) byte ranges."""
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, "rb") as f:
+        for i in range(1, count):
+            f.seek(size * i // count)
+            f.readline()
+            bounds.append(max(f.tell(), bounds[-1]))
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+def _group_range(job):
+    path, start, end, wanted = job
+    with open(path, "rb") as f:
+        f.seek(start)
+        lines = f.read(end - start).decode().splitlines()
+    return _group(wanted_alerts((json.loads(line) for line in lines if line.strip()), wanted))
+
+def _group(alerts):
+    by_symbol = defaultdict(list)
+    for symbol, signal_type, price, candle_timestamp in alerts:
+        by_symbol[symbol].append((signal_type, price, candle_timestamp))
+    return by_symbol
+
+def _replay_symbol(job):
+    symbol, alerts, reversal_mode = job
+    return symbol, replay(((symbol,) + alert for alert in alerts), reversal_mode)[symbol]
+
+def replay_parallel(path, reversal_mode=REVERSAL_MODE, workers=None, wanted=None):
+    """replay() of a file over worker processes; same results, all alerts are held in memory."""
+    workers = workers or os.cpu_count()
+    with multiprocessing.Pool(workers) as pool:
+        if path.lower().endswith(".csv") or path == "-":
+            by_symbol = _group(wanted_alerts(read_alerts(path), wanted))  # CSV rows may span lines
+        else:
+            # Ranges come back in file order, so each symbol's alerts keep their order
+            by_symbol = defaultdict(list)
+            ranges = _byte_ranges(path, workers * 4)
+            for part in pool.imap(_group_range, [(path, start, end, wanted) for start, end in ranges]):
+                for symbol, alerts in part.items():
+                    by_symbol[symbol].extend(alerts)
+        jobs = [(symbol, alerts, reversal_mode) for symbol, alerts in by_symbol.items()]
+        return dict(pool.imap_unordered(_replay_symbol, jobs, chunksize=max(len(jobs) // (workers * 4), 1)))
+
+def summarize(results):
+    totals = defaultdict(float)
+    for result in results.values():
+        for key in ("alerts", "success", "ignored", "flips", "errors", "trades", "wins", "losses", "pnl"):
+            totals[key] += result["stats"][key]
+    summary = {key: int(value) if key != "pnl" else round(value, 6) for key, value in totals.items()}
+    summary["symbols"] = len(results)
+    decided = summary.get("wins", 0) + summary.get("losses", 0)
+    summary["win_rate"] = round(summary["wins"] / decided, 4) if decided else None
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="JSONL or CSV alert file ('-' for JSONL on stdin)")
+    parser.add_argument("--reversal-mode", choices=REVERSAL_MODES, default=REVERSAL_MODE)
+    parser.add_argument("--symbols", help="Comma separated symbols to replay; default all")
+    parser.add_argument("--workers", type=int, default=1, help="Processes to spread symbols over (0 = one per CPU)")
+    parser.add_argument("--output", help="Write stats and every trade to this file as JSON")
+    args = parser.parse_args()
+
+    wanted = {signals.canonical_symbol(s) for s in args.symbols.split(",")} if args.symbols else None
+    start = time.perf_counter()
+    if args.workers == 1:
+        results = replay(wanted_alerts(read_alerts(args.path), wanted), args.reversal_mode)
+    else:
+        results = replay_parallel(args.path, args.reversal_mode, args.workers or None, wanted)
+    elapsed = time.perf_counter() - start
+
+    summary = dict(summarize(results), reversal_mode=args.reversal_mode, elapsed_s=round(elapsed, 3))
+    summary["alerts_per_s"] = round(summary.get("alerts", 0) / elapsed) if elapsed else None
+    print(json.dumps({"summary": summary, "symbols": {s: r["stats"] for s, r in sorted(results.items())}}, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"summary": summary, "symbols": dict(sorted(results.items()))}, f, indent=2, default=str)
+
+if __name__ == "__main__":
+    main()
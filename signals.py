@@ -0,0 +1,83 @@
+import os
+from enum import Enum
+
+# Signal grammar: every accepted spelling of an alert's signal (or a simplified
+# webhook's action) is expanded once, at import, into a dict from the raw text to
+# its canonical Signal. Handling a request is then a case fold and a dict lookup.
+
+class Signal(Enum):
+    ENTRY_LONG = "ENTRY_LONG"
+    ENTRY_SHORT = "ENTRY_SHORT"
+    EXIT_LONG = "EXIT_LONG"
+    EXIT_SHORT = "EXIT_SHORT"
+    EXIT = "EXIT"  # Close whatever is open
+
+    @property
+    def is_entry(self):
+        return self in (Signal.ENTRY_LONG, Signal.ENTRY_SHORT)
+
+    @property
+    def is_exit(self):
+        return not self.is_entry
+
+    @property
+    def side(self):
+        """LONG / SHORT for entries, None for exits (an exit closes either side)."""
+        return {Signal.ENTRY_LONG: "LONG", Signal.ENTRY_SHORT: "SHORT"}.get(self)
+
+ENTRY_WORDS = ("ENTRY", "ENTER", "OPEN")
+EXIT_WORDS = ("EXIT", "CLOSE", "FLAT", "SQUAREOFF", "SQUARE_OFF")
+SEPARATORS = ("_", " ", "-", "")
+# Bare words, as sent by the /webhook/<symbol>/<action> URLs and many TradingView strategies
+SHORTHANDS = {
+    "LONG": Signal.ENTRY_LONG, "BUY": Signal.ENTRY_LONG,
+    "SHORT": Signal.ENTRY_SHORT, "SELL": Signal.ENTRY_SHORT,
+}
+# Extra global aliases without a code change: SIGNAL_ALIASES="GO_LONG=ENTRY_LONG,STOP=EXIT"
+SIGNAL_ALIASES = os.getenv("SIGNAL_ALIASES", "")
+
+def normalize(raw):
+    return raw.strip().upper() if isinstance(raw, str) else None
+
+def _build_table():
+    table = {}
+    for side in ("LONG", "SHORT"):
+        for sep in SEPARATORS:
+            for word in ENTRY_WORDS:
+                table[f"{word}{sep}{side}"] = table[f"{side}{sep}{word}"] = Signal[f"ENTRY_{side}"]
+            for word in EXIT_WORDS:
+                table[f"{word}{sep}{side}"] = table[f"{side}{sep}{word}"] = Signal[f"EXIT_{side}"]
+    for word in EXIT_WORDS:
+        table[word] = Signal.EXIT
+    table.update(SHORTHANDS)
+    for pair in filter(None, (part.strip() for part in SIGNAL_ALIASES.split(","))):
+        alias, _, canonical = pair.partition("=")
+        table[normalize(alias)] = Signal[normalize(canonical)]
+    return table
+
+_table = _build_table()
+
+def resolve(raw, aliases=None):
+    """
+    Canonical Signal for a raw signal or action string, or None if it is not part of
+    the grammar. aliases is an instrument's own {normalized alias: Signal}, checked first.
+    """
+    key = normalize(raw)
+    if aliases:
+        found = aliases.get(key)
+        if found is not None:
+            return found
+    return _table.get(key)
+
+def parse_canonical(value):
+    """Signal for a canonical name (as stored in signal_aliases), or None."""
+    try:
+        return Signal[normalize(value)]
+    except KeyError:
+        return None
+
+def canonical_symbol(raw):
+    """Ticker without its exchange prefix: NSE:NIFTY -> NIFTY."""
+    if not isinstance(raw, str):
+        return raw
+    return raw.rpartition(":")[2].strip()
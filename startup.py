@@ -0,0 +1,38 @@
+import time
+import logging
+import threading
+
+# Where a worker's time goes between starting to import the app and serving its
+# first webhook, to see (and cut) time-to-first-webhook after a deploy. Import
+# this module first so the clock starts before everything else loads.
+_started = time.perf_counter()
+logger = logging.getLogger(__name__)
+_last_mark = _started
+_lock = threading.Lock()
+_phases = {}  # name -> seconds since the previous mark
+_timings = {"ready_s": None, "first_webhook_s": None}
+
+def mark(name):
+    """Close a startup phase: it took the time since the previous mark."""
+    global _last_mark
+    now = time.perf_counter()
+    _phases[name] = round(now - _last_mark, 4)
+    _last_mark = now
+
+def ready():
+    """The app is built; log how long it took and where the time went."""
+    _timings["ready_s"] = round(time.perf_counter() - _started, 4)
+    parts = ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in _phases.items())
+    logger.info(f"Worker ready in {_timings['ready_s'] * 1000:.0f}ms ({parts})")
+
+def first_webhook():
+    if _timings["first_webhook_s"] is not None:
+        return
+    with _lock:
+        if _timings["first_webhook_s"] is None:
+            _timings["first_webhook_s"] = round(time.perf_counter() - _started, 4)
+
+def stats():
+    data = dict(_timings)
+    data.update({f"{name}_s": seconds for name, seconds in _phases.items()})
+    return data
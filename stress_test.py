@@ -0,0 +1,133 @@
+"""
+Concurrency stress test for process_signal.
+
+Every symbol gets the same ENTRY and then the same EXIT alert delivered many times at
+once from a pool of threads, like a retry storm hitting several workers. With correct
+per-symbol serialization exactly one ENTRY and one EXIT per round place an order, and
+every symbol ends flat. Any extra order is a duplicate; a symbol left open is a lost update.
+
+    python stress_test.py                      # compare lock modes on a scratch SQLite DB
+    python stress_test.py --mode row --database-url postgresql://...
+
+Prints one JSON object per mode.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+def run(args):
+    # Configure before the app modules read their settings
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ["SIGNAL_LOCK_MODE"] = args.mode
+    os.environ["DISPATCH_MODE"] = "sync"
+    # The copies are identical alerts; keep dedupe out of the way so the locks are what gets tested
+    os.environ["DEDUPE_ENABLED"] = "false"
+
+    from database import SessionLocal, Base, engine, Instrument, TradeState, OutboundJob
+    from logic import process_signal
+    import dispatcher
+    import cache
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    cache.clear()
+    dispatcher.handler("quantman")(lambda payload: True)  # Count orders without calling out
+
+    symbols = [f"STRESS{i}" for i in range(args.symbols)]
+    db = SessionLocal()
+    for symbol in symbols:
+        db.add(Instrument(symbol=symbol, timeframe="1m", quantman_buy_url="http://broker.invalid/buy",
+                          quantman_close_url="http://broker.invalid/close"))
+    db.commit()
+    db.close()
+
+    outcomes = Counter()
+    outcomes_lock = threading.Lock()
+
+    def send(payload):
+        session = SessionLocal()
+        try:
+            status = process_signal(payload, session)["status"]
+        except Exception as e:
+            status = f"error: {type(e).__name__}"
+        finally:
+            session.close()
+        with outcomes_lock:
+            outcomes[status] += 1
+
+    start = time.perf_counter()
+    sent = 0
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        for round_no in range(args.rounds):
+            for signal, candle in (("ENTRY_LONG", f"R{round_no}-open"), ("EXIT_LONG", f"R{round_no}-close")):
+                batch = [
+                    {"symbol": symbol, "signal": signal, "price": "100", "timestamp": candle}
+                    for symbol in symbols for _ in range(args.duplicates)
+                ]
+                random.shuffle(batch)
+                list(pool.map(send, batch))
+                sent += len(batch)
+    elapsed = time.perf_counter() - start
+
+    db = SessionLocal()
+    orders = Counter(symbol for (symbol,) in db.query(OutboundJob.symbol).filter(OutboundJob.kind == "quantman"))
+    open_symbols = [state.symbol for state in db.query(TradeState).filter(TradeState.current_status != "NONE")]
+    db.close()
+
+    expected = 2 * args.rounds
+    return {
+        "mode": args.mode,
+        "database": engine.dialect.name,
+        "symbols": args.symbols,
+        "rounds": args.rounds,
+        "duplicates": args.duplicates,
+        "threads": args.threads,
+        "signals": sent,
+        "elapsed_s": round(elapsed, 3),
+        "signals_per_s": round(sent / elapsed, 1),
+        "outcomes": dict(outcomes),
+        "expected_orders": expected * len(symbols),
+        "orders": sum(orders.values()),
+        "duplicate_orders": sum(max(orders[s] - expected, 0) for s in symbols),
+        "missing_orders": sum(max(expected - orders[s], 0) for s in symbols),
+        "lost_updates": len(open_symbols),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["local", "row", "none"], help="Lock mode; default runs each applicable mode")
+    parser.add_argument("--database-url", help="Defaults to a scratch SQLite file")
+    parser.add_argument("--symbols", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--duplicates", type=int, default=8, help="Copies of each alert sent concurrently")
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    if not args.database_url:
+        args.database_url = "sqlite:///" + os.path.join(tempfile.gettempdir(), "stress_test.db")
+
+    if args.mode:
+        result = run(args)
+        print(json.dumps(result))
+        sys.exit(1 if result["duplicate_orders"] or result["missing_orders"] or result["lost_updates"] else 0)
+
+    # Each mode in its own interpreter, since the lock mode is fixed at import time
+    modes = ["row", "local", "none"] if args.database_url.startswith("postgres") else ["local", "none"]
+    failed = False
+    for mode in modes:
+        cmd = [sys.executable, __file__, "--mode", mode, "--database-url", args.database_url,
+               "--symbols", str(args.symbols), "--rounds", str(args.rounds),
+               "--duplicates", str(args.duplicates), "--threads", str(args.threads)]
+        failed |= subprocess.call(cmd) != 0
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
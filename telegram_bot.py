@@ -1,6 +1,9 @@
 import requests
 import os
+import time
 import logging
+import threading
+import http_client
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -9,27 +12,125 @@ logger = logging.getLogger(__name__)
 # Constants (Should be set in environment variables)
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org").rstrip("/")  # override for local stand-ins
+TELEGRAM_TIMEOUT = float(os.getenv("TELEGRAM_TIMEOUT", "10"))
+TELEGRAM_MAX_LENGTH = 4096  # sendMessage text limit
 
-def send_telegram_message(message):
+# Bot API limits: about 30 messages/second overall and 1/second per chat. Sends wait
+# for a token instead of collecting 429s; a 429 that still happens pauses the bucket
+# for the retry_after Telegram asks for and the message is sent again.
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_CHAT_BURST = int(os.getenv("TELEGRAM_CHAT_BURST", "1"))
+TELEGRAM_RATE_LIMIT_RETRIES = int(os.getenv("TELEGRAM_RATE_LIMIT_RETRIES", "5"))
+
+class TokenBucket:
+    """Allows rate sends per second with bursts of up to capacity. Thread safe."""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token, returning how many seconds the caller must wait before using it."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.paused_until - now)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = min(self.tokens, 0)
+
+_global_bucket = TokenBucket(TELEGRAM_GLOBAL_RATE, TELEGRAM_GLOBAL_RATE)
+_chat_buckets = {}
+_buckets_lock = threading.Lock()
+_counters = {"sent": 0, "failed": 0, "rate_limited": 0, "throttle_wait_s": 0.0}
+
+class TelegramUnavailable(Exception):
+    """The send may succeed if repeated: Telegram was unreachable, erroring (5xx) or still rate limiting."""
+
+def _chat_bucket(chat_id):
+    with _buckets_lock:
+        if chat_id not in _chat_buckets:
+            _chat_buckets[chat_id] = TokenBucket(TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST)
+        return _chat_buckets[chat_id]
+
+def _throttle(chat_id):
+    wait = max(_global_bucket.reserve(), _chat_bucket(chat_id).reserve())
+    if wait > 0:
+        with _buckets_lock:
+            _counters["throttle_wait_s"] += wait
+        time.sleep(wait)
+
+def send_telegram_message(message, chat_id=None):
     """
-    Sends a message to the configured Telegram chat.
+    Sends a message to the configured Telegram chat. Returns False when Telegram
+    turned the message down for good (a 4xx such as malformed HTML) and raises
+    TelegramUnavailable when sending it again later may work.
     """
-    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
+    chat_id = chat_id or TELEGRAM_CHAT_ID
+    if not TELEGRAM_BOT_TOKEN or not chat_id:
         logger.warning("Telegram Bot Token or Chat ID not found in environment variables.")
         return False
 
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
+    url = f"{TELEGRAM_API_URL}/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
     payload = {
-        "chat_id": TELEGRAM_CHAT_ID,
+        "chat_id": chat_id,
         "text": message,
         "parse_mode": "HTML"
     }
 
+    for attempt in range(TELEGRAM_RATE_LIMIT_RETRIES + 1):
+        _throttle(chat_id)
+        try:
+            response = http_client.post(url, json=payload, timeout=TELEGRAM_TIMEOUT)
+            if response.status_code == 429:
+                retry_after = _retry_after(response)
+                logger.warning(f"Telegram rate limited chat {chat_id}, retrying after {retry_after}s")
+                _chat_bucket(chat_id).pause(retry_after)
+                _global_bucket.pause(retry_after)
+                with _buckets_lock:
+                    _counters["rate_limited"] += 1
+                continue
+            response.raise_for_status()
+            logger.info(f"Telegram message sent: {message[:50]}...")
+            with _buckets_lock:
+                _counters["sent"] += 1
+            return True
+        except requests.exceptions.HTTPError as e:
+            with _buckets_lock:
+                _counters["failed"] += 1
+            if e.response is not None and e.response.status_code < 500:
+                logger.error(f"Telegram rejected message: {e}")
+                return False
+            logger.warning(f"Telegram send failed, may be retried: {e}")
+            raise TelegramUnavailable(str(e))
+        except requests.exceptions.RequestException as e:
+            with _buckets_lock:
+                _counters["failed"] += 1
+            logger.warning(f"Failed to send Telegram message, may be retried: {e}")
+            raise TelegramUnavailable(str(e))
+    with _buckets_lock:
+        _counters["failed"] += 1
+    raise TelegramUnavailable(f"Still rate limited after {TELEGRAM_RATE_LIMIT_RETRIES} retries")
+
+def _retry_after(response):
     try:
-        response = requests.post(url, json=payload, timeout=10)
-        response.raise_for_status()
-        logger.info(f"Telegram message sent: {message[:50]}...")
-        return True
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Failed to send Telegram message: {e}")
-        return False
+        return float(response.json().get("parameters", {}).get("retry_after", 1))
+    except (ValueError, AttributeError):
+        return float(response.headers.get("Retry-After", 1))
+
+def stats():
+    with _buckets_lock:
+        data = dict(_counters)
+        data["chats"] = len(_chat_buckets)
+    data["throttle_wait_s"] = round(data["throttle_wait_s"], 3)
+    return data
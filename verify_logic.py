@@ -1,11 +1,38 @@
 import os
+import json
+import asyncio
+import tempfile
 import unittest
+
+# Run outbound jobs inline so tests see their effects immediately
+os.environ.setdefault("DISPATCH_MODE", "sync")
+# A throwaway database (tearDown drops every table), never the tracked tradingview_alerts.db
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db"))
+
 from datetime import datetime
-from database import engine, SessionLocal, Base, Instrument, TradeState
-from logic import process_signal
+from database import engine, SessionLocal, async_session, Base, Instrument, TradeState, OutboundJob, SignalEvent, BrokerTarget, BrokerCall, SignalAlias, MarketHoliday, CacheInvalidation
+from logic import process_signal, process_signals_batch, process_signal_async
+import dispatcher
+import cache
+import dedupe
+import dashboard
+import event_log
+import metrics
+import logic
+import broker
+import signals
+import replay
+import migrations
+import inbox
+import market_hours
+import live
+from sqlalchemy.exc import OperationalError
+import requests
+import time
 
 # Mock Telegram to avoid actual network calls
 import telegram_bot
+real_send_telegram_message = telegram_bot.send_telegram_message
 def mock_send_message(msg):
     print(f"[MOCK TELEGRAM] {msg}")
     return True
@@ -16,6 +43,8 @@ class TestTradingLogic(unittest.TestCase):
         # Create in-memory DB for testing
         Base.metadata.create_all(bind=engine)
         self.db = SessionLocal()
+        cache.clear()  # Rows are recreated behind the cache's back for every test
+        dedupe.clear()
         
         # Add Instrument
         inst = Instrument(symbol="NIFTY", timeframe="15m")
@@ -78,5 +107,487 @@ class TestTradingLogic(unittest.TestCase):
         self.assertIn("Flip Entry Detected", res_flip['message'])
         print(f"Flip Test Result: {res_flip['message']}")
 
+    def test_outbound_jobs_committed_with_state(self):
+        print("\n--- TEST OUTBOUND DISPATCH ---")
+        inst = self.db.query(Instrument).filter(Instrument.symbol == "NIFTY").first()
+        inst.quantman_buy_url = "https://example.com/buy"
+        self.db.commit()
+
+        calls = []
+        original = dispatcher._handlers["quantman"]
+        dispatcher.handler("quantman")(lambda payload: calls.append(payload))
+        try:
+            payload = {
+                "symbol": "NIFTY",
+                "signal": "ENTRY_LONG",
+                "price": "19500",
+                "timestamp": "2023-10-27T10:00:00Z"
+            }
+            res = process_signal(payload, self.db)
+        finally:
+            dispatcher.handler("quantman")(original)
+
+        self.assertEqual(res['status'], 'success')
+        self.assertEqual(calls, [{"symbol": "NIFTY", "signal": "ENTRY_LONG", "targets": [
+            {"id": None, "action": "buy", "name": "quantman", "url": "https://example.com/buy", "timeout": None}]}])
+        jobs = self.db.query(OutboundJob).order_by(OutboundJob.id).all()
+        self.assertEqual([job.kind for job in jobs], ["quantman", "telegram"])  # Orders go first
+        self.assertTrue(all(job.status == "DONE" for job in jobs))
+
+    def test_stale_cached_state_is_reloaded(self):
+        print("\n--- TEST STALE CACHE ---")
+        payload = {
+            "symbol": "NIFTY",
+            "signal": "ENTRY_LONG",
+            "price": "19500",
+            "timestamp": "2023-10-27T10:00:00Z"
+        }
+        self.assertEqual(process_signal(payload, self.db)['status'], 'success')
+
+        # Another worker closes the trade; this process still has LONG cached
+        other = SessionLocal()
+        other.query(TradeState).filter(TradeState.symbol == "NIFTY").update(
+            {"current_status": "NONE", "last_candle_timestamp": "2023-10-27T10:15:00Z"})
+        other.commit()
+        other.close()
+
+        payload['signal'] = "EXIT_LONG"
+        payload['timestamp'] = "2023-10-27T10:30:00Z"
+        res = process_signal(payload, self.db)
+        self.assertEqual(res['status'], 'ignored')
+        self.assertIn("No open trade", res['message'])
+
+        # Another worker opens a trade; an exit must not be ignored on the NONE still cached here
+        other = SessionLocal()
+        other.query(TradeState).filter(TradeState.symbol == "NIFTY").update(
+            {"current_status": "LONG", "last_candle_timestamp": "2023-10-27T10:45:00Z"})
+        other.commit()
+        other.close()
+        payload['timestamp'] = "2023-10-27T11:00:00Z"
+        self.assertEqual(process_signal(payload, self.db)['message'], "Trade Closed")
+        payload['timestamp'] = "2023-10-27T11:15:00Z"
+        other = SessionLocal()
+        other.query(TradeState).filter(TradeState.symbol == "NIFTY").update(
+            {"current_status": "SHORT", "last_candle_timestamp": "2023-10-27T11:05:00Z"})
+        other.commit()
+        other.close()
+        self.assertEqual(process_signals_batch([dict(payload, signal="EXIT_SHORT")], self.db)[0]['message'], "Trade Closed")
+
+    def test_batch_applies_signals_in_candle_order(self):
+        print("\n--- TEST BATCH ---")
+        self.db.add_all([Instrument(symbol="BANKNIFTY", timeframe="15m"), Instrument(symbol="FINNIFTY", timeframe="15m")])
+        self.db.commit()
+
+        signals = [
+            {"symbol": "NIFTY", "signal": "EXIT_LONG", "price": "19600", "timestamp": "2023-10-27T10:15:00Z"},
+            {"symbol": "BANKNIFTY", "signal": "ENTRY_SHORT", "price": "44000", "timestamp": "2023-10-27T10:00:00Z"},
+            {"symbol": "NIFTY", "signal": "ENTRY_LONG", "price": "19500", "timestamp": "2023-10-27T10:00:00Z"},
+            {"symbol": "UNKNOWN", "signal": "ENTRY_LONG", "price": "1", "timestamp": "2023-10-27T10:00:00Z"},
+            {"symbol": "NIFTY", "signal": "ENTRY_SHORT"},
+            # Epoch timestamps: "999999999" sorts after "1000000000" as text
+            {"symbol": "FINNIFTY", "signal": "EXIT_LONG", "price": "2", "timestamp": "1000000000"},
+            {"symbol": "FINNIFTY", "signal": "ENTRY_LONG", "price": "1", "timestamp": "999999999"},
+        ]
+        results = process_signals_batch(signals, self.db)
+
+        self.assertEqual([r['status'] for r in results], ['success', 'success', 'success', 'ignored', 'error', 'success', 'success'])
+        self.assertIn("Trade Closed", results[0]['message'])
+        self.assertIn("Trade Closed", results[5]['message'])
+        states = {s.symbol: s.current_status for s in self.db.query(TradeState).all()}
+        self.assertEqual(states, {"NIFTY": "NONE", "BANKNIFTY": "SHORT", "FINNIFTY": "NONE"})
+        # Three Telegram messages, merged into one send
+        self.assertEqual(self.db.query(OutboundJob).filter(OutboundJob.kind == "telegram").count(), 1)
+
+    def test_duplicate_alert_rejected(self):
+        print("\n--- TEST DUPLICATE ALERT ---")
+        entry = {"symbol": "NIFTY", "signal": "ENTRY_LONG", "price": "19500", "timestamp": "2023-10-27T10:00:00Z"}
+        exit_ = {"symbol": "NIFTY", "signal": "EXIT_LONG", "price": "19600", "timestamp": "2023-10-27T10:15:00Z"}
+        later = {"symbol": "NIFTY", "signal": "ENTRY_LONG", "price": "19500", "timestamp": "2023-10-27T10:30:00Z"}
+        before = dedupe.stats()
+        self.assertEqual(process_signal(dict(entry), self.db)['status'], 'success')
+        self.assertEqual(process_signal(dict(exit_), self.db)['status'], 'success')
+
+        # Replayed EXIT->ENTRY pair: the ENTRY would otherwise open a new trade
+        dedupe.clear()  # Force the database index to answer, as in another worker
+        self.assertIn("Duplicate", process_signal(dict(exit_), self.db)['message'])
+        self.assertIn("Duplicate", process_signal(dict(entry), self.db)['message'])
+        self.assertIn("Duplicate", process_signal(dict(entry), self.db)['message'])  # From memory this time
+        # Other spellings of the same alert
+        self.assertIn("Duplicate", process_signal(dict(entry, symbol="NSE:NIFTY", signal="entry_long"), self.db)['message'])
+        self.assertEqual(process_signal(later, self.db)['status'], 'success')
+
+        after = dedupe.stats()
+        self.assertEqual(after['memory_hits'] - before['memory_hits'], 2)
+        self.assertEqual(after['db_hits'] - before['db_hits'], 2)
+
+    def test_dashboard_page_and_filters(self):
+        print("\n--- TEST DASHBOARD QUERY ---")
+        self.db.add_all([Instrument(symbol="BANKNIFTY", timeframe="5m"), Instrument(symbol="FINNIFTY", timeframe="15m")])
+        self.db.add(TradeState(symbol="FINNIFTY", current_status="SHORT"))
+        self.db.commit()
+
+        data = dashboard.load(self.db, page=1, per_page=2)
+        self.assertEqual(data['total'], 3)
+        self.assertEqual(data['pages'], 2)
+        self.assertEqual([i['symbol'] for i in data['instruments']], ["BANKNIFTY", "FINNIFTY"])
+
+        data = dashboard.load(self.db, status="NONE", timeframe="15m")
+        self.assertEqual([i['symbol'] for i in data['instruments']], ["NIFTY"])
+        data = dashboard.load(self.db, status="SHORT")
+        self.assertEqual([(i['symbol'], i['status']) for i in data['instruments']], [("FINNIFTY", "SHORT")])
+
+    def test_event_log_records_every_decision(self):
+        print("\n--- TEST EVENT LOG ---")
+        event_log.flush()  # Leftovers from earlier tests
+        self.db.query(SignalEvent).delete()
+        self.db.commit()
+
+        payload = {"symbol": "NIFTY", "signal": "ENTRY_LONG", "price": "19500", "timestamp": "2023-10-27T10:00:00Z"}
+        process_signal(dict(payload), self.db)
+        process_signal(dict(payload, signal="ENTRY_SHORT", timestamp="2023-10-27T10:00:00Z"), self.db)
+        process_signal({"symbol": "NIFTY"}, self.db)
+        self.assertEqual(self.db.query(SignalEvent).count(), 0)  # Still buffered
+
+        self.assertEqual(event_log.flush(), 3)
+        events = event_log.page(self.db, symbol="NIFTY")["events"]
+        self.assertEqual([e['status'] for e in events], ['error', 'ignored', 'success'])
+        self.assertEqual(events[1]['message'], "Flip Entry Detected - Ignored")
+
+    def test_metrics_count_outcomes_and_stages(self):
+        print("\n--- TEST METRICS ---")
+        def count(symbol, outcome):
+            return metrics.SIGNALS._values.get((symbol, outcome), 0)
+        before = {outcome: count("NIFTY", outcome) for outcome in ("success", "flip")}
+
+        payload = {"symbol": "NIFTY", "signal": "EXIT_LONG", "price": "19500", "timestamp": "2023-10-27T11:00:00Z"}
+        process_signal(dict(payload, signal="ENTRY_LONG", timestamp="2023-10-27T10:00:00Z"), self.db)
+        process_signal(dict(payload), self.db)
+        process_signal(dict(payload, signal="ENTRY_SHORT"), self.db)
+        self.assertEqual(count("NIFTY", "success") - before["success"], 2)
+        self.assertEqual(count("NIFTY", "flip") - before["flip"], 1)
+        process_signal(dict(payload, symbol="NSE:NIFTY", timestamp="2023-10-27T12:00:00Z"), self.db)  # Same instrument
+        process_signal(dict(payload, symbol="JUNK123"), self.db)
+
+        text = metrics.render()
+        self.assertIn('signals_total{symbol="NIFTY",outcome="flip"}', text)
+        self.assertIn('signals_total{symbol="untracked",outcome="ignored"}', text)
+        self.assertNotIn("JUNK123", text)
+        self.assertNotIn("NSE:NIFTY", text)
+        for stage in ("parse", "instrument_lookup", "state_lookup", "commit"):
+            self.assertIn(f'signal_stage_seconds_count{{stage="{stage}"}}', text)
+
+    def test_async_path_matches_sync(self):
+        print("\n--- TEST ASYNC PATH ---")
+        payload = {"symbol": "NIFTY", "signal": "ENTRY_LONG", "price": "19500", "timestamp": "2023-10-27T10:00:00Z"}
+
+        async def run():
+            async with async_session()() as db:
+                results = [
+                    await process_signal_async(dict(payload), db),
+                    await process_signal_async(dict(payload), db),
+                    await process_signal_async(dict(payload, signal="EXIT_LONG", timestamp="2023-10-27T10:15:00Z"), db),
+                    await process_signal_async(dict(payload, signal="ENTRY_SHORT", timestamp="2023-10-27T10:15:00Z"), db),
+                ]
+            await db.bind.dispose()
+            return results
+
+        results = asyncio.run(run())
+        self.assertEqual([r['message'] for r in results],
+                         ["Entered LONG", "Duplicate alert - Ignored", "Trade Closed", "Flip Entry Detected - Ignored"])
+        state = self.db.query(TradeState).filter_by(symbol="NIFTY").first()
+        self.assertEqual(state.current_status, "NONE")
+        self.assertEqual(self.db.query(OutboundJob).count(), 3)
+
+    def test_telegram_messages_sent_as_digest(self):
+        print("\n--- TEST TELEGRAM DIGEST ---")
+        sent = []
+        saved = (logic.send_telegram_message, logic.TELEGRAM_BOT_TOKEN, logic.TELEGRAM_CHAT_ID)
+        logic.send_telegram_message = lambda text: sent.append(text) or True
+        logic.TELEGRAM_BOT_TOKEN, logic.TELEGRAM_CHAT_ID = "token", "chat"
+        try:
+            jobs = [dispatcher.enqueue(self.db, s, "telegram", {"message": f"closed {s}"}) for s in ("A", "B", "C")]
+            dispatcher.commit(self.db, jobs)
+        finally:
+            logic.send_telegram_message, logic.TELEGRAM_BOT_TOKEN, logic.TELEGRAM_CHAT_ID = saved
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(sent[0].count("closed"), 3)
+        self.assertEqual({job.status for job in self.db.query(OutboundJob)}, {"DONE"})
+
+    def test_telegram_rejected_message_fails_alone(self):
+        print("\n--- TEST TELEGRAM REJECTED MESSAGE ---")
+        sent = []
+        def send(text):
+            if "<bad" in text:
+                return False  # Telegram's 400 for a message it cannot parse
+            return sent.append(text) or True
+        saved = (logic.send_telegram_message, logic.TELEGRAM_BOT_TOKEN, logic.TELEGRAM_CHAT_ID)
+        logic.send_telegram_message = send
+        logic.TELEGRAM_BOT_TOKEN, logic.TELEGRAM_CHAT_ID = "token", "chat"
+        try:
+            jobs = [dispatcher.enqueue(self.db, s, "telegram", {"message": text})
+                    for s, text in (("A", "closed A"), ("B", "price <bad"), ("C", "closed C"))]
+            dispatcher.commit(self.db, jobs)
+        finally:
+            logic.send_telegram_message, logic.TELEGRAM_BOT_TOKEN, logic.TELEGRAM_CHAT_ID = saved
+        self.assertEqual(sent, ["closed A", "closed C"])
+        statuses = {job.symbol: job.status for job in self.db.query(OutboundJob)}
+        self.assertEqual(statuses, {"A": "DONE", "B": "FAILED", "C": "DONE"})
+        self.assertIn("&lt;bad", logic._h("price <bad"))
+
+    def test_telegram_429_waits_and_resends(self):
+        print("\n--- TEST TELEGRAM 429 ---")
+        class Response:
+            def __init__(self, status_code, body):
+                self.status_code, self.body, self.headers = status_code, body, {}
+            def json(self):
+                return self.body
+            def raise_for_status(self):
+                pass
+        responses = [Response(429, {"ok": False, "parameters": {"retry_after": 0.05}}), Response(200, {"ok": True})]
+        saved = (telegram_bot.http_client.post, telegram_bot.TELEGRAM_BOT_TOKEN)
+        telegram_bot.http_client.post = lambda url, **kwargs: responses.pop(0)
+        telegram_bot.TELEGRAM_BOT_TOKEN = "token"
+        try:
+            start = datetime.utcnow()
+            self.assertTrue(real_send_telegram_message("hello", chat_id="429-chat"))
+            waited = (datetime.utcnow() - start).total_seconds()
+        finally:
+            telegram_bot.http_client.post, telegram_bot.TELEGRAM_BOT_TOKEN = saved
+        self.assertEqual(responses, [])
+        self.assertGreaterEqual(waited, 0.05)
+
+    def test_order_fans_out_to_all_targets(self):
+        print("\n--- TEST BROKER FAN-OUT ---")
+        inst = self.db.query(Instrument).filter(Instrument.symbol == "NIFTY").first()
+        inst.quantman_buy_url = "http://quantman/slow"
+        inst.targets.append(BrokerTarget(action="buy", name="acct-2", url="http://broker2/fast", timeout=1))
+        inst.targets.append(BrokerTarget(action="buy", name="acct-3", url="http://broker3/flaky"))
+        inst.targets.append(BrokerTarget(action="close", name="acct-2", url="http://broker2/close"))
+        self.db.commit()
+
+        class Response:
+            status_code, text = 200, "ok"
+        calls = []
+        def fake_get(url, timeout):
+            calls.append(url)
+            if url.endswith("/slow"):
+                time.sleep(0.3)
+            if url.endswith("/flaky") and calls.count(url) == 1:
+                raise requests.exceptions.ConnectionError("connection refused")
+            return Response()
+
+        saved = (broker.http_client.get, dispatcher.DISPATCH_BACKOFF_BASE)
+        broker.http_client.get, dispatcher.DISPATCH_BACKOFF_BASE = fake_get, 0.01
+        try:
+            start = time.perf_counter()
+            res = process_signal({"symbol": "NIFTY", "signal": "ENTRY_LONG", "price": "1", "timestamp": "T1"}, self.db)
+            elapsed = time.perf_counter() - start
+        finally:
+            broker.http_client.get, dispatcher.DISPATCH_BACKOFF_BASE = saved
+
+        self.assertEqual(res['status'], 'success')
+        self.assertLess(elapsed, 0.55)  # Concurrent: the slow target is not added to the others
+        # Only the unreachable target was called again
+        self.assertEqual(sorted(calls), ["http://broker2/fast", "http://broker3/flaky", "http://broker3/flaky", "http://quantman/slow"])
+        job = self.db.query(OutboundJob).filter(OutboundJob.kind == "quantman").one()
+        self.assertEqual((job.status, job.attempts), ("DONE", 2))
+        results = self.db.query(BrokerCall).order_by(BrokerCall.id).all()
+        self.assertEqual([(c.target, c.ok) for c in results][-1], ("acct-3", True))
+        self.assertEqual(len(results), 4)
+
+    def test_signal_grammar_and_aliases(self):
+        print("\n--- TEST SIGNAL GRAMMAR ---")
+        inst = self.db.query(Instrument).filter(Instrument.symbol == "NIFTY").first()
+        inst.aliases.append(SignalAlias(kind="symbol", alias="NIFTY1!"))
+        inst.aliases.append(SignalAlias(kind="signal", alias="GO_LONG", signal="ENTRY_LONG"))
+        self.db.commit()
+
+        # Exchange prefix, a symbol alias and a per-instrument signal alias all reach NIFTY
+        res = process_signal({"symbol": "NSE:NIFTY1!", "signal": "go_long", "price": "1", "timestamp": "T1"}, self.db)
+        self.assertEqual(res['message'], "Entered LONG")
+        res = process_signal({"symbol": "NSE:NIFTY", "signal": "Close Long", "price": "2", "timestamp": "T2"}, self.db)
+        self.assertEqual(res['message'], "Trade Closed")
+        self.assertEqual(self.db.query(TradeState).filter(TradeState.symbol == "NIFTY").one().current_status, "NONE")
+
+        res = process_signal({"symbol": "NIFTY", "signal": "MAYBE_LONG", "price": "3", "timestamp": "T3"}, self.db)
+        self.assertEqual(res['message'], "Unknown Signal Type")
+        self.assertEqual(signals.resolve("sell"), signals.Signal.ENTRY_SHORT)
+        self.assertIsNone(signals.resolve("go_long"))  # Only NIFTY knows that one
+
+    def test_reversal_closes_then_enters(self):
+        print("\n--- TEST REVERSAL ---")
+        inst = self.db.query(Instrument).filter(Instrument.symbol == "NIFTY").first()
+        inst.quantman_buy_url, inst.quantman_sell_url, inst.quantman_close_url = "http://q/buy", "http://q/sell", "http://q/close"
+        self.db.commit()
+
+        class Response:
+            status_code, text = 200, "ok"
+        calls = []
+        saved = broker.http_client.get
+        broker.http_client.get = lambda url, timeout: calls.append(url) or Response()
+        try:
+            process_signal({"symbol": "NIFTY", "signal": "ENTRY_LONG", "price": "1", "timestamp": "T1"}, self.db)
+            res = process_signal({"symbol": "NIFTY", "signal": "ENTRY_SHORT", "price": "2", "timestamp": "T2"}, self.db)
+        finally:
+            broker.http_client.get = saved
+
+        self.assertEqual(res['message'], "Reversed LONG to SHORT")
+        self.assertEqual(calls, ["http://q/buy", "http://q/close", "http://q/sell"])
+        self.assertEqual(self.db.query(TradeState).filter(TradeState.symbol == "NIFTY").one().current_status, "SHORT")
+        # One order job and one message for the reversal
+        jobs = self.db.query(OutboundJob).filter(OutboundJob.id > 2).all()
+        self.assertEqual(sorted(job.kind for job in jobs), ["quantman", "telegram"])
+        self.assertIn("TRADE REVERSED", json.loads([job for job in jobs if job.kind == "telegram"][0].payload)["message"])
+
+        inst.reversal_mode = "ignore"
+        cache.invalidate("NIFTY", self.db)
+        self.db.commit()
+        res = process_signal({"symbol": "NIFTY", "signal": "ENTRY_LONG", "price": "3", "timestamp": "T3"}, self.db)
+        self.assertEqual(res['status'], "ignored")
+
+    def test_replay_builds_trades_offline(self):
+        print("\n--- TEST REPLAY ---")
+        alerts = [
+            {"symbol": "NSE:NIFTY", "signal": "ENTRY_LONG", "price": "100", "timestamp": "C1"},
+            {"symbol": "NIFTY", "signal": "ENTRY_SHORT", "price": "110", "timestamp": "C2"},  # Reversal: +10
+            {"symbol": "NIFTY", "signal": "EXIT_SHORT", "price": "105", "timestamp": "C3"},  # +5
+            {"symbol": "NIFTY", "signal": "ENTRY_LONG", "price": "105", "timestamp": "C3"},  # Flip, ignored
+            {"symbol": "BANKNIFTY", "signal": "BUY", "price": "50", "timestamp": "C1"},
+        ]
+        results = replay.replay(replay.wanted_alerts(alerts))
+        nifty = results["NIFTY"]
+        self.assertEqual([(t["side"], t["pnl"]) for t in nifty["trades"]], [("LONG", 10.0), ("SHORT", 5.0)])
+        self.assertEqual((nifty["stats"]["flips"], nifty["stats"]["wins"], nifty["stats"]["pnl"]), (1, 2, 15.0))
+        self.assertEqual(results["BANKNIFTY"]["open_trade"]["side"], "LONG")
+        # Nothing touched the database or the dispatcher
+        self.assertEqual(self.db.query(TradeState).count(), 0)
+        self.assertEqual(self.db.query(OutboundJob).count(), 0)
+
+    def test_migrations_are_versioned_and_idempotent(self):
+        print("\n--- TEST MIGRATIONS ---")
+        try:
+            self.assertEqual(migrations.current_version(), 0)
+            self.assertEqual(migrations.upgrade(), [version for version, _, _ in migrations.MIGRATIONS])
+            self.assertEqual(migrations.upgrade(), [])  # Second deploy: nothing to do
+            self.assertEqual(migrations.current_version(), migrations.latest_version())
+            # Existing rows survived, the schema is usable
+            self.assertEqual(self.db.query(Instrument).filter(Instrument.symbol == "NIFTY").one().reversal_mode, None)
+        finally:
+            migrations.schema_migrations.drop(bind=engine, checkfirst=True)
+
+    def test_inbox_replays_queued_alerts_in_order(self):
+        print("\n--- TEST INBOX ---")
+        saved_path = inbox.INBOX_PATH
+        inbox.close()
+        inbox.INBOX_PATH = os.path.join(tempfile.mkdtemp(), "inbox.db")
+        try:
+            alerts = [{"symbol": "NIFTY", "signal": "ENTRY_LONG", "price": "1", "timestamp": "T1"},
+                      {"symbol": "NIFTY", "signal": "EXIT_LONG", "price": "2", "timestamp": "T2"}]
+            for alert in alerts:
+                self.assertTrue(inbox.defer(inbox.append(alert)))  # Database was down
+            self.assertTrue(inbox.backlog())
+
+            def down(payload):
+                raise OperationalError("SELECT 1", {}, Exception("connection refused"))
+            self.assertEqual(inbox.replay(down), 0)  # Still down: nothing lost
+            self.assertEqual(inbox.stats()["backlog"], 2)
+
+            self.assertEqual(inbox.replay(lambda payload: process_signal(payload, self.db)), 2)
+            self.assertFalse(inbox.backlog())
+            self.assertEqual(inbox.stats()["entries"], 0)
+            state = self.db.query(TradeState).filter(TradeState.symbol == "NIFTY").one()
+            self.assertEqual((state.current_status, state.last_candle_timestamp), ("NONE", "T2"))
+
+            # In flight elsewhere: a live process's entry is left alone, a dead one's is replayed
+            live_owner = open(inbox._owner_path("live"), "a")
+            inbox.fcntl.flock(live_owner, inbox.fcntl.LOCK_SH)
+            for owner, timestamp in (("live", "T3"), ("dead", "T4")):
+                inbox._connect().execute("INSERT INTO inbox (received_at, state, payload, owner) VALUES (?, 'inflight', ?, ?)",
+                                         (time.time() - 1, json.dumps(dict(alerts[0], timestamp=timestamp)), owner))
+            replayed = []
+            self.assertEqual(inbox.replay(replayed.append), 1)
+            live_owner.close()  # The process exits
+            self.assertEqual(inbox.replay(replayed.append), 1)
+            self.assertEqual([payload["timestamp"] for payload in replayed], ["T4", "T3"])
+        finally:
+            inbox.close()
+            inbox.INBOX_PATH = saved_path
+
+    def test_cache_sync_picks_up_late_commits_and_bounds_unknowns(self):
+        print("\n--- TEST CACHE SYNC ---")
+        saved = cache._last_seen_id, dict(cache._gaps), cache.CACHE_MAX_UNKNOWN
+        try:
+            cache._last_seen_id, cache._gaps = 0, {}
+            self.db.add_all([CacheInvalidation(id=1, symbol="A", origin="other"), CacheInvalidation(id=3, symbol="B", origin="other")])
+            self.db.commit()
+            cache.sync()
+            self.assertEqual((cache._last_seen_id, list(cache._gaps)), (3, [2]))
+            # Id 2 was handed out first but commits last: still applied
+            cache.get_instrument(self.db, "NIFTY")
+            self.db.add(CacheInvalidation(id=2, symbol="NIFTY", origin="other"))
+            self.db.commit()
+            cache.sync()
+            self.assertEqual(cache._gaps, {})
+            self.assertNotIn("NIFTY", cache._instruments)
+
+            cache.CACHE_MAX_UNKNOWN = 2
+            cache.get_instruments(self.db, ["JUNK1", "JUNK2", "JUNK3"])
+            self.assertEqual(list(cache._unknown), ["JUNK2", "JUNK3"])
+            self.assertNotIn("JUNK1", cache._instruments)
+        finally:
+            cache._last_seen_id, cache._gaps, cache.CACHE_MAX_UNKNOWN = saved
+
+    def test_live_stream_pushes_state_changes(self):
+        print("\n--- TEST LIVE STREAM ---")
+        subscriber = live.subscribe()
+        try:
+            process_signal({"symbol": "NIFTY", "signal": "ENTRY_LONG", "price": "100", "timestamp": "T1"}, self.db)
+            process_signal({"symbol": "NIFTY", "signal": "EXIT_LONG", "price": "101", "timestamp": "T2"}, self.db)
+            chunk = subscriber.next_chunk(timeout=0)
+            # Only the latest state of a symbol is waiting to be sent
+            self.assertEqual(chunk.count("event: state"), 1)
+            data = json.loads(chunk.split("data: ", 1)[1])
+            self.assertEqual((data["symbol"], data["status"], data["last_signal_price"]), ("NIFTY", "NONE", "101"))
+            self.assertEqual(subscriber.next_chunk(timeout=0), live.HEARTBEAT)
+        finally:
+            live.unsubscribe(subscriber)
+        self.assertEqual(live.stats()["clients"], 0)
+
+    def test_market_hours_defer_and_release(self):
+        print("\n--- TEST MARKET HOURS ---")
+        inst = self.db.query(Instrument).filter(Instrument.symbol == "NIFTY").one()
+        inst.market_session, inst.market_calendar, inst.off_session = "09:15-15:30", "NSE", "defer"
+        self.db.add(MarketHoliday(calendar="NSE", day=datetime(2026, 10, 19).date(), name="Test holiday"))
+        self.db.commit()
+        market_hours.reload()
+        try:
+            instrument = cache.get_instruments(self.db, ["NIFTY"])["NIFTY"]
+            ist = market_hours._tz
+            monday_8am = datetime(2026, 10, 19, 8, 0, tzinfo=ist).timestamp()
+            tuesday_open = datetime(2026, 10, 20, 9, 15, tzinfo=ist).timestamp()
+            tuesday_noon = datetime(2026, 10, 20, 12, 0, tzinfo=ist).timestamp()
+            self.assertEqual(market_hours.gate(instrument, now=tuesday_noon), ("open", None))
+            # Monday is a holiday, so the next open is Tuesday's
+            self.assertEqual(market_hours.gate(instrument, now=monday_8am), ("defer", tuesday_open))
+
+            payload = {"symbol": "NIFTY", "signal": "ENTRY_LONG", "price": "100", "timestamp": "T1"}
+            self.db.add(market_hours.deferral("NIFTY", payload, tuesday_open, now=monday_8am))
+            self.db.add(market_hours.deferral("NIFTY", dict(payload, timestamp="T0"), monday_8am, now=monday_8am - market_hours.MARKET_DEFER_TTL - 1))
+            self.db.commit()
+            self.assertEqual(market_hours.release_due(process_signals_batch, now=tuesday_open - 1), 1)  # Only the expired one
+            self.assertIsNone(self.db.query(TradeState).filter(TradeState.symbol == "NIFTY").first())
+            self.assertEqual(market_hours.release_due(process_signals_batch, now=tuesday_open), 1)
+            self.db.expire_all()
+            state = self.db.query(TradeState).filter(TradeState.symbol == "NIFTY").one()
+            self.assertEqual((state.current_status, state.last_candle_timestamp), ("LONG", "T1"))
+            self.assertEqual(market_hours.release_due(process_signals_batch, now=tuesday_noon), 0)
+
+            instrument.off_session = "drop"
+            self.assertEqual(market_hours.gate(instrument, now=monday_8am), ("drop", None))
+        finally:
+            self.db.query(MarketHoliday).delete()
+            self.db.commit()
+            market_hours.reload()
+
 if __name__ == '__main__':
     unittest.main()